@@ -0,0 +1,224 @@
+"""
+Batch construction for the NLLB translators.
+
+Inputs are sorted by tokenized length and grouped so that the padded size of
+each batch (longest item x number of items) stays under a token budget. Short
+headwords then travel together in large batches instead of being padded up to
+the length of whatever long definition happened to sit next to them in the file.
+
+With a BatchSizer the token budget is not fixed: it is set from a memory
+budget and the memory each padded source token was seen to cost, grows while
+batches fit comfortably, and a batch that runs out of memory is split in half
+and retried instead of ending the run.
+"""
+
+import gc
+
+from instrumentation import metrics, available_memory_mb, peak_rss_mb, reset_peak_rss, rss_mb
+
+MAX_BATCH_TOKENS = 4096
+MAX_BATCH_ITEMS = 64
+
+# adaptive sizing
+MEMORY_FRACTION = 0.7     # of the memory available at start that batches may use
+MIN_BATCH_TOKENS = 64
+MAX_GROWTH = 8            # the budget never grows past this multiple of the starting one
+GROWTH = 1.25             # per step, after GROW_AFTER batches in a row fit
+GROW_AFTER = 4
+OOM_MARKERS = ("out of memory", "can't allocate memory", "bad_alloc", "failed to allocate")
+
+
+def token_lengths(texts, tokenizer, max_length=512):
+    """tokenized length of each text, as the model will see it (max_length=None: in full)"""
+    with metrics.stage("measure_lengths"):
+        encoded = tokenizer(list(texts), truncation=max_length is not None, max_length=max_length)
+    return [len(ids) for ids in encoded["input_ids"]]
+
+
+def token_budget_batches(lengths, max_tokens=MAX_BATCH_TOKENS, max_items=MAX_BATCH_ITEMS):
+    """
+    Group item indices into batches of similar length.
+
+    Longest items come first so a batch that does not fit in memory fails at
+    the start of a run rather than hours in. A single item longer than the
+    budget still gets a batch of its own.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+
+    batches = []
+    current = []
+    longest = 0
+    for i in order:
+        width = max(longest, lengths[i])
+        full = max_items and len(current) >= max_items
+        if current and (full or width * (len(current) + 1) > max_tokens):
+            batches.append(current)
+            current = []
+            width = lengths[i]
+        current.append(i)
+        longest = width
+
+    if current:
+        batches.append(current)
+    return batches
+
+
+def is_out_of_memory(error):
+    """torch (CPU and CUDA) and CTranslate2 allocation failures"""
+    if isinstance(error, MemoryError) or type(error).__name__ == "OutOfMemoryError":
+        return True
+    return isinstance(error, RuntimeError) and any(m in str(error).lower() for m in OOM_MARKERS)
+
+
+class BatchSizer:
+    """
+    Token budget for the next batch, learned from the memory batches use.
+
+    Each batch's memory high-water mark above what was resident before it
+    (process RSS on CPU, allocated memory on CUDA), divided by its padded
+    source tokens, is its cost per token under the current generation
+    settings; beams and max_length are in that number. The worst cost seen
+    so far sets how many tokens fit in the memory budget. The budget shrinks
+    at once when a batch shows it is too big, and grows by GROWTH after
+    GROW_AFTER batches in a row fit, up to that limit.
+
+    After an out-of-memory error the failed size becomes a hard ceiling and
+    the budget drops to half of it. One sizer should serve one set of
+    generation settings.
+    """
+
+    def __init__(self, max_tokens=MAX_BATCH_TOKENS, memory_budget_mb=None, device="cpu", torch=None, workers=1):
+        self.max_tokens = max_tokens
+        self.ceiling = max_tokens * MAX_GROWTH
+        self.cuda = str(device).startswith("cuda") and torch is not None
+        self.torch = torch
+        self.memory_budget_mb = memory_budget_mb or self._default_budget(workers)
+        self.cost_mb = None
+        self.fits = 0
+        self.out_of_memory = 0
+
+    @classmethod
+    def for_backend(cls, backend, max_tokens=MAX_BATCH_TOKENS, memory_budget_mb=None, workers=1):
+        return cls(max_tokens, memory_budget_mb, getattr(backend, "device", "cpu"),
+                   getattr(backend, "torch", None), workers)
+
+    def _default_budget(self, workers):
+        if self.cuda:
+            free, _ = self.torch.cuda.mem_get_info()
+            return free / (1024 * 1024) * MEMORY_FRACTION
+        available = available_memory_mb()
+        # unknown platform: fall back to the fixed budget and never grow
+        if available is None:
+            self.ceiling = self.max_tokens
+            return None
+        return available * MEMORY_FRACTION / max(workers, 1)
+
+    def _start(self):
+        if self.cuda:
+            self.torch.cuda.reset_peak_memory_stats()
+            return self.torch.cuda.memory_allocated() / (1024 * 1024)
+        reset_peak_rss()
+        return rss_mb()
+
+    def _peak(self):
+        if self.cuda:
+            return self.torch.cuda.max_memory_allocated() / (1024 * 1024)
+        peak = peak_rss_mb()
+        metrics.note_peak_rss(peak)  # the per-batch reset would hide it from the run report
+        return peak
+
+    def run(self, fn, padded_tokens):
+        """fn() under measurement; updates the budget from what it cost"""
+        before = self._start()
+        result = fn()
+        self._fit(padded_tokens, max(self._peak() - before, 0.0))
+        return result
+
+    def _fit(self, padded_tokens, used_mb):
+        if self.memory_budget_mb is None:
+            return
+        # small tail batches are dominated by fixed overhead
+        if padded_tokens >= self.max_tokens // 2:
+            cost = used_mb / padded_tokens
+            self.cost_mb = cost if self.cost_mb is None else max(self.cost_mb, cost)
+        if not self.cost_mb:
+            return
+
+        fit = min(int(self.memory_budget_mb / self.cost_mb), self.ceiling)
+        if fit < self.max_tokens:
+            self.max_tokens = max(MIN_BATCH_TOKENS, fit)
+            self.fits = 0
+            return
+        self.fits += 1
+        if self.fits >= GROW_AFTER and self.max_tokens < fit:
+            self.max_tokens = min(fit, int(self.max_tokens * GROWTH))
+            self.fits = 0
+
+    def failed(self, padded_tokens):
+        """a batch of padded_tokens ran out of memory"""
+        self.out_of_memory += 1
+        self.fits = 0
+        self.ceiling = max(MIN_BATCH_TOKENS, min(self.ceiling, padded_tokens - 1))
+        self.max_tokens = max(MIN_BATCH_TOKENS, min(self.max_tokens, padded_tokens // 2))
+        metrics.count("oom_retries")
+        gc.collect()
+        if self.cuda:
+            self.torch.cuda.empty_cache()
+
+
+def _adaptive_batches(order, lengths, sizer, max_items):
+    """length-sorted batches cut one at a time, each under the sizer's budget at that moment"""
+    start = 0
+    while start < len(order):
+        longest = lengths[order[start]]
+        end = start + 1
+        while (end < len(order) and not (max_items and end - start >= max_items)
+               and longest * (end - start + 1) <= sizer.max_tokens):
+            end += 1
+        yield order[start:end]
+        start = end
+
+
+def _run_halving(batch_texts, batch_lengths, translate_fn, sizer):
+    padded = max(batch_lengths) * len(batch_texts)
+    try:
+        return sizer.run(lambda: translate_fn(batch_texts), padded)
+    except Exception as e:
+        if not is_out_of_memory(e) or len(batch_texts) == 1:
+            raise
+        sizer.failed(padded)
+        print(f"Out of memory on a batch of {len(batch_texts)} ({padded} tokens); "
+              f"retrying in halves, budget now {sizer.max_tokens} tokens")
+    mid = len(batch_texts) // 2
+    return (_run_halving(batch_texts[:mid], batch_lengths[:mid], translate_fn, sizer)
+            + _run_halving(batch_texts[mid:], batch_lengths[mid:], translate_fn, sizer))
+
+
+def run_batched(texts, lengths, translate_fn, max_tokens=MAX_BATCH_TOKENS,
+                max_items=MAX_BATCH_ITEMS, progress=None, on_batch=None, sizer=None):
+    """
+    Call translate_fn on length-sorted batches and return results in the
+    original order. progress, if given, wraps the batch list (e.g. tqdm);
+    on_batch(batch_texts, outputs) is called as each batch finishes.
+    With a sizer, its adaptive budget replaces max_tokens.
+    """
+    results = [None] * len(texts)
+    if sizer is not None:
+        order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+        batches = _adaptive_batches(order, lengths, sizer, max_items)
+    else:
+        batches = token_budget_batches(lengths, max_tokens, max_items)
+
+    for batch in (progress(batches) if progress else batches):
+        batch_texts = [texts[i] for i in batch]
+        with metrics.stage("translate_batch"):
+            if sizer is not None:
+                outputs = _run_halving(batch_texts, [lengths[i] for i in batch], translate_fn, sizer)
+            else:
+                outputs = translate_fn(batch_texts)
+        for i, out in zip(batch, outputs):
+            results[i] = out
+        if on_batch is not None:
+            on_batch(batch_texts, outputs)
+
+    return results
@@ -0,0 +1,431 @@
+#!/usr/bin/env python3
+"""
+Offline throughput benchmark for the NLLB translation paths.
+
+Runs a fixed corpus (benchmarks/corpus.json, sampled once from dictionary.json
+and the essays) through the three entry points the scripts use:
+
+  essay       translate-essay.py  Translator.translate   (en -> hi)
+  dictionary  translate_dictionary.translate_batch       (te -> en)
+  single      fix_repetitions.translate_single           (te -> en, one at a time)
+
+for every combination of --backends, --beams and --batch-sizes, and reports
+source/output tokens per second, per-batch latency percentiles, peak RSS and
+model load time. Results are saved as JSON so two commits can be compared
+with --compare.
+
+Everything runs on CPU with the Hugging Face hub in offline mode. If the NLLB
+weights are not in the local cache, a tiny randomly initialised M2M100 model
+with a character tokenizer is generated under ~/.cache/ayamatma/ and used as a
+stand-in: its translations are noise, but batching, padding, beam search and
+the script-side overhead are exercised the same way.
+
+Usage:
+  python scripts/benchmark.py [--backends hf,ct2] [--beams 1,4] [--batch-sizes 8,32,64]
+  python scripts/benchmark.py --compare benchmarks/results/OLD.json benchmarks/results/NEW.json
+  python scripts/benchmark.py --build-corpus
+"""
+
+import os
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import platform
+import subprocess
+import importlib.util
+from contextlib import contextmanager
+
+import mdx
+from instrumentation import peak_rss_mb, reset_peak_rss
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, '..')
+BENCH_DIR = os.path.join(HERE, 'benchmarks')
+CORPUS_FILE = os.path.join(BENCH_DIR, 'corpus.json')
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+DICTIONARY_FILE = os.path.join(ROOT, 'src', 'data', 'dictionary.json')
+ESSAYS_DIR = os.path.join(ROOT, 'src', 'content', 'essays')
+
+TINY_MODEL_DIR = os.path.join(os.path.expanduser("~"), ".cache", "ayamatma", "tiny-seq2seq")
+TINY_MAX_LENGTH = 128  # a random model never emits </s>, so cap what it decodes
+
+CORPUS_SEED = 20260101
+CORPUS_DICTIONARY = 120
+CORPUS_ESSAY = 80
+TARGETS = ("essay", "dictionary", "single")
+LANG_TOKENS = ["eng_Latn", "hin_Deva", "tel_Telu"]
+
+
+def load_script(filename, module_name):
+    """import a script whose file name is not a valid module name"""
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(HERE, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# --- corpus -----------------------------------------------------------------
+
+def build_corpus(path=CORPUS_FILE):
+    """sample the fixed corpus; rerun only when the corpus should change"""
+    rng = random.Random(CORPUS_SEED)
+
+    with open(DICTIONARY_FILE, 'r', encoding='utf-8') as f:
+        entries = json.load(f)['entries']
+    telugu = sorted({e['telugu'] for e in entries if e.get('telugu')})
+
+    segments = []
+    for name in sorted(os.listdir(ESSAYS_DIR)):
+        if not name.endswith('.en.mdx'):
+            continue
+        with open(os.path.join(ESSAYS_DIR, name), 'r', encoding='utf-8') as f:
+            segments.extend(text for _, text in mdx.segments(mdx.tokenize(f.read())))
+    segments = sorted(set(segments))
+
+    corpus = {
+        'dictionary': rng.sample(telugu, min(CORPUS_DICTIONARY, len(telugu))),
+        'essay': rng.sample(segments, min(CORPUS_ESSAY, len(segments))),
+    }
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(corpus, f, ensure_ascii=False, indent=2)
+    print(f"Wrote {len(corpus['dictionary'])} dictionary and {len(corpus['essay'])} essay segments to {path}")
+
+
+def load_corpus(path=CORPUS_FILE):
+    with open(path, 'rb') as f:
+        raw = f.read()
+    return json.loads(raw), hashlib.sha256(raw).hexdigest()[:12]
+
+
+# --- stand-in model ---------------------------------------------------------
+
+def nllb_cached(model_name):
+    if os.path.isdir(model_name):
+        return True
+    try:
+        from huggingface_hub import try_to_load_from_cache
+    except ImportError:
+        return False
+    return isinstance(try_to_load_from_cache(model_name, "config.json"), str)
+
+
+def make_tiny_model(texts, path=TINY_MODEL_DIR):
+    """a 2+2 layer, d_model 64 M2M100 with a character tokenizer, built from texts"""
+    if os.path.exists(os.path.join(path, "config.json")):
+        return path
+
+    import torch
+    from tokenizers import Regex, Tokenizer, decoders, models, pre_tokenizers, processors
+    from transformers import M2M100Config, M2M100ForConditionalGeneration, PreTrainedTokenizerFast
+
+    print(f"Generating stand-in model in {path}...")
+    specials = ["<s>", "<pad>", "</s>", "<unk>"] + LANG_TOKENS
+    chars = sorted({c for text in texts for c in text} - set(specials))
+    vocab = {token: i for i, token in enumerate(specials + chars)}
+
+    tok = Tokenizer(models.WordLevel(vocab, unk_token="<unk>"))
+    tok.pre_tokenizer = pre_tokenizers.Split(Regex(r"[\s\S]"), behavior="isolated")
+    tok.decoder = decoders.Fuse()
+    tok.post_processor = processors.TemplateProcessing(single="$A </s>", special_tokens=[("</s>", vocab["</s>"])])
+    tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=tok, bos_token="<s>", pad_token="<pad>", eos_token="</s>",
+        unk_token="<unk>", additional_special_tokens=LANG_TOKENS,
+    )
+
+    config = M2M100Config(
+        vocab_size=len(vocab), d_model=64,
+        encoder_layers=2, decoder_layers=2,
+        encoder_attention_heads=4, decoder_attention_heads=4,
+        encoder_ffn_dim=128, decoder_ffn_dim=128,
+        max_position_embeddings=1024,
+        pad_token_id=vocab["<pad>"], bos_token_id=vocab["<s>"],
+        eos_token_id=vocab["</s>"], decoder_start_token_id=vocab["</s>"],
+    )
+    torch.manual_seed(0)
+    model = M2M100ForConditionalGeneration(config)
+
+    os.makedirs(path, exist_ok=True)
+    tokenizer.save_pretrained(path)
+    model.save_pretrained(path)
+    return path
+
+
+def ct2_dir_for(model_name):
+    """convert model_name for the ct2 backend on first use"""
+    from nllb_backends import convert, ct2_model_dir
+    model_dir = ct2_model_dir(model_name)
+    if not os.path.isdir(model_dir):
+        convert(model_name, model_dir)
+    return model_dir
+
+
+# --- measurement ------------------------------------------------------------
+
+def percentile(values, q):
+    """nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def to_ms(seconds):
+    """seconds -> rounded milliseconds; None (no batches were timed) stays None"""
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+def fmt_ms(value):
+    return "     n/a" if value is None else f"{value:7.1f}"
+
+
+class TimedBackend:
+    """wraps a backend and records how long each generate call takes"""
+
+    def __init__(self, backend):
+        self._backend = backend
+        self.latencies = []
+
+    def __getattr__(self, name):
+        return getattr(self._backend, name)
+
+    def _timed(self, method, *args, **kwargs):
+        start = time.perf_counter()
+        result = method(*args, **kwargs)
+        self.latencies.append(time.perf_counter() - start)
+        return result
+
+    def generate(self, *args, **kwargs):
+        return self._timed(self._backend.generate, *args, **kwargs)
+
+    def generate_multi(self, *args, **kwargs):
+        return self._timed(self._backend.generate_multi, *args, **kwargs)
+
+
+@contextmanager
+def patched(target, **values):
+    """temporarily set dict keys (or module attributes) for one run; None leaves a value alone"""
+    is_dict = isinstance(target, dict)
+    values = {k: v for k, v in values.items() if v is not None}
+    old = {k: (target[k] if is_dict else getattr(target, k)) for k in values}
+    for k, v in values.items():
+        if is_dict:
+            target[k] = v
+        else:
+            setattr(target, k, v)
+    try:
+        yield
+    finally:
+        for k, v in old.items():
+            if is_dict:
+                target[k] = v
+            else:
+                setattr(target, k, v)
+
+
+# --- runs -------------------------------------------------------------------
+
+def run_target(target, backend, corpus, scripts, beams, batch_size, max_length):
+    essay, dictionary, fix = scripts
+    timed = TimedBackend(backend)
+
+    if target == "essay":
+        texts = corpus['essay']
+        translator = essay.Translator(memory=None, use_server=False)
+        translator.backend = timed
+        with patched(essay.GENERATION_KWARGS, num_beams=beams, max_length=max_length), \
+                patched(essay, MAX_BATCH_ITEMS=batch_size):
+            start = time.perf_counter()
+            outputs = translator.translate(texts, 'hi')
+    elif target == "dictionary":
+        texts = corpus['dictionary']
+        with patched(dictionary.generation_kwargs, num_beams=beams, max_length=max_length):
+            start = time.perf_counter()
+            # translate_batch without the tqdm bar
+            outputs = dictionary.translate_multi(texts, timed, "tel_Telu", ["eng_Latn"], batch_size, progress=False)["eng_Latn"]
+    else:
+        texts = corpus['dictionary']
+        with patched(fix.generation_kwargs, num_beams=beams, max_length=max_length):
+            start = time.perf_counter()
+            outputs = [fix.translate_single(text, timed, "tel_Telu", "eng_Latn") for text in texts]
+    seconds = time.perf_counter() - start
+
+    tokenizer = backend.tokenizer
+    src_tokens = sum(len(ids) for ids in tokenizer(texts)["input_ids"])
+    out_tokens = sum(len(ids) for ids in tokenizer(outputs)["input_ids"])
+    latencies = timed.latencies
+    return {
+        "segments": len(texts),
+        "batches": len(latencies),
+        "seconds": round(seconds, 3),
+        "src_tokens": src_tokens,
+        "out_tokens": out_tokens,
+        "src_tokens_per_sec": round(src_tokens / seconds, 1),
+        "out_tokens_per_sec": round(out_tokens / seconds, 1),
+        "segments_per_sec": round(len(texts) / seconds, 2),
+        # every segment may have been served without a generate call
+        "batch_latency_ms": {
+            f"p{q}": to_ms(percentile(latencies, q)) for q in (50, 90, 99)
+        } | {"max": to_ms(max(latencies, default=None))},
+    }
+
+
+def load_for_benchmark(name, model_name, device, threads):
+    from nllb_backends import load_backend
+    if name == "ct2":
+        return load_backend("ct2", model_name, model_dir=ct2_dir_for(model_name), threads=threads)
+    return load_backend("hf", model_name, device=device)
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=HERE,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_benchmark(args):
+    # fully offline: nothing may reach the hub, cached or generated weights only
+    os.environ["HF_HUB_OFFLINE"] = "1"
+    os.environ["TRANSFORMERS_OFFLINE"] = "1"
+
+    import torch
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    corpus, corpus_hash = load_corpus(args.corpus)
+    scripts = (
+        load_script('translate-essay.py', 'translate_essay'),
+        load_script('translate_dictionary.py', 'translate_dictionary'),
+        load_script('fix_repetitions.py', 'fix_repetitions'),
+    )
+
+    from nllb_backends import MODEL_NAME
+    model_name = args.model or MODEL_NAME
+    stand_in = not nllb_cached(model_name)
+    if stand_in:
+        print(f"{model_name} is not in the local cache; using a tiny stand-in model")
+        model_name = make_tiny_model(corpus['dictionary'] + corpus['essay'])
+    max_length = args.max_length or (TINY_MAX_LENGTH if stand_in else None)
+
+    report = {
+        "commit": git_commit(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "model": model_name,
+        "stand_in": stand_in,
+        "corpus": corpus_hash,
+        "max_length": max_length,
+        "machine": {
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "threads": torch.get_num_threads(),
+        },
+        "backends": {},
+        "runs": [],
+    }
+
+    for backend_name in args.backends:
+        reset_peak_rss()
+        start = time.perf_counter()
+        try:
+            backend = load_for_benchmark(backend_name, model_name, "cpu", args.threads)
+        except (ImportError, RuntimeError, ValueError, OSError) as e:
+            print(f"Skipping {backend_name}: {e}")
+            report["backends"][backend_name] = {"skipped": str(e)}
+            continue
+        report["backends"][backend_name] = {
+            "load_seconds": round(time.perf_counter() - start, 3),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+        }
+
+        for target in args.targets:
+            for beams in args.beams:
+                # translate_single always sends one text, so batch size does not apply
+                for batch_size in ([1] if target == "single" else args.batch_sizes):
+                    reset_peak_rss()
+                    result = run_target(target, backend, corpus, scripts, beams, batch_size, max_length)
+                    result.update(target=target, backend=backend_name, beams=beams, batch_size=batch_size,
+                                  peak_rss_mb=round(peak_rss_mb(), 1))
+                    report["runs"].append(result)
+                    print(f"{backend_name:4s} {target:10s} beams={beams} batch={batch_size:3d}  "
+                          f"{result['out_tokens_per_sec']:8.1f} out tok/s  "
+                          f"p50 {fmt_ms(result['batch_latency_ms']['p50'])} ms  "
+                          f"p99 {fmt_ms(result['batch_latency_ms']['p99'])} ms  "
+                          f"{result['peak_rss_mb']:7.1f} MB")
+        del backend
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{report['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nSaved results to {output}")
+
+
+def compare(old_path, new_path):
+    with open(old_path, 'r', encoding='utf-8') as f:
+        old = json.load(f)
+    with open(new_path, 'r', encoding='utf-8') as f:
+        new = json.load(f)
+
+    if old.get("corpus") != new.get("corpus") or old.get("model") != new.get("model"):
+        print("Warning: the two runs used a different corpus or model")
+
+    def key(run):
+        return (run["backend"], run["target"], run["beams"], run["batch_size"])
+
+    before = {key(run): run for run in old["runs"]}
+    print(f"{old['commit']} -> {new['commit']}")
+    for run in new["runs"]:
+        prev = before.get(key(run))
+        if prev is None:
+            continue
+        speed = run["out_tokens_per_sec"] / prev["out_tokens_per_sec"] - 1 if prev["out_tokens_per_sec"] else 0
+        p50_old, p50_new = prev["batch_latency_ms"]["p50"], run["batch_latency_ms"]["p50"]
+        p50 = "n/a" if p50_old is None or p50_new is None else f"{p50_new - p50_old:+.1f}"
+        print(f"{run['backend']:4s} {run['target']:10s} beams={run['beams']} batch={run['batch_size']:3d}  "
+              f"out tok/s {prev['out_tokens_per_sec']:8.1f} -> {run['out_tokens_per_sec']:8.1f} ({speed:+.1%})  "
+              f"p50 {p50} ms  RSS {run['peak_rss_mb'] - prev['peak_rss_mb']:+.1f} MB")
+
+
+def int_list(value):
+    return [int(v) for v in value.split(',') if v]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark translation throughput offline on CPU.")
+    parser.add_argument("--backends", type=lambda v: v.split(','), default=["hf"], help="Comma-separated: hf,ct2")
+    parser.add_argument("--targets", type=lambda v: v.split(','), default=list(TARGETS), help=f"Comma-separated: {','.join(TARGETS)}")
+    parser.add_argument("--beams", type=int_list, default=[1, 4], help="Beam widths to try")
+    parser.add_argument("--batch-sizes", type=int_list, default=[8, 32, 64], help="Maximum items per batch to try")
+    parser.add_argument("--max-length", type=int, default=None, help=f"Override max_length (default: the scripts' own; {TINY_MAX_LENGTH} for the stand-in)")
+    parser.add_argument("--threads", type=int, default=0, help="CPU threads (default: torch/ct2 default)")
+    parser.add_argument("--model", default=None, help="Model name or local path (default: NLLB if cached)")
+    parser.add_argument("--corpus", default=CORPUS_FILE, help="Corpus JSON")
+    parser.add_argument("--output", default=None, help="Results JSON (default: benchmarks/results/<time>-<commit>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two results files and exit")
+    parser.add_argument("--build-corpus", action="store_true", help="Re-sample benchmarks/corpus.json and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+    elif args.build_corpus:
+        build_corpus(args.corpus)
+    else:
+        unknown = set(args.targets) - set(TARGETS)
+        if unknown:
+            parser.error(f"unknown targets: {', '.join(sorted(unknown))}")
+        run_benchmark(args)
+
+
+if __name__ == "__main__":
+    main()
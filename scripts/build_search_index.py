@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Build a prefix-sharded inverted index for the dictionary search.
+
+Instead of shipping dictionary.json to the browser and scanning every entry,
+the search page fetches one small shard per query word:
+
+    public/dictionary-index/meta.json          weights, first token of each shard
+    public/dictionary-index/0000.json ...      consecutive ranges of sorted tokens
+    public/dictionary-index/docs/0000.json ... [id, term, devanagari, iast] per entry,
+                                               DOCS_PER_FILE entries to a file
+
+Every token is normalized so that one query matches across scripts:
+
+- Latin (term, iast, english): lowercased, diacritics folded (ā -> a, ṣ -> s),
+- Telugu and Devanagari (term, telugu, devanagari, hindi): Telugu is mapped
+  onto the parallel Devanagari code points, so ధర్మ and धर्म are one token.
+
+The sorted token list is cut into shards of about SHARD_BYTES. A lookup
+binary-searches the shard boundaries in meta.json for the query word, and
+prefix search reads on while the next shard also starts with it. Each shard
+holds {token: [doc, score, doc, score, ...]}, where doc numbers the entries
+in order of their folded IAST. Stubs are stored once, in files of
+DOCS_PER_FILE consecutive docs, so a search fetches only the files its top
+hits fall in; numbering by IAST keeps the hits of a headword prefix together.
+
+Matching is by whole token or token prefix, not by arbitrary substring as the
+old page filter did: "dhyasa" does not find adhyāsa. Definition words in more
+than MAX_DOC_FREQ of the entries are left out of the index as well. The
+dictionary page falls back to a substring scan of its own headwords and
+English definitions when the index finds nothing.
+src/lib/dictionary-search.ts implements the same normalization on the client.
+"""
+
+import os
+import re
+import json
+import shutil
+import argparse
+import unicodedata
+from bisect import bisect_right
+from collections import defaultdict
+
+DICTIONARY_FILE = os.path.join(os.path.dirname(__file__), '..', 'src', 'data', 'dictionary.json')
+INDEX_DIR = os.path.join(os.path.dirname(__file__), '..', 'public', 'dictionary-index')
+
+INDEX_VERSION = 3
+DOCS_DIR = 'docs'
+DOCS_PER_FILE = 64            # about 5 KB of stubs per file
+SHARD_BYTES = 12 * 1024       # target size of one shard file
+MIN_TOKEN = 2
+MAX_TOKEN = 40
+MAX_DOC_FREQ = 0.05           # definition words in more entries than this are not indexed
+
+HEADWORD_FIELDS = ('term', 'devanagari', 'iast')
+
+# ranking weight of a token by the field it came from; headwords dominate
+FIELD_WEIGHTS = {
+    'term': 10,
+    'devanagari': 10,
+    'iast': 10,
+    'english': 2,
+    'hindi': 1,
+    'telugu': 1,
+}
+
+# a few very common English words that would otherwise fill the biggest shards
+STOPWORDS = frozenset("""
+a an and are as at be by for from has in is it its of on or that the this
+to was which with
+""".split())
+
+_TELUGU = (0x0C00, 0x0C7F)
+_TELUGU_TO_DEVANAGARI = 0x0C00 - 0x0900
+
+# runs of letters and combining marks; everything else separates tokens
+_WORD = re.compile('[^\\W_][\\w\u0300-\u036f\u0900-\u097f\u0c00-\u0c7f\u200c\u200d]*')
+_ZERO_WIDTH = dict.fromkeys(map(ord, '\u200c\u200d'))
+
+
+def _fold_char(c):
+    cp = ord(c)
+    if _TELUGU[0] <= cp <= _TELUGU[1]:
+        return chr(cp - _TELUGU_TO_DEVANAGARI)
+    return c
+
+
+def normalize(text):
+    """the canonical form of a word, shared by index and query"""
+    text = unicodedata.normalize('NFD', text.lower()).translate(_ZERO_WIDTH)
+    out = []
+    for c in text:
+        cp = ord(c)
+        if 0x0300 <= cp <= 0x036F:
+            continue  # Latin combining diacritics: ā -> a, ṣ -> s, l̤ -> l
+        out.append(_fold_char(c))
+    return unicodedata.normalize('NFC', ''.join(out))
+
+
+def tokenize(text):
+    tokens = []
+    for match in _WORD.finditer(text or ''):
+        token = normalize(match.group())[:MAX_TOKEN]
+        if len(token) >= MIN_TOKEN and token not in STOPWORDS:
+            tokens.append(token)
+    return tokens
+
+
+def shard_filename(i):
+    return f'{i:04d}.json'
+
+
+def docs_filename(doc):
+    """the stub file that holds doc"""
+    return os.path.join(DOCS_DIR, shard_filename(doc // DOCS_PER_FILE))
+
+
+def doc_order(entries):
+    """entries in doc order: by folded IAST, ties kept in dictionary order"""
+    return sorted(entries, key=lambda entry: normalize(entry.get('iast') or ''))
+
+
+def build_postings(entries):
+    """
+    {token: {doc: score}}; score sums field weights over occurrences.
+    Definition words that appear in too many entries (है, అని, ...) are
+    dropped, as they cannot narrow a search; headword matches always stay.
+    """
+    postings = defaultdict(lambda: defaultdict(int))
+    headword = defaultdict(set)
+    for doc, entry in enumerate(entries):
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in tokenize(entry.get(field, '')):
+                postings[token][doc] += weight
+                if field in HEADWORD_FIELDS:
+                    headword[token].add(doc)
+
+    limit = max(1, int(MAX_DOC_FREQ * len(entries)))
+    for token in list(postings):
+        if len(postings[token]) > limit:
+            kept = {doc: score for doc, score in postings[token].items() if doc in headword[token]}
+            if kept:
+                postings[token] = kept
+            else:
+                del postings[token]
+    return postings
+
+
+def _stub(entry):
+    return [entry.get(f, '') for f in ('id', 'term', 'devanagari', 'iast')]
+
+
+def _encode(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+def build_shards(postings):
+    """
+    Cut the sorted token list into consecutive ranges of about SHARD_BYTES
+    each. Returns [(first token, shard JSON)]; shard i holds the tokens from
+    its first token up to (not including) the first token of shard i+1.
+    """
+    shards = []
+    tokens, size = {}, 0
+    for token in sorted(postings):
+        docs = sorted(postings[token].items(), key=lambda item: (-item[1], item[0]))
+        flat = [n for pair in docs for n in pair]
+        # close enough to the encoded size to cut on
+        cost = len(_encode({token: flat}).encode('utf-8'))
+
+        if tokens and size + cost > SHARD_BYTES:
+            shards.append((next(iter(tokens)), _encode({'tokens': tokens})))
+            tokens, size = {}, 0
+
+        tokens[token] = flat
+        size += cost
+
+    if tokens:
+        shards.append((next(iter(tokens)), _encode({'tokens': tokens})))
+    return shards
+
+
+def shards_for(word, bounds):
+    """indices of the shards that can hold a token starting with word"""
+    i = max(bisect_right(bounds, word) - 1, 0)
+    found = [i]
+    while i + 1 < len(bounds) and bounds[i + 1].startswith(word):
+        i += 1
+        found.append(i)
+    return found
+
+
+def write_index(shards, entries, output_dir):
+    """write into a sibling temp directory, then swap it in"""
+    tmp_dir = output_dir.rstrip('/') + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    os.makedirs(os.path.join(tmp_dir, DOCS_DIR))
+    docs_size = 0
+    for start in range(0, len(entries), DOCS_PER_FILE):
+        text = _encode([_stub(entry) for entry in entries[start:start + DOCS_PER_FILE]])
+        with open(os.path.join(tmp_dir, docs_filename(start)), 'w', encoding='utf-8') as f:
+            f.write(text)
+        docs_size += len(text.encode('utf-8'))
+
+    sizes = []
+    for i, (_, text) in enumerate(shards):
+        with open(os.path.join(tmp_dir, shard_filename(i)), 'w', encoding='utf-8') as f:
+            f.write(text)
+        sizes.append(len(text.encode('utf-8')))
+
+    meta = {
+        'version': INDEX_VERSION,
+        'entries': len(entries),
+        'minToken': MIN_TOKEN,
+        'maxToken': MAX_TOKEN,
+        'stopwords': sorted(STOPWORDS),
+        'fieldWeights': FIELD_WEIGHTS,
+        'docsPerFile': DOCS_PER_FILE,
+        # first token of each shard, in code point order
+        'shards': [first for first, _ in shards],
+    }
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, separators=(',', ':'))
+
+    old_dir = output_dir.rstrip('/') + '.old'
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(output_dir):
+        os.replace(output_dir, old_dir)
+    os.replace(tmp_dir, output_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return sizes, docs_size
+
+
+def build_index(dictionary_file=DICTIONARY_FILE, output_dir=INDEX_DIR):
+    with open(dictionary_file, 'r', encoding='utf-8') as f:
+        entries = doc_order(json.load(f).get('entries', []))
+
+    postings = build_postings(entries)
+    shards = build_shards(postings)
+    sizes, docs_size = write_index(shards, entries, output_dir)
+
+    sizes.sort()
+    print(f"Indexed {len(entries)} entries: {len(postings)} tokens in {len(shards)} shards")
+    if sizes:
+        print(f"Shard size: median {sizes[len(sizes) // 2] / 1024:.1f} KB, "
+              f"largest {sizes[-1] / 1024:.1f} KB, total {sum(sizes) / 1024:.0f} KB "
+              f"+ {docs_size / 1024:.0f} KB of entry stubs")
+    print(f"Saved to {output_dir}")
+
+
+def search(query, index_dir=INDEX_DIR, limit=20):
+    """
+    Rank entries for a query the way the client does: every query word must
+    match a token exactly or as a prefix; exact matches count double.
+    Returns [(score, id, term, iast)].
+    """
+    words = tokenize(query)
+    if not words:
+        return []
+
+    with open(os.path.join(index_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+        bounds = json.load(f)['shards']
+
+    scores = None
+    for word in words:
+        tokens = {}
+        for i in shards_for(word, bounds):
+            with open(os.path.join(index_dir, shard_filename(i)), 'r', encoding='utf-8') as f:
+                tokens.update(json.load(f)['tokens'])
+
+        word_scores = defaultdict(int)
+        for token, flat in tokens.items():
+            if token.startswith(word):
+                boost = 2 if token == word else 1
+                for doc, score in zip(flat[::2], flat[1::2]):
+                    word_scores[str(doc)] += score * boost
+
+        if scores is None:
+            scores = word_scores
+        else:
+            scores = {doc: scores[doc] + s for doc, s in word_scores.items() if doc in scores}
+
+    ranked = sorted(scores.items(), key=lambda item: (-item[1], int(item[0])))[:limit]
+    stub_files = {}
+    results = []
+    for doc, score in ranked:
+        doc = int(doc)
+        name = docs_filename(doc)
+        if name not in stub_files:
+            with open(os.path.join(index_dir, name), 'r', encoding='utf-8') as f:
+                stub_files[name] = json.load(f)
+        entry_id, term, _, iast = stub_files[name][doc % DOCS_PER_FILE]
+        results.append((score, entry_id, term, iast))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the sharded dictionary search index.")
+    parser.add_argument("--input", default=DICTIONARY_FILE, help="dictionary.json to index")
+    parser.add_argument("--output", default=INDEX_DIR, help="Directory for meta.json and the shards")
+    parser.add_argument("--query", help="Search an existing index instead of building one")
+    args = parser.parse_args()
+
+    if args.query:
+        for score, entry_id, term, iast in search(args.query, args.output):
+            print(f"{score:5d}  {entry_id:10s} {term} ({iast})")
+        return
+
+    build_index(args.input, args.output)
+
+
+if __name__ == "__main__":
+    main()
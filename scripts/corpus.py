@@ -0,0 +1,95 @@
+"""
+Which translated MDX files of the content collections need rebuilding.
+
+Every <name>.en.mdx under src/content/<collection>/ has .hi.mdx and .te.mdx
+siblings. A segment manifest (collection/_translations/<name>.json, see
+translate-essay.py) records, for each output it wrote, a content hash of the
+English source it was built from and of the output itself. An output is
+then:
+
+- missing:   not there yet; built,
+- stale:     built from a source whose hash has changed since; rebuilt,
+- fresh:     built from the current source; left alone,
+- edited:    changed by hand since it was built; left alone,
+- conflict:  changed by hand, and its source has changed too; reported and
+             left alone, since a rebuild would throw the hand edits away,
+- untracked: there, but with no record (e.g. written before manifests
+             existed); adopted as built from the current source, so it is
+             fresh from then on and stale once the source changes.
+
+Hashes rather than mtimes, so a checkout, a touch or a copy does not make
+everything stale, and an edit that changes nothing does not either. Only
+"missing" and "stale" outputs are built unless --force is given.
+"""
+
+import os
+import hashlib
+
+CONTENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'content')
+
+# collection -> frontmatter fields to translate
+COLLECTIONS = {
+    'essays': ('title', 'description', 'claim'),
+    'gita': ('title',),
+    'daily': ('question',),
+    'listen': ('title',),
+}
+
+LANGS = ('hi', 'te')
+BUILD = ('missing', 'stale')
+
+
+def content_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def file_hash(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return content_hash(f.read())
+
+
+def output_path(source_path, lang):
+    return source_path[:-len('.en.mdx')] + f'.{lang}.mdx'
+
+
+def collection_of(source_path):
+    """the collection a page belongs to, by its directory; essays if it is not one of them"""
+    name = os.path.basename(os.path.dirname(os.path.abspath(source_path)))
+    return name if name in COLLECTIONS else 'essays'
+
+
+def find_sources(content_dir=CONTENT_DIR, collections=tuple(COLLECTIONS)):
+    """[(collection, path of .en.mdx)] in a stable order"""
+    sources = []
+    for collection in collections:
+        directory = os.path.join(content_dir, collection)
+        if not os.path.isdir(directory):
+            continue
+        sources.extend(
+            (collection, os.path.join(directory, name))
+            for name in sorted(os.listdir(directory)) if name.endswith('.en.mdx')
+        )
+    return sources
+
+
+def output_status(source_hash, manifest, source_path, lang):
+    path = output_path(source_path, lang)
+    if not os.path.exists(path):
+        return 'missing'
+    record = manifest.get('outputs', {}).get(lang)
+    if record is None:
+        return 'untracked'
+    if record['output'] != file_hash(path):
+        return 'edited' if record['source'] == source_hash else 'conflict'
+    return 'fresh' if record['source'] == source_hash else 'stale'
+
+
+def record_output(manifest, lang, source_hash, output):
+    """note in manifest that output was built for lang from the source with source_hash"""
+    manifest.setdefault('outputs', {})[lang] = {'source': source_hash, 'output': content_hash(output)}
+
+
+def adopt_output(manifest, source_path, lang, source_hash):
+    """record an untracked output as it is now, as if built from the current source"""
+    with open(output_path(source_path, lang), 'r', encoding='utf-8') as f:
+        record_output(manifest, lang, source_hash, f.read())
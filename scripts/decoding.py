@@ -0,0 +1,97 @@
+"""
+Greedy-first decoding with beam search only where it is needed.
+
+Beam search with num_beams=4 costs several times a greedy decode, yet most
+short headwords and headers come out well greedily. GreedyFirst wraps a
+backend and decodes every batch greedily first. An output is decoded again
+with the caller's own (beam) settings only if it
+
+- has a mean token log-probability below min_logprob (the model was unsure),
+- loops, according to repetition.detect_repetition(), or
+- came back empty.
+
+The wrapper has the backends' generate()/generate_multi() surface, so the
+scripts use it in place of the backend. Its name and id are not the wrapped
+backend's, so the translation memory keeps greedy-first output apart from
+full beam-search output. The "greedy_outputs" and "escalated_outputs"
+counters in the run report (instrumentation.py) give the share re-decoded.
+"""
+
+from repetition import detect_repetition
+from instrumentation import metrics
+
+# mean natural-log probability per output token; about -1.0 is where NLLB
+# greedy output starts to drop words or drift
+MIN_LOGPROB = -1.0
+
+# settings that only mean something to beam search
+BEAM_ONLY = ("num_beams", "early_stopping", "length_penalty", "num_return_sequences")
+
+
+def greedy_settings(generation_kwargs):
+    settings = {k: v for k, v in generation_kwargs.items() if k not in BEAM_ONLY}
+    settings["num_beams"] = 1
+    return settings
+
+
+class GreedyFirst:
+    def __init__(self, backend, min_logprob=MIN_LOGPROB):
+        self._backend = backend
+        self.min_logprob = min_logprob
+        self.name = f"{backend.name}+greedy"
+        self.id = f"{backend.id}+greedy"
+
+    def __getattr__(self, name):
+        return getattr(self._backend, name)
+
+    def escalation_reason(self, text, logprob):
+        """why an output needs beam search, or None if the greedy one stands"""
+        if not text.strip():
+            return "empty"
+        if detect_repetition(text):
+            return "repetition"
+        if logprob < self.min_logprob:
+            return "low_confidence"
+        return None
+
+    def generate(self, texts, src_lang, tgt_lang, **generation_kwargs):
+        return self.generate_multi(texts, src_lang, [tgt_lang], **generation_kwargs)[tgt_lang]
+
+    def generate_multi(self, texts, src_lang, tgt_langs, **generation_kwargs):
+        if generation_kwargs.get("num_beams", 1) <= 1:
+            return self._backend.generate_multi(texts, src_lang, tgt_langs, **generation_kwargs)
+
+        with metrics.stage("greedy"):
+            scored = self._backend.generate_multi_scored(
+                texts, src_lang, tgt_langs, **greedy_settings(generation_kwargs))
+
+        outputs = {}
+        for tgt_lang in tgt_langs:
+            outputs[tgt_lang] = [text for text, _ in scored[tgt_lang]]
+            retry = []
+            for i, (text, logprob) in enumerate(scored[tgt_lang]):
+                reason = self.escalation_reason(text, logprob)
+                if reason:
+                    retry.append(i)
+                    metrics.count(f"escalated_{reason}")
+            metrics.count("greedy_outputs", len(texts))
+            metrics.count("escalated_outputs", len(retry))
+            if not retry:
+                continue
+
+            # only this target's doubtful outputs are decoded again
+            with metrics.stage("beam_fallback"):
+                beamed = self._backend.generate(
+                    [texts[i] for i in retry], src_lang, tgt_lang, **generation_kwargs)
+            for i, text in zip(retry, beamed):
+                outputs[tgt_lang][i] = text
+        return outputs
+
+
+def greedy_first(backend, min_logprob=MIN_LOGPROB):
+    """wrap backend in GreedyFirst, unless a translation server does the decoding"""
+    if getattr(backend, "batches_server_side", False):
+        print("Greedy-first decoding is up to the translation server "
+              "(start it with --greedy-first); using its settings")
+        return backend
+    return GreedyFirst(backend, min_logprob)
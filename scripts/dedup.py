@@ -0,0 +1,75 @@
+"""
+Run-wide deduplication of source segments.
+
+The same strings recur all over the corpus: headers such as "Objections",
+protocol labels, pullquotes that repeat a paragraph, identical Telugu
+headwords in different split files. A SegmentIndex collects every segment of
+a run with the place it came from, keyed by its normalized text, so each
+unique segment is translated once and the result is fanned back out to every
+place that holds it.
+
+normalize() only folds differences the model never sees: Unicode
+composition (the NLLB tokenizer applies NFKC itself) and runs of spaces and
+tabs (sentencepiece collapses them). Line breaks are kept, since the
+sentence chunker (segmenter.py) joins translated pieces with them.
+
+The run report (instrumentation.py) gets the "dedup_segments" and
+"dedup_unique" counters and their dedup_ratio.
+"""
+
+import re
+import unicodedata
+
+from instrumentation import metrics
+
+_SPACES = re.compile(r'[^\S\n]+')
+_LINE_EDGES = re.compile(r' ?\n ?')
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFC', text.replace('\r\n', '\n'))
+    return _LINE_EDGES.sub('\n', _SPACES.sub(' ', text)).strip()
+
+
+class SegmentIndex:
+    """normalized segment -> every (location, original text) it was found at"""
+
+    def __init__(self):
+        self.locations = {}
+        self.segments = 0
+
+    def add(self, text, location):
+        """record text at location; returns the normalized text it is translated as"""
+        key = normalize(text)
+        self.locations.setdefault(key, []).append((location, text))
+        self.segments += 1
+        return key
+
+    def unique(self):
+        """the texts to translate, in first-seen order"""
+        return list(self.locations)
+
+    def __len__(self):
+        return len(self.locations)
+
+    def fan_out(self, texts, outputs):
+        """(location, original text, output) for every place holding one of texts"""
+        for text, output in zip(texts, outputs):
+            for location, original in self.locations[text]:
+                yield location, original, output
+
+    def ratio(self):
+        """segments per unique segment; 1.0 means nothing was repeated"""
+        return self.segments / len(self.locations) if self.locations else 1.0
+
+    def summary(self, what="segments"):
+        saved = 1 - len(self.locations) / self.segments if self.segments else 0.0
+        return (f"Deduplicated {self.segments} {what} to {len(self.locations)} unique "
+                f"({self.ratio():.2f}x, {100 * saved:.1f}% fewer to translate)")
+
+    def report(self, what="segments"):
+        """add this index to the run metrics and print its summary"""
+        metrics.count("dedup_segments", self.segments)
+        metrics.count("dedup_unique", len(self.locations))
+        if self.segments:
+            print(self.summary(what))
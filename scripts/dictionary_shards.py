@@ -0,0 +1,219 @@
+"""
+Content-hashed, lazily loadable shards of the dictionary.
+
+dictionary.json has to be loaded whole even to show one term. The shard
+export splits it two ways:
+
+- by initial: the first letter of the entry's IAST with diacritics folded
+  (adhyakṣa -> a, śiva -> s), or the first two (ad, an, ...) for a letter
+  with more than MAX_SHARD_ENTRIES entries; anything else goes under "_",
+- by field group: "head" (id, term, devanagari, iast, source, seeAlso, ...)
+  apart from each long definition field ("english", "hindi", "telugu").
+
+Each shard is named <group>.<initial>.<hash>.json after a hash of its bytes,
+so it can be cached forever; manifest.json (small, not hashed) maps
+initial -> group -> file name and carries the sources table. An entry lives
+under the longest initial in the manifest that its folded IAST starts with.
+
+    head.a.3f1c0e9b2d4a.json      [{"id": ..., "term": ..., ...}, ...]
+    english.a.91b2c7d0e4f5.json   {"<id>": "<definition>", ...}
+
+Entries are spilled to one temporary JSONL file per initial while they
+stream in, so memory is bounded by the largest shard, not the dictionary.
+"""
+
+import os
+import json
+import hashlib
+import argparse
+import tempfile
+import unicodedata
+
+from journal import atomic_write_json
+from json_stream import dumps_compact
+
+DICTIONARY_FILE = os.path.join(os.path.dirname(__file__), '..', 'src', 'data', 'dictionary.json')
+EXPORT_DIR = os.path.join(os.path.dirname(__file__), '..', 'public', 'dictionary-data')
+
+MANIFEST = 'manifest.json'
+MANIFEST_VERSION = 1
+DEFINITION_FIELDS = ('english', 'hindi', 'telugu')
+HEAD = 'head'
+GROUPS = (HEAD,) + DEFINITION_FIELDS
+OTHER_INITIAL = '_'
+HASH_LENGTH = 12
+MAX_SHARD_ENTRIES = 200
+
+
+def folded_prefix(entry, length=2):
+    """first letters of the IAST, a-z only with diacritics dropped, or OTHER_INITIAL"""
+    letters = []
+    for c in unicodedata.normalize('NFD', entry.get('iast') or '').lower():
+        if 'a' <= c <= 'z':
+            letters.append(c)
+            if len(letters) == length:
+                break
+        elif unicodedata.category(c).startswith('M'):
+            continue
+        elif letters or c.isalnum():
+            break
+    return ''.join(letters) or OTHER_INITIAL
+
+
+def split_entry(entry):
+    """{group: value}; head keeps every field that is not a definition"""
+    parts = {HEAD: {k: v for k, v in entry.items() if k not in DEFINITION_FIELDS}}
+    for field in DEFINITION_FIELDS:
+        if entry.get(field):
+            parts[field] = entry[field]
+    return parts
+
+
+def shard_name(group, initial, text):
+    digest = hashlib.sha256(text.encode('utf-8')).hexdigest()[:HASH_LENGTH]
+    return f'{group}.{initial}.{digest}.json'
+
+
+class ShardExporter:
+    """add() entries in dictionary order, then finish() to write shards and manifest"""
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self._spill = tempfile.TemporaryDirectory(prefix='dictionary-shards-')
+        self._files = {}
+        self._counts = {}
+        self.total = 0
+
+    def add(self, entry):
+        prefix = folded_prefix(entry)
+        f = self._files.get(prefix)
+        if f is None:
+            path = os.path.join(self._spill.name, prefix + '.jsonl')
+            f = self._files[prefix] = open(path, 'w', encoding='utf-8')
+        f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self._counts[prefix] = self._counts.get(prefix, 0) + 1
+        self.total += 1
+
+    def _read_spill(self, prefixes):
+        for prefix in prefixes:
+            with open(os.path.join(self._spill.name, prefix + '.jsonl'), 'r', encoding='utf-8') as f:
+                for line in f:
+                    yield json.loads(line)
+
+    def _plan(self):
+        """{initial: [spilled prefixes]}; a busy letter keeps its two-letter prefixes apart"""
+        by_letter = {}
+        for prefix in sorted(self._counts):
+            by_letter.setdefault(prefix[:1], []).append(prefix)
+        plan = {}
+        for letter, prefixes in by_letter.items():
+            if sum(self._counts[p] for p in prefixes) <= MAX_SHARD_ENTRIES:
+                plan[letter] = prefixes
+            else:
+                for prefix in prefixes:
+                    plan[prefix] = [prefix]
+        return plan
+
+    def finish(self, sources):
+        for f in self._files.values():
+            f.close()
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        shards = {}
+        sizes = {group: 0 for group in GROUPS}
+        for initial, prefixes in self._plan().items():
+            groups = {HEAD: []}
+            for entry in self._read_spill(prefixes):
+                parts = split_entry(entry)
+                groups[HEAD].append(parts.pop(HEAD))
+                for field, text in parts.items():
+                    groups.setdefault(field, {})[entry['id']] = text
+
+            shards[initial] = {}
+            for group, value in groups.items():
+                text = dumps_compact(value)
+                name = shard_name(group, initial, text)
+                path = os.path.join(self.output_dir, name)
+                if not os.path.exists(path):  # same name, same bytes
+                    with open(path, 'w', encoding='utf-8') as f:
+                        f.write(text)
+                shards[initial][group] = name
+                sizes[group] += len(text.encode('utf-8'))
+        self._spill.cleanup()
+
+        manifest = {
+            'version': MANIFEST_VERSION,
+            'entries': self.total,
+            'groups': list(GROUPS),
+            'sources': sources,
+            'shards': shards,
+        }
+        # the manifest goes last, so readers never see a name that is not on disk yet
+        atomic_write_json(os.path.join(self.output_dir, MANIFEST), manifest)
+        removed = self._remove_stale(shards)
+        return manifest, sizes, removed
+
+    def _remove_stale(self, shards):
+        keep = {name for groups in shards.values() for name in groups.values()}
+        removed = 0
+        for name in os.listdir(self.output_dir):
+            if name.endswith('.json') and name != MANIFEST and name not in keep:
+                os.remove(os.path.join(self.output_dir, name))
+                removed += 1
+        return removed
+
+
+def load_manifest(shard_dir):
+    with open(os.path.join(shard_dir, MANIFEST), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_entries(shard_dir, initials=None, groups=(HEAD,), manifest=None):
+    """
+    Entries for the given initials (default all), with only the requested
+    field groups filled in; reads just those shards (head always).
+    """
+    manifest = manifest or load_manifest(shard_dir)
+    entries = []
+    for initial, files in manifest['shards'].items():
+        if initials is not None and initial not in initials:
+            continue
+        loaded = {}
+        for group in (HEAD,) + tuple(g for g in groups if g != HEAD):
+            if group in files:
+                with open(os.path.join(shard_dir, files[group]), 'r', encoding='utf-8') as f:
+                    loaded[group] = json.load(f)
+        for head in loaded.get(HEAD, []):
+            entry = dict(head)
+            for field in DEFINITION_FIELDS:
+                if field in loaded and entry['id'] in loaded[field]:
+                    entry[field] = loaded[field][entry['id']]
+            entries.append(entry)
+    return entries
+
+
+def export(dictionary_file=DICTIONARY_FILE, output_dir=EXPORT_DIR):
+    """shard an existing dictionary.json (merge_dictionary.py --export does this while merging)"""
+    with open(dictionary_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    exporter = ShardExporter(output_dir)
+    for entry in data.get('entries', []):
+        exporter.add(entry)
+    return exporter.finish(data.get('sources', {}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write content-hashed dictionary shards and a manifest.")
+    parser.add_argument("--input", default=DICTIONARY_FILE, help="dictionary.json to shard")
+    parser.add_argument("--output", default=EXPORT_DIR, help="Directory for manifest.json and the shards")
+    args = parser.parse_args()
+
+    manifest, sizes, removed = export(args.input, args.output)
+    count = sum(len(groups) for groups in manifest['shards'].values())
+    print(f"Exported {manifest['entries']} entries as {count} shards to {args.output} ({removed} stale removed)")
+    for group, size in sizes.items():
+        print(f"  {group}: {size / 1024:.0f} KB")
+
+
+if __name__ == "__main__":
+    main()
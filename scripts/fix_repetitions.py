@@ -1,103 +1,275 @@
 import os
+import sys
 import json
-import re
-import torch
-from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+import time
+import argparse
 from tqdm import tqdm
 
-# Check for GPU
-device = "cuda" if torch.cuda.is_available() else "cpu"
-print(f"Using device: {device}")
+from translation_memory import TranslationMemory
+from nllb_backends import BACKENDS, DEFAULT_BACKEND, MODEL_NAME
+from translation_client import connect_or_load
+from journal import BatchJournal, atomic_write_json, source_key
+from batching import MAX_BATCH_TOKENS, BatchSizer
+from segmenter import run_chunked
+from repetition import analyze_repetition, detect_repetition
+import mdx
+import instrumentation
+from instrumentation import metrics
 
-model_name = "facebook/nllb-200-distilled-600M"
+model_name = MODEL_NAME
 
-def load_model():
-    print(f"Loading model {model_name}...")
-    tokenizer = AutoTokenizer.from_pretrained(model_name)
-    model = AutoModelForSeq2SeqLM.from_pretrained(model_name).to(device)
-    return tokenizer, model
+generation_kwargs = {
+    "max_length": 512,
+    "no_repeat_ngram_size": 3,  # Prevent 3-gram repetition
+    "repetition_penalty": 1.5,   # Penalize repetition
+    "num_beams": 4,             # Use beam search for better quality
+    "early_stopping": True,
+}
 
-def detect_repetition(text):
-    if not text:
-        return False
-    
-    # Check for immediate word repetition (word word word word)
-    if re.search(r'(\b\w+\b[\s\r\n]*)\1{3,}', text):
-        return True
-        
-    # Check for phrase repetition
-    words = text.split()
-    if len(words) > 20:
-        if len(set(words)) / len(words) < 0.2: 
-            return True
-            
-    return False
+# Dictionary field -> NLLB language code
+TARGET_FIELDS = {
+    "english": "eng_Latn",
+    "hindi": "hin_Deva",
+}
+
+# --scan-only also reports on the Telugu source, which is never re-translated
+SCAN_FIELDS = ("english", "hindi", "telugu")
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'data')
+DICTIONARY_FILE = os.path.join(DATA_DIR, 'dictionary.json')
+SPLIT_DIR = os.path.join(DATA_DIR, 'dictionary_split')
+CONTENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'content')
+
+def load_model(backend=None, use_server=True):
+    # Returns an nllb_backends backend, or a client for a running translation server
+    return connect_or_load(backend, model_name, use_server)
+
+def translate_single(text, backend, src_lang="tel_Telu", tgt_lang="eng_Latn", memory=None):
+    # One text per call; the script itself uses translate_flagged, this is
+    # the unbatched baseline that benchmark.py times it against
+    if memory is not None:
+        # A remembered translation that still loops is exactly what we are
+        # trying to replace, so only trust clean hits
+        cached = memory.lookup([text], src_lang, tgt_lang, backend.id, model_name, generation_kwargs)[0]
+        if cached is not None and not detect_repetition(cached):
+            return cached
+        result = translate_single(text, backend, src_lang, tgt_lang)
+        memory.store([text], [result], src_lang, tgt_lang, backend.id, model_name, generation_kwargs)
+        return result
+
+    def generate(batch):
+        return backend.generate(batch, src_lang, tgt_lang, **generation_kwargs)
+
+    if getattr(backend, "batches_server_side", False):
+        return generate([text])[0]
+    # a long definition is re-translated sentence by sentence rather than truncated
+    return run_chunked([text], backend.tokenizer, generate)[0]
 
-def translate_single(text, tokenizer, model, src_lang="tel_Telu", tgt_lang="eng_Latn"):
-    tokenizer.src_lang = src_lang
-    inputs = tokenizer(text, return_tensors="pt", padding=True, truncation=True, max_length=512).to(device)
+def translate_flagged(texts, backend, tgt_lang, src_lang="tel_Telu", batch_size=64, max_tokens=MAX_BATCH_TOKENS, memory=None, on_batch=None, sizer=None):
+    # Length-sorted batched version of translate_single for many texts at once
+    results = [None] * len(texts)
+    if memory is not None:
+        # Only trust remembered translations that no longer loop
+        cached = memory.lookup(texts, src_lang, tgt_lang, backend.id, model_name, generation_kwargs)
+        results = [c if c is not None and not detect_repetition(c) else None for c in cached]
     
-    with torch.no_grad():
-        generated_tokens = model.generate(
-            **inputs,
-            forced_bos_token_id=tokenizer.convert_tokens_to_ids(tgt_lang),
-            max_length=512,
-            no_repeat_ngram_size=3,  # Prevent 3-gram repetition
-            repetition_penalty=1.5,   # Penalize repetition
-            num_beams=4,             # Use beam search for better quality
-            early_stopping=True
-        )
+    missing = list(dict.fromkeys(t for t, r in zip(texts, results) if r is None))
+    if missing:
+        def generate(batch):
+            return backend.generate(batch, src_lang, tgt_lang, **generation_kwargs)
         
-    return tokenizer.decode(generated_tokens[0], skip_special_tokens=True)
+        if getattr(backend, "batches_server_side", False):
+            translated = generate(missing)
+            if on_batch is not None:
+                on_batch(missing, translated)
+        else:
+            translated = run_chunked(
+                missing, backend.tokenizer, generate, max_tokens, batch_size,
+                progress=lambda batches: tqdm(batches, desc=f"Re-translating ({tgt_lang})"),
+                on_batch=on_batch, sizer=sizer,
+            )
+        
+        if memory is not None:
+            memory.store(missing, translated, src_lang, tgt_lang, backend.id, model_name, generation_kwargs)
+        by_text = dict(zip(missing, translated))
+        results = [by_text[t] if r is None else r for t, r in zip(texts, results)]
+    
+    return results
 
-def process_files(directory, tokenizer, model):
+def scan_files(directory):
+    # Phase 1: find every looping field without touching the model.
+    # Returns {file_path: data} and a list of (file_path, entry index, field, telugu).
     files = [f for f in os.listdir(directory) if f.endswith('.json')]
     files.sort()
     
-    total_fixed = 0
+    loaded = {}
+    flagged = []
     
     for filename in files:
         file_path = os.path.join(directory, filename)
         with open(file_path, 'r', encoding='utf-8') as f:
             data = json.load(f)
-            
-        modified = False
-        entries = data.get('entries', [])
+        loaded[file_path] = data
         
-        for entry in tqdm(entries, desc=f"Checking {filename}", leave=False):
+        for i, entry in enumerate(tqdm(data.get('entries', []), desc=f"Checking {filename}", leave=False)):
             telugu = entry.get('telugu', '')
             if not telugu:
                 continue
-                
-            # Check English
-            if detect_repetition(entry.get('english', '')):
-                # print(f"Fixing English for {entry['id']} in {filename}")
-                new_english = translate_single(telugu, tokenizer, model, tgt_lang="eng_Latn")
-                if new_english != entry['english']:
-                    entry['english'] = new_english
-                    modified = True
-                    total_fixed += 1
-
-            # Check Hindi
-            if detect_repetition(entry.get('hindi', '')):
-                # print(f"Fixing Hindi for {entry['id']} in {filename}")
-                new_hindi = translate_single(telugu, tokenizer, model, tgt_lang="hin_Deva")
-                if new_hindi != entry['hindi']:
-                    entry['hindi'] = new_hindi
-                    modified = True
-                    total_fixed += 1
-                    
-        if modified:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-            print(f"Updated {filename}")
+            for field in TARGET_FIELDS:
+                if detect_repetition(entry.get(field, '')):
+                    flagged.append((file_path, i, field, telugu))
+    
+    return loaded, flagged
+
+def _finding(result, **where):
+    return dict(where, score=result.score, repeats=result.repeats, phrase=result.phrase)
+
+def scan_dictionary(path):
+    # path is a directory of split files or a single dictionary.json
+    if os.path.isdir(path):
+        files = sorted(os.path.join(path, f) for f in os.listdir(path) if f.endswith('.json'))
+    else:
+        files = [path]
+    
+    findings = []
+    checked = 0
+    for file_path in files:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        for entry in data.get('entries', []):
+            for field in SCAN_FIELDS:
+                text = entry.get(field) or ''
+                if not text:
+                    continue
+                checked += 1
+                result = analyze_repetition(text)
+                if result.repetitive:
+                    findings.append(_finding(result, file=os.path.basename(file_path), id=entry.get('id'), field=field))
+    return checked, findings
+
+def scan_content(directory):
+    findings = []
+    checked = 0
+    for root, _, files in sorted(os.walk(directory)):
+        for filename in sorted(files):
+            if not filename.endswith(('.md', '.mdx')):
+                continue
+            file_path = os.path.join(root, filename)
+            with open(file_path, 'r', encoding='utf-8') as f:
+                text = f.read()
+            for line, paragraph in mdx.paragraphs(mdx.tokenize(text)):
+                checked += 1
+                result = analyze_repetition(paragraph)
+                if result.repetitive:
+                    findings.append(_finding(result, file=os.path.relpath(file_path, directory), line=line))
+    return checked, findings
+
+def scan_report(dictionary_path, content_dir):
+    # Model-free: only the standard library and repetition.py are used
+    start = time.perf_counter()
+    report = {}
+    if dictionary_path and os.path.exists(dictionary_path):
+        checked, findings = scan_dictionary(dictionary_path)
+        report["dictionary"] = {"source": os.path.abspath(dictionary_path), "checked": checked, "flagged": len(findings), "items": findings}
+    if content_dir and os.path.isdir(content_dir):
+        checked, findings = scan_content(content_dir)
+        report["content"] = {"source": os.path.abspath(content_dir), "checked": checked, "flagged": len(findings), "items": findings}
+    report["seconds"] = round(time.perf_counter() - start, 3)
+    return report
+
+def process_files(directory, load_backend_fn, memory=None, resume=False, batch_size=64, max_tokens=MAX_BATCH_TOKENS, adaptive=True, memory_budget=None):
+    with metrics.stage("scan"):
+        loaded, flagged = scan_files(directory)
+    metrics.count("files", len(loaded))
+    metrics.count("flagged", len(flagged))
+    
+    # One journal for the whole run, since batches span split files
+    journal = BatchJournal(os.path.join(directory, '.journal', 'fix_repetitions.jsonl'))
+    replayed = {}
+    if resume:
+        replayed = journal.replay()
+    elif journal.exists():
+        print("Discarding journal from an interrupted run (use --resume to keep it)")
+        journal.remove()
+    
+    print(f"Found {len(flagged)} looping fields in {len(loaded)} files")
+    
+    # Phase 2: re-translate everything flagged, batched per target language
+    fixes = {}
+    todo = {}
+    for file_path, i, field, telugu in flagged:
+        value = replayed.get((source_key(telugu), field))
+        if value is not None:
+            fixes[(file_path, i, field)] = value
+        else:
+            todo.setdefault(field, []).append((file_path, i, telugu))
+    
+    if todo:
+        # The model only loads if there is something left to fix
+        backend = load_backend_fn()
+        sizer = BatchSizer.for_backend(backend, max_tokens, memory_budget) if adaptive else None
+        for field, items in todo.items():
+            texts = [telugu for _, _, telugu in items]
+            
+            def record(batch_texts, outputs, field=field):
+                journal.append([
+                    {"key": source_key(text), "field": field, "value": out}
+                    for text, out in zip(batch_texts, outputs)
+                ])
+            
+            with metrics.stage("translate"):
+                translations = translate_flagged(texts, backend, TARGET_FIELDS[field], batch_size=batch_size, max_tokens=max_tokens, memory=memory, on_batch=record, sizer=sizer)
+            for (file_path, i, _), translation in zip(items, translations):
+                fixes[(file_path, i, field)] = translation
+    
+    total_fixed = 0
+    modified = set()
+    for (file_path, i, field), value in fixes.items():
+        entry = loaded[file_path]['entries'][i]
+        if value != entry[field]:
+            entry[field] = value
+            modified.add(file_path)
+            total_fixed += 1
+    
+    for file_path in sorted(modified):
+        with metrics.stage("write_json"):
+            atomic_write_json(file_path, loaded[file_path])
+        print(f"Updated {os.path.basename(file_path)}")
+    journal.remove()
             
+    metrics.count("entries_fixed", total_fixed)
     print(f"Total entries fixed: {total_fixed}")
 
 def main():
-    directory = '/storage/ayamatma/src/data/dictionary_split'
-    tokenizer, model = load_model()
-    process_files(directory, tokenizer, model)
+    parser = argparse.ArgumentParser(description="Re-translate dictionary fields caught in repetition loops.")
+    parser.add_argument("--dir", default=SPLIT_DIR, help="Directory containing split json files (default: ../src/data/dictionary_split relative to script)")
+    parser.add_argument("--resume", action="store_true", help="Replay the journal of an interrupted run instead of discarding it")
+    parser.add_argument("--batch-size", type=int, default=64, help="Maximum entries per batch")
+    parser.add_argument("--max-tokens", type=int, default=MAX_BATCH_TOKENS, help="Padded source tokens per batch; where the adaptive budget starts")
+    parser.add_argument("--memory-budget", type=float, default=None, metavar="MB", help="Memory batches may use (default: 70%% of what is available at start)")
+    parser.add_argument("--fixed-batches", action="store_true", help="Keep the --max-tokens budget instead of adapting it to memory use")
+    parser.add_argument("--scan-only", action="store_true", help="Print a JSON report of looping text and exit without loading the model")
+    parser.add_argument("--content-dir", default=CONTENT_DIR, help="MDX content checked by --scan-only")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the translation memory")
+    parser.add_argument("--backend", default=None, choices=BACKENDS, help=f"Inference backend, ct2 = int8 CPU (default: the server's, else {DEFAULT_BACKEND})")
+    parser.add_argument("--no-server", action="store_true", help="Always load the model locally, even if a translation server is running")
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+    
+    if args.scan_only:
+        dictionary_path = args.dir if os.path.isdir(args.dir) else DICTIONARY_FILE
+        report = scan_report(dictionary_path, args.content_dir)
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+        return
+    
+    memory = None if args.no_cache else TranslationMemory()
+    process_files(args.dir, lambda: load_model(args.backend, use_server=not args.no_server), memory,
+                  args.resume, args.batch_size, args.max_tokens, not args.fixed_batches, args.memory_budget)
+    if memory is not None:
+        print(memory.summary())
+        memory.close()
+    instrumentation.write_reports(args, memory)
 
 if __name__ == "__main__":
     main()
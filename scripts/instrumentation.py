@@ -0,0 +1,289 @@
+"""
+Per-stage timing and memory counters for the translation scripts.
+
+One process-wide `metrics` object collects:
+
+- stages: wall time and call count per named stage (load, parse, tokenize,
+  encode, generate, decode, write, ...), timed with `with metrics.stage(...)`,
+- counters: anything countable (entries, segments, memory hits, ...),
+- tokens: source tokens in, padded source tokens and generated tokens out,
+  from which the padding ratio (share of the encoder input that was padding)
+  follows,
+- the RSS high-water mark of the process.
+
+Timing costs two perf_counter() calls per stage, so it is always on. A script
+writes the collected numbers at the end of a run when asked to:
+
+    --report run.json        JSON run report
+    --prometheus run.prom    Prometheus textfile (node_exporter textfile collector)
+
+Stages nest: when "generate" runs inside "translate", both count the same
+seconds. Stages entered from several threads (Ollama requests) add up busy
+time, which can exceed the run's wall time.
+"""
+
+import os
+import sys
+import json
+import time
+import resource
+import threading
+from contextlib import contextmanager
+
+from journal import atomic_open
+
+PROMETHEUS_PREFIX = 'ayamatma_translation'
+REPORT_VERSION = 1
+
+
+def reset_peak_rss():
+    """start a new RSS high-water mark (Linux); elsewhere the process peak is reported"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def _proc_kb(path, field):
+    try:
+        with open(path, 'r') as f:
+            for line in f:
+                if line.startswith(field):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def peak_rss_mb():
+    kb = _proc_kb('/proc/self/status', 'VmHWM:')
+    if kb is not None:
+        return kb / 1024
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def rss_mb():
+    """current resident set size; the peak so far where that is all the OS reports"""
+    kb = _proc_kb('/proc/self/status', 'VmRSS:')
+    return kb / 1024 if kb is not None else peak_rss_mb()
+
+
+def available_memory_mb():
+    """memory the system can still hand out without swapping, or None if unknown"""
+    kb = _proc_kb('/proc/meminfo', 'MemAvailable:')
+    if kb is not None:
+        return kb / 1024
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+class RunMetrics:
+    def __init__(self, run=None):
+        self.run = run or os.path.splitext(os.path.basename(sys.argv[0] or 'python'))[0]
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """drop everything collected so far, e.g. in a forked worker that reports its own share"""
+        self.stages = {}      # name -> [calls, seconds]
+        self.counters = {}
+        self.tokens = {'in': 0, 'padded': 0, 'out': 0}
+        self.batches = 0
+        self.peak_rss_mb = 0.0  # largest peak noted or reported by merged workers
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                totals = self.stages.setdefault(name, [0, 0.0])
+                totals[0] += 1
+                totals[1] += elapsed
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def record_batch(self, lengths, output_tokens=0):
+        """
+        One model batch: lengths are the source token counts of its items,
+        which the encoder sees padded to the longest of them.
+        """
+        lengths = list(lengths)
+        with self._lock:
+            self.batches += 1
+            self.tokens['in'] += sum(lengths)
+            self.tokens['padded'] += max(lengths, default=0) * len(lengths)
+            self.tokens['out'] += output_tokens
+
+    def record_output(self, output_tokens):
+        with self._lock:
+            self.tokens['out'] += output_tokens
+
+    def note_peak_rss(self, mb):
+        """a high-water mark seen by code that resets the process's own (e.g. per batch)"""
+        with self._lock:
+            self.peak_rss_mb = max(self.peak_rss_mb, mb)
+
+    def padding_ratio(self):
+        padded = self.tokens['padded']
+        return (padded - self.tokens['in']) / padded if padded else 0.0
+
+    def snapshot(self):
+        """the mergeable part of the metrics, e.g. to send back from a worker process"""
+        with self._lock:
+            return {
+                'stages': {k: list(v) for k, v in self.stages.items()},
+                'counters': dict(self.counters),
+                'tokens': dict(self.tokens),
+                'batches': self.batches,
+                'peak_rss_mb': max(self.peak_rss_mb, peak_rss_mb()),
+            }
+
+    def merge(self, snapshot):
+        """add a worker's snapshot() into these totals"""
+        with self._lock:
+            for name, (calls, seconds) in snapshot['stages'].items():
+                totals = self.stages.setdefault(name, [0, 0.0])
+                totals[0] += calls
+                totals[1] += seconds
+            for name, n in snapshot['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + n
+            for key, n in snapshot['tokens'].items():
+                self.tokens[key] += n
+            self.batches += snapshot['batches']
+            self.peak_rss_mb = max(self.peak_rss_mb, snapshot['peak_rss_mb'])
+
+    def report(self):
+        snapshot = self.snapshot()
+        elapsed = time.perf_counter() - self._start
+        stages = {
+            name: {'calls': calls, 'seconds': round(seconds, 4)}
+            for name, (calls, seconds) in sorted(snapshot['stages'].items(), key=lambda s: -s[1][1])
+        }
+        report = {
+            'version': REPORT_VERSION,
+            'run': self.run,
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S%z', time.localtime(self.started)),
+            'seconds': round(elapsed, 3),
+            'stages': stages,
+            'counters': snapshot['counters'],
+            'tokens': {
+                **snapshot['tokens'],
+                'padding_ratio': round(self.padding_ratio(), 4),
+                'out_per_second': round(snapshot['tokens']['out'] / elapsed, 1) if elapsed else 0.0,
+            },
+            'batches': snapshot['batches'],
+            'peak_rss_mb': round(snapshot['peak_rss_mb'], 1),
+        }
+        # greedy-first decoding (decoding.py): share of outputs that needed beam search
+        greedy = snapshot['counters'].get('greedy_outputs')
+        if greedy:
+            report['escalated_fraction'] = round(snapshot['counters'].get('escalated_outputs', 0) / greedy, 4)
+        # run-wide deduplication (dedup.py): segments found per unique segment translated
+        unique = snapshot['counters'].get('dedup_unique')
+        if unique:
+            report['dedup_ratio'] = round(snapshot['counters']['dedup_segments'] / unique, 4)
+        return report
+
+    def write_json(self, path, report=None):
+        with atomic_open(path) as f:
+            json.dump(report or self.report(), f, ensure_ascii=False, indent=2)
+            f.write('\n')
+
+    def write_prometheus(self, path, report=None):
+        """gauges for the last run, labelled with the run name, in text exposition format"""
+        report = report or self.report()
+        run = _label(report['run'])
+        p = PROMETHEUS_PREFIX
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP {p}_{name} {help_text}')
+            lines.append(f'# TYPE {p}_{name} {kind}')
+            for labels, value in samples:
+                extra = ''.join(f',{k}="{_label(v)}"' for k, v in labels.items())
+                lines.append(f'{p}_{name}{{run="{run}"{extra}}} {value}')
+
+        metric('last_run_timestamp_seconds', 'gauge', 'Unix time the run started.',
+               [({}, int(self.started))])
+        metric('run_seconds', 'gauge', 'Wall time of the run.',
+               [({}, report['seconds'])])
+        metric('stage_seconds', 'gauge', 'Time spent in each stage.',
+               [({'stage': name}, s['seconds']) for name, s in report['stages'].items()])
+        metric('stage_calls', 'gauge', 'Times each stage was entered.',
+               [({'stage': name}, s['calls']) for name, s in report['stages'].items()])
+        metric('count', 'gauge', 'Run counters.',
+               [({'name': name}, n) for name, n in sorted(report['counters'].items())])
+        metric('tokens', 'gauge', 'Source tokens in, padded source tokens and generated tokens out.',
+               [({'kind': kind}, report['tokens'][kind]) for kind in ('in', 'padded', 'out')])
+        metric('padding_ratio', 'gauge', 'Share of the padded encoder input that was padding.',
+               [({}, report['tokens']['padding_ratio'])])
+        metric('batches', 'gauge', 'Model batches run.',
+               [({}, report['batches'])])
+        metric('peak_rss_bytes', 'gauge', 'Resident set size high-water mark.',
+               [({}, int(report['peak_rss_mb'] * 1024 * 1024))])
+        if 'escalated_fraction' in report:
+            metric('escalated_fraction', 'gauge', 'Share of greedy outputs re-decoded with beam search.',
+                   [({}, report['escalated_fraction'])])
+        if 'dedup_ratio' in report:
+            metric('dedup_ratio', 'gauge', 'Source segments per unique segment translated.',
+                   [({}, report['dedup_ratio'])])
+
+        with atomic_open(path) as f:
+            f.write('\n'.join(lines) + '\n')
+
+    def summary(self):
+        report = self.report()
+        top = ', '.join(f"{name} {s['seconds']:.1f}s" for name, s in list(report['stages'].items())[:5])
+        tokens = report['tokens']
+        extra = ''
+        if 'escalated_fraction' in report:
+            extra = f"; {100 * report['escalated_fraction']:.1f}% of greedy outputs escalated to beam search"
+        if 'dedup_ratio' in report:
+            extra += f"; dedup ratio {report['dedup_ratio']:.2f}x"
+        return (f"Run: {report['seconds']:.1f}s ({top}); {tokens['in']} tokens in, {tokens['out']} out, "
+                f"{100 * tokens['padding_ratio']:.1f}% padding; peak RSS {report['peak_rss_mb']:.0f} MB{extra}")
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+metrics = RunMetrics()
+
+
+def add_arguments(parser):
+    parser.add_argument("--report", metavar="PATH", help="Write a JSON run report with per-stage timings, token counts and peak RSS")
+    parser.add_argument("--prometheus", metavar="PATH", help="Also write the run report as a Prometheus textfile (.prom)")
+
+
+def write_reports(args, memory=None):
+    """end-of-run output: write whatever add_arguments() asked for; memory adds its hit/miss counters"""
+    if memory is not None:
+        metrics.counters['memory_hits'] = memory.hits
+        metrics.counters['memory_misses'] = memory.misses
+    # segmenter.run_chunked() only counts; the total is printed once per run
+    chunked = metrics.counters.get('chunked_texts')
+    if chunked:
+        print(f"Split {chunked} long texts into sentence chunks "
+              f"({metrics.counters.get('chunk_pieces', 0)} pieces translated)")
+    if not (getattr(args, 'report', None) or getattr(args, 'prometheus', None)):
+        return
+    report = metrics.report()
+    if args.report:
+        metrics.write_json(args.report, report)
+        print(f"Run report: {args.report}")
+    if args.prometheus:
+        metrics.write_prometheus(args.prometheus, report)
+        print(f"Prometheus textfile: {args.prometheus}")
+    print(metrics.summary())
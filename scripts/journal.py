@@ -0,0 +1,101 @@
+"""
+Crash-safety helpers for the dictionary scripts.
+
+Each completed batch is appended to a write-ahead journal (one JSON record per
+line, fsynced) before the split file itself is touched. The split file is only
+ever replaced with an atomic temp-file-plus-rename, and the journal is removed
+once that has happened. After a crash or Ctrl-C, --resume replays the journal
+so finished batches are not translated again.
+
+Records are keyed by a hash of the entry's Telugu source text rather than its
+position, so a replay never lands on the wrong entry if the file was edited.
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+from contextlib import contextmanager
+
+
+def source_key(text):
+    return hashlib.sha1(text.strip().encode('utf-8')).hexdigest()
+
+
+def _target_mode(path):
+    """permissions the replaced file should keep: the existing file's, else the umask default"""
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+@contextmanager
+def atomic_open(path):
+    """text file that replaces path only if the with-block completes"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates the file 0600, which os.replace would carry over
+        os.chmod(tmp_path, _target_mode(path))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def atomic_write_json(path, data):
+    """write JSON to a temp file in the same directory, fsync, then rename over path"""
+    with atomic_open(path) as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def journal_path(file_path, task):
+    """journals live in a hidden .journal/ directory next to the split files"""
+    directory = os.path.join(os.path.dirname(os.path.abspath(file_path)), '.journal')
+    return os.path.join(directory, f"{os.path.basename(file_path)}.{task}.jsonl")
+
+
+class BatchJournal:
+    def __init__(self, path):
+        self.path = path
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def append(self, records):
+        """durably record a finished batch: [{"key", "field", "value"}, ...]"""
+        if not records:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def replay(self):
+        """{(key, field): value} for every complete record; a torn last line is ignored"""
+        results = {}
+        if not self.exists():
+            return results
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # the process died mid-write; everything before it is intact
+                    break
+                results[(record['key'], record['field'])] = record['value']
+        return results
+
+    def remove(self):
+        if self.exists():
+            os.remove(self.path)
@@ -0,0 +1,108 @@
+"""
+Incremental JSON for the dictionary files.
+
+The merged dictionary is {"sources": {...}, "entries": [...]}. Rather than
+build the whole thing in memory and json.dump it, ArrayWriter writes the small
+leading keys, then each entry as it arrives, and read_leading_value pulls
+"sources" off the head of the existing file without parsing the entries.
+
+Output is byte-for-byte what json.dump(data, f, ensure_ascii=False, indent=2)
+writes. If orjson is installed it serializes each entry; it emits the same
+text for the strings, lists and dicts the dictionary is made of.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:  # optional, pip install orjson
+    orjson = None
+
+READ_CHUNK = 1 << 16
+MAX_HEAD = 1 << 24  # give up on a streaming read after this many characters
+
+
+def dumps(value):
+    """indent=2, ensure_ascii=False JSON text"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, option=orjson.OPT_INDENT_2).decode('utf-8')
+        except TypeError:
+            pass  # e.g. ints beyond 64 bits; the stdlib copes
+    return json.dumps(value, ensure_ascii=False, indent=2)
+
+
+def dumps_compact(value):
+    """no whitespace, ensure_ascii=False JSON text; for files only machines read"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(value).decode('utf-8')
+        except TypeError:
+            pass
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+def _indent(text, prefix):
+    return text.replace('\n', '\n' + prefix)
+
+
+class ArrayWriter:
+    """
+    Write {<head keys>..., array_key: [item, item, ...]} to an open text file
+    one item at a time. Use as a context manager, or call close().
+    """
+
+    def __init__(self, f, head, array_key):
+        self.f = f
+        self.count = 0
+        f.write('{\n')
+        for key, value in head.items():
+            f.write(f'  {json.dumps(key, ensure_ascii=False)}: {_indent(dumps(value), "  ")},\n')
+        f.write(f'  {json.dumps(array_key, ensure_ascii=False)}: [')
+
+    def write(self, item):
+        self.f.write(',\n    ' if self.count else '\n    ')
+        self.f.write(_indent(dumps(item), '    '))
+        self.count += 1
+
+    def close(self):
+        self.f.write('\n  ]\n}' if self.count else ']\n}')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+
+
+def read_leading_value(path, key, default=None):
+    """
+    Value of a top-level key that comes before any large array in the file,
+    reading only as far as its end. Falls back to a full parse if the key is
+    not where we expect it.
+    """
+    decoder = json.JSONDecoder()
+    marker = json.dumps(key, ensure_ascii=False)
+    buf = ''
+    with open(path, 'r', encoding='utf-8') as f:
+        while True:
+            chunk = f.read(READ_CHUNK)
+            buf += chunk
+            at = buf.find(marker)
+            if at != -1:
+                colon = buf.find(':', at + len(marker))
+                if colon != -1:
+                    start = colon + 1
+                    while start < len(buf) and buf[start].isspace():
+                        start += 1
+                    try:
+                        value, _ = decoder.raw_decode(buf, start)
+                        return value
+                    except json.JSONDecodeError:
+                        pass  # value continues past what we have read so far
+            if not chunk or len(buf) > MAX_HEAD:
+                break
+
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f).get(key, default)
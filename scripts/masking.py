@@ -0,0 +1,214 @@
+"""
+Placeholder masking of markup and Sanskrit before translation.
+
+Essay paragraphs carry inline <Term> components, <span> and other tags, and
+IAST Sanskrit, none of which may change in translation. Sent as they are,
+they cost tokens and come back mangled (a Term's iast attribute translated,
+a closing tag dropped, ātman turned into "soul"). mask() swaps each such span
+for a compact numbered placeholder, [1], [2], ..., and unmask() puts the
+originals back, but only if every placeholder survived exactly once.
+
+Masked whole:
+
+- <Term ...>...</Term> and <span class="verse-ref" ...>...</span> elements,
+- emphasized runs (*...*) of Sanskrit: with IAST diacritics or only Terms
+  inside, and no English function words,
+- runs of words with IAST diacritics (Kaṭha Upaniṣad, Vedānta),
+- anything that already looks like a placeholder, so it comes back verbatim.
+
+Other tags are masked one by one, so the text between <em> and </em> is still
+translated. Spans separated only by spaces share one placeholder.
+
+translate_masked() runs a translate function over masked texts. Where a
+placeholder was lost, duplicated or invented, only that text is translated
+again piecewise: the prose between its placeholders goes to the model on its
+own, and the spans are put back in between.
+"""
+
+import re
+import unicodedata
+from collections import namedtuple
+
+from instrumentation import metrics
+
+# bump when masking changes, so cached translations of masked text are not reused
+MASK_VERSION = 1
+
+# placeholders as the model may return them: [3], [ 3 ], [३], [౩]
+PLACEHOLDER = re.compile(r'\[\s*([0-9०-९౦-౯]{1,3})\s*\]')
+
+IAST_LETTERS = 'āīūṛṝḷḹṅñṭḍṇśṣṃḥĀĪŪṚṜḶḸṄÑṬḌṆŚṢṂḤ'
+
+# elements whose content is never translated
+VERBATIM_ELEMENTS = (
+    r'<Term\b[^>]*>.*?</Term>',
+    r'<span\b[^>]*\bclass="[^"]*\bverse-ref\b[^"]*"[^>]*>.*?</span>',
+)
+
+ENGLISH_WORDS = frozenset("""
+a an the is are was were be been of and or but not no to in on at by for with from as
+that this these those it its he she they we you i his her their our my what which who
+""".split())
+
+_IAST_WORD = r"[\w'’]*[" + IAST_LETTERS + r"][\w'’]*"
+_SPAN = re.compile(
+    r'(?P<verbatim>' + '|'.join(VERBATIM_ELEMENTS) + r')'
+    r'|(?P<tag></?[A-Za-z][\w.:-]*(?:\s[^<>]*?)?/?>)'
+    r'|(?P<emphasis>(?P<mark>\*{1,2})(?=\S)(?P<inner>[^*\n]+?)(?<=\S)(?P=mark))'
+    r'|(?P<iast>' + _IAST_WORD + r'(?:[ -]' + _IAST_WORD + r')*)'
+    r'|(?P<placeholder>' + PLACEHOLDER.pattern + r')',
+    re.DOTALL,
+)
+_TERM = re.compile(VERBATIM_ELEMENTS[0], re.DOTALL)
+_WORD = re.compile(r"[A-Za-z" + IAST_LETTERS + r"'’]+")
+_LETTER = re.compile(r'[^\W\d_]')
+
+Masked = namedtuple('Masked', ['text', 'spans'])
+
+
+def _sanskrit_emphasis(inner):
+    """*...* to leave alone: Sanskrit in IAST, or nothing but Terms"""
+    if _TERM.sub('', inner).strip(' ,;:—-') == '':
+        return True
+    words = [w.lower() for w in _WORD.findall(_TERM.sub('', inner))]
+    return (any(c in IAST_LETTERS for c in inner)
+            and not any(w in ENGLISH_WORDS for w in words))
+
+
+def _find_spans(text, start=0, end=None):
+    """(start, end) of every protected span in text[start:end], in order"""
+    found = []
+    for match in _SPAN.finditer(text, start, len(text) if end is None else end):
+        if match.group('emphasis') is not None:
+            if not _sanskrit_emphasis(match.group('inner')):
+                # English emphasis: only what is inside it is protected
+                found.extend(_find_spans(text, match.start('inner'), match.end('inner')))
+                continue
+        found.append((match.start(), match.end()))
+    return found
+
+
+def mask(text):
+    spans = []
+    out = []
+    last = 0
+    for start, end in _find_spans(text):
+        if spans and not text[last:start].strip(' '):
+            # only spaces since the previous span: extend it
+            spans[-1] += text[last:end]
+        else:
+            out.append(text[last:start])
+            spans.append(text[start:end])
+            out.append(f'[{len(spans)}]')
+        last = end
+    out.append(text[last:])
+    return Masked(''.join(out), spans)
+
+
+def _placeholder_number(match):
+    return int(''.join(str(unicodedata.digit(c)) for c in match.group(1)))
+
+
+def unmask(translated, spans):
+    """translated with the spans restored, or None unless each placeholder appears exactly once"""
+    if not spans:
+        return translated
+    numbers = sorted(_placeholder_number(m) for m in PLACEHOLDER.finditer(translated))
+    if numbers != list(range(1, len(spans) + 1)):
+        return None
+    return PLACEHOLDER.sub(lambda m: spans[_placeholder_number(m) - 1], translated)
+
+
+def has_prose(masked):
+    """False when nothing but placeholders, spaces and punctuation is left"""
+    return bool(_LETTER.search(PLACEHOLDER.sub('', masked.text)))
+
+
+def _unmask_output(output, spans):
+    # outputs are strings, or {target: string} for multi-target translators
+    if isinstance(output, dict):
+        return {key: unmask(value, spans) for key, value in output.items()}
+    return unmask(output, spans)
+
+
+def _is_complete(output):
+    if isinstance(output, dict):
+        return all(value is not None for value in output.values())
+    return output is not None
+
+
+def _fragments(masked):
+    """[(leading space, prose, trailing space) or span] for piecewise translation"""
+    parts = PLACEHOLDER.split(masked.text)
+    pieces = []
+    for k, part in enumerate(parts):
+        if k % 2:
+            pieces.append(masked.spans[int(part) - 1])
+            continue
+        core = part.strip()
+        if core and _LETTER.search(core):
+            lead = part[:len(part) - len(part.lstrip())]
+            trail = part[len(part.rstrip()):]
+            pieces.append((lead, core, trail))
+        elif part:
+            pieces.append(part)
+    return pieces
+
+
+def _translate_piecewise(masked_texts, translate_fn, keys):
+    fragments = [_fragments(m) for m in masked_texts]
+    prose = list(dict.fromkeys(p[1] for pieces in fragments for p in pieces if isinstance(p, tuple)))
+    translated = dict(zip(prose, translate_fn(prose))) if prose else {}
+
+    def build(pieces, key):
+        out = ''
+        for piece in pieces:
+            if isinstance(piece, tuple):
+                lead, core, trail = piece
+                value = translated[core] if key is None else translated[core][key]
+                out += lead + value.strip() + trail
+            else:
+                out += piece
+        return out
+
+    if keys is None:
+        return [build(pieces, None) for pieces in fragments]
+    return [{key: build(pieces, key) for key in keys} for pieces in fragments]
+
+
+def translate_masked(texts, translate_fn, keys=None):
+    """
+    translate_fn(list of texts) -> one output per text: a string, or with keys
+    (e.g. target languages) a {key: string}. Returns outputs for texts with
+    every masked span intact.
+    """
+    masked = [mask(text) for text in texts]
+    results = [None] * len(texts)
+    send = []
+    for i, (text, m) in enumerate(zip(texts, masked)):
+        if has_prose(m):
+            send.append(i)
+        else:
+            # only markup and Sanskrit: nothing for the model to do
+            results[i] = text if keys is None else {key: text for key in keys}
+    metrics.count("masked_spans", sum(len(m.spans) for m in masked))
+    metrics.count("masked_skipped", len(texts) - len(send))
+
+    failed = []
+    outputs = translate_fn([masked[i].text for i in send]) if send else []
+    for i, output in zip(send, outputs):
+        results[i] = _unmask_output(output, masked[i].spans)
+        if not _is_complete(results[i]):
+            failed.append(i)
+
+    if failed:
+        print(f"Placeholders lost in {len(failed)} of {len(send)} segments; re-translating those piecewise")
+        metrics.count("placeholder_retries", len(failed))
+        retried = _translate_piecewise([masked[i] for i in failed], translate_fn, keys)
+        for i, output in zip(failed, retried):
+            if keys is None:
+                results[i] = output
+            else:
+                # keep the targets whose placeholders did survive
+                results[i] = {key: results[i][key] if results[i][key] is not None else output[key] for key in keys}
+    return results
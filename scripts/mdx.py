@@ -0,0 +1,299 @@
+"""
+Single-pass tokenizer for the MDX content collections.
+
+tokenize() reads a page once, front to back, and cuts it into typed tokens
+whose texts, joined, give back the page byte for byte. The kinds:
+
+    frontmatter  the --- block, except for scalars to translate
+    scalar       a frontmatter value to translate, quotes included
+    esm          import/export blocks
+    code         fenced code blocks, fences included
+    jsx          tags, {expressions} and <!-- comments -->, also multi-line ones
+    attribute    a JSX attribute value to translate (translation="..."), quotes included
+    heading      the text of a # heading
+    quote        the text of a > blockquote line
+    prose        the text of a paragraph or list item line
+    markup       everything else: indentation, markers, blank lines, newlines
+
+Only the translatable kinds (TRANSLATED) go to the model, through
+segments(); render() puts translations in their place and copies every
+other token through untouched. A line that opens with tags (<span
+class="pullquote">, <p>, <summary>) has them split off as jsx, as long as
+they are not inline elements that masking.py keeps whole, like <Term>.
+Markup left inside prose (an inline <Term>, <em>) is masking.py's job.
+
+Lines stay the unit of prose, as they were before, so segment hashes in
+existing translation manifests still match.
+"""
+
+import re
+from collections import namedtuple
+
+from masking import VERBATIM_ELEMENTS
+
+Token = namedtuple('Token', ['kind', 'text'])
+
+TRANSLATED = frozenset(('scalar', 'attribute', 'heading', 'quote', 'prose'))
+
+# JSX attributes whose values are text for the reader
+TRANSLATED_ATTRIBUTES = ('translation', 'alt')
+
+_LINE = re.compile(r'[^\n]*\n|[^\n]+')
+_LETTER = re.compile(r'[^\W\d_]')
+_FENCE = re.compile(r'[ \t]*(`{3,}|~{3,})')
+_FRONTMATTER_FIELD = re.compile(r'([ \t]*)([\w-]+)(:[ \t]*)(.*?)([ \t]*\n?)$', re.DOTALL)
+_HEADING = re.compile(r'[ \t]{0,3}#{1,6}(?:[ \t]+|(?=\n)|$)')
+_QUOTE = re.compile(r'[ \t]*(?:>[ \t]?)+')
+_LIST_ITEM = re.compile(r'[ \t]*(?:[-*+]|\d{1,9}[.)])[ \t]+')
+_BREAK = re.compile(r'[ \t]*([-*_])(?:[ \t]*\1){2,}[ \t]*\n?$')
+_TAG = re.compile(r'</?[A-Za-z][\w.:-]*(?:"[^"]*"|\'[^\']*\'|\{[^{}]*\}|[^"\'{}<>])*>')
+_TAG_NAME = re.compile(r'</?([A-Za-z][\w.:-]*)')
+_VERBATIM = re.compile('|'.join(VERBATIM_ELEMENTS), re.DOTALL)
+_ATTRIBUTE = re.compile(r'(\b(?:' + '|'.join(TRANSLATED_ATTRIBUTES) + r')=)("[^"]*"|\'[^\']*\')')
+
+
+def _has_text(text):
+    return bool(_LETTER.search(text))
+
+
+def _emit(tokens, kind, text):
+    """kind for the stripped core of text, markup for the whitespace around it"""
+    core = text.strip()
+    if not core:
+        if text:
+            tokens.append(Token('markup', text))
+        return
+    if kind in TRANSLATED and not _has_text(core):
+        kind = 'markup'
+    start = text.index(core)
+    if start:
+        tokens.append(Token('markup', text[:start]))
+    tokens.append(Token(kind, core))
+    if start + len(core) < len(text):
+        tokens.append(Token('markup', text[start + len(core):]))
+
+
+def _emit_jsx(tokens, text):
+    """a run of JSX, with the values of TRANSLATED_ATTRIBUTES as attribute tokens"""
+    last = 0
+    for match in _ATTRIBUTE.finditer(text):
+        if not _has_text(match.group(2)):
+            continue
+        tokens.append(Token('jsx', text[last:match.start(2)]))
+        tokens.append(Token('attribute', match.group(2)))
+        last = match.end(2)
+    if last < len(text):
+        tokens.append(Token('jsx', text[last:]))
+
+
+def _frontmatter_end(content):
+    """index just past the closing --- line, or 0 if content has no frontmatter"""
+    first = _LINE.match(content)
+    if not first or first.group().rstrip() != '---':
+        return 0
+    pos = first.end()
+    for line in _LINE.finditer(content, pos):
+        if line.group().rstrip() == '---':
+            return line.end()
+    return 0
+
+
+def _tokenize_frontmatter(tokens, text, fields):
+    for line in _LINE.findall(text):
+        match = _FRONTMATTER_FIELD.match(line)
+        value = match.group(4) if match else ''
+        if not (match and match.group(2) in fields and value and value[0] not in '|>[{&*!#'
+                and _has_text(value)):
+            tokens.append(Token('frontmatter', line))
+            continue
+        tokens.append(Token('frontmatter', line[:match.start(4)]))
+        tokens.append(Token('scalar', value))
+        tokens.append(Token('frontmatter', line[match.end(4):]))
+
+
+def _tokenize_tag_line(tokens, content, pos, end):
+    """
+    A line that opens with tags: the tags (which may run over several lines)
+    become jsx, the text after them prose. Returns where the line ends.
+    """
+    opened = []
+    while True:
+        space = re.compile(r'[ \t]*').match(content, pos).end()
+        tag = _TAG.match(content, space)
+        if not tag or _VERBATIM.match(content, space):
+            break
+        if space > pos:
+            tokens.append(Token('markup', content[pos:space]))
+        _emit_jsx(tokens, tag.group())
+        name = _TAG_NAME.match(tag.group()).group(1)
+        if not tag.group().startswith('</') and not tag.group().endswith('/>'):
+            opened.append(name)
+        pos = tag.end()
+        if pos > end:
+            # the tag ran over several lines; its line ends further down
+            newline = content.find('\n', pos)
+            end = len(content) if newline == -1 else newline + 1
+
+    rest = content[pos:end]
+    # closing tags at the end of the line that match ones opened at its start
+    closing = ''
+    while opened:
+        match = re.search(r'</' + re.escape(opened[-1]) + r'\s*>[ \t]*\n?$', rest)
+        if not match:
+            break
+        closing = rest[match.start():] + closing
+        rest = rest[:match.start()]
+        opened.pop()
+    _emit(tokens, 'prose', rest)
+    if closing:
+        newline = closing.endswith('\n')
+        _emit_jsx(tokens, closing.rstrip('\n'))
+        if newline:
+            tokens.append(Token('markup', '\n'))
+    return end
+
+
+def _block_end(content, pos, opener, closer):
+    """index past the line where opener/closer counts balance, from pos"""
+    depth = 0
+    for line in _LINE.finditer(content, pos):
+        depth += line.group().count(opener) - line.group().count(closer)
+        if depth <= 0:
+            return line.end()
+    return len(content)
+
+
+def tokenize(content, fields=()):
+    """the tokens of an MDX page; fields are the frontmatter keys whose values are translated"""
+    tokens = []
+    pos = _frontmatter_end(content)
+    _tokenize_frontmatter(tokens, content[:pos], frozenset(fields))
+
+    fence = None
+    while pos < len(content):
+        line = _LINE.match(content, pos)
+        end = line.end()
+        text = line.group()
+        stripped = text.strip()
+
+        if fence is not None:
+            tokens.append(Token('code', text))
+            if stripped.startswith(fence) and not stripped.strip(fence[0]):
+                fence = None
+            pos = end
+            continue
+
+        fence_match = _FENCE.match(text)
+        if fence_match:
+            fence = fence_match.group(1)
+            tokens.append(Token('code', text))
+        elif not stripped:
+            tokens.append(Token('markup', text))
+        elif text.startswith(('import ', 'export ')):
+            # MDX ESM runs to the next blank line
+            blank = re.compile(r'\n[ \t]*\n').search(content, pos)
+            end = blank.start() + 1 if blank else len(content)
+            tokens.append(Token('esm', content[pos:end]))
+        elif stripped.startswith('<!--'):
+            close = content.find('-->', pos)
+            end = _LINE.match(content, close).end() if close != -1 else len(content)
+            tokens.append(Token('jsx', content[pos:end]))
+        elif stripped.startswith('{'):
+            end = _block_end(content, pos, '{', '}')
+            tokens.append(Token('jsx', content[pos:end]))
+        elif stripped.startswith('<') and _TAG.match(content, pos + text.index('<')) \
+                and not _VERBATIM.match(content, pos + text.index('<')):
+            end = _tokenize_tag_line(tokens, content, pos, end)
+        elif _BREAK.match(text):
+            tokens.append(Token('markup', text))
+        else:
+            for pattern, kind in ((_HEADING, 'heading'), (_QUOTE, 'quote'), (_LIST_ITEM, 'prose')):
+                marker = pattern.match(text)
+                if marker:
+                    tokens.append(Token('markup', marker.group()))
+                    _emit(tokens, kind, text[marker.end():])
+                    break
+            else:
+                _emit(tokens, 'prose', text)
+        pos = end
+    return tokens
+
+
+def text_of(token):
+    """what the model sees of a translatable token: scalars and attributes without their quotes"""
+    text = token.text
+    if token.kind not in ('scalar', 'attribute') or len(text) < 2 or text[0] not in '"\'' or text[-1] != text[0]:
+        return text
+    if text[0] == "'":
+        return text[1:-1].replace("''", "'") if token.kind == 'scalar' else text[1:-1]
+    if token.kind == 'scalar':
+        return text[1:-1].replace('\\"', '"').replace('\\\\', '\\')
+    return text[1:-1]
+
+
+def _requote(token, translated):
+    """translated, quoted the way token's value was"""
+    if token.kind not in ('scalar', 'attribute'):
+        return translated
+    quote = token.text[0] if token.text[:1] in ('"', "'") else '"'
+    if token.kind == 'attribute':
+        # JSX strings have no escapes; swap in the other quote
+        other = "'" if quote == '"' else '"'
+        return quote + translated.replace(quote, other) + quote
+    if quote == "'":
+        return "'" + translated.replace("'", "''") + "'"
+    return '"' + translated.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def segments(tokens):
+    """[(token index, text)] of every token the model should translate"""
+    return [(i, text_of(token)) for i, token in enumerate(tokens) if token.kind in TRANSLATED]
+
+
+def render(tokens, translations=None):
+    """the page again, with translations ({token index: text}) in place of those tokens"""
+    translations = translations or {}
+    return ''.join(
+        _requote(token, translations[i]) if i in translations else token.text
+        for i, token in enumerate(tokens)
+    )
+
+
+def paragraphs(tokens):
+    """
+    (first line number, text) of each paragraph of headings, quotes and
+    prose; blank lines, code, ESM and frontmatter end a paragraph
+    """
+    line = 1
+    at_line_start = True
+    start, lines = None, []
+    for token in tokens:
+        blank = token.kind == 'markup' and at_line_start and not token.text.strip() and token.text.endswith('\n')
+        if blank or token.kind in ('code', 'esm', 'frontmatter', 'scalar'):
+            if lines:
+                yield start, '\n'.join(lines)
+            start, lines = None, []
+        elif token.kind in ('heading', 'quote', 'prose'):
+            if not lines:
+                start = line
+            lines.append(token.text)
+        line += token.text.count('\n')
+        at_line_start = token.text.endswith('\n')
+    if lines:
+        yield start, '\n'.join(lines)
+
+
+def frontmatter_length(tokens):
+    """how many leading tokens make up the frontmatter"""
+    n = 0
+    while n < len(tokens) and tokens[n].kind in ('frontmatter', 'scalar'):
+        n += 1
+    return n
+
+
+def render_page(tokens, translations=None):
+    """render() as (frontmatter, body), for callers that rewrite the frontmatter further"""
+    translations = translations or {}
+    n = frontmatter_length(tokens)
+    body = {i - n: text for i, text in translations.items() if i >= n}
+    return render(tokens[:n], translations), render(tokens[n:], body)
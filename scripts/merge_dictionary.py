@@ -7,12 +7,18 @@ Also populate missing IAST and Devanagari from Telugu terms
 import json
 import os
 import re
-from indic_transliteration import sanscript
-from indic_transliteration.sanscript import transliterate
+import argparse
+from functools import lru_cache
+
+from journal import atomic_open
+from json_stream import ArrayWriter, read_leading_value
+from dictionary_shards import EXPORT_DIR, ShardExporter
+from transliteration import TELUGU, IAST, DEVANAGARI, transliterate, transliterate_batch
 
 SPLIT_DIR = os.path.join(os.path.dirname(__file__), '..', 'src', 'data', 'dictionary_split')
 MAIN_FILE = os.path.join(os.path.dirname(__file__), '..', 'src', 'data', 'dictionary.json')
 
+@lru_cache(maxsize=None)
 def clean_term(term):
     """extract just the base term (before colon or slash)"""
     # take first part before colon, slash, or space-slash
@@ -23,86 +29,76 @@ def clean_term(term):
 
 def telugu_to_iast(telugu_text):
     """convert Telugu script to IAST"""
-    try:
-        clean = clean_term(telugu_text)
-        if not clean:
-            return ""
-        iast = transliterate(clean, sanscript.TELUGU, sanscript.IAST)
-        return iast.lower()
-    except Exception as e:
-        print(f"Error converting '{telugu_text}': {e}")
-        return ""
+    return transliterate(clean_term(telugu_text), TELUGU, IAST).lower()
 
 def telugu_to_devanagari(telugu_text):
     """convert Telugu script to Devanagari"""
-    try:
-        clean = clean_term(telugu_text)
-        if not clean:
-            return ""
-        deva = transliterate(clean, sanscript.TELUGU, sanscript.DEVANAGARI)
-        return deva
-    except Exception as e:
-        print(f"Error converting '{telugu_text}': {e}")
-        return ""
-
-def merge_dictionaries():
-    """merge all split files and populate missing fields"""
-
-    # load existing main file to get sources
-    with open(MAIN_FILE, 'r', encoding='utf-8') as f:
-        main_data = json.load(f)
-
-    sources = main_data.get('sources', {})
-    all_entries = []
-
-    # process each split file
-    split_files = sorted([f for f in os.listdir(SPLIT_DIR) if f.endswith('.json')])
+    return transliterate(clean_term(telugu_text), TELUGU, DEVANAGARI)
 
-    for filename in split_files:
-        filepath = os.path.join(SPLIT_DIR, filename)
-        print(f"Processing {filename}...")
+def fill_transliterations(entries):
+    """populate missing IAST and Devanagari, one batch per script"""
+    for field, target in (('iast', IAST), ('devanagari', DEVANAGARI)):
+        todo = [e for e in entries if not e.get(field, '').strip()]
+        converted = transliterate_batch((clean_term(e.get('term', '')) for e in todo), TELUGU, target)
+        for entry, value in zip(todo, converted):
+            entry[field] = value.lower() if target == IAST else value
 
-        with open(filepath, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+STAT_FIELDS = ('iast', 'hindi', 'english')
 
-        entries = data.get('entries', [])
+def merge_dictionaries(export_dir=None):
+    """merge all split files and populate missing fields; optionally export shards too"""
 
-        for entry in entries:
-            term = entry.get('term', '')
+    # only the small "sources" block at the head of the main file is read
+    sources = read_leading_value(MAIN_FILE, 'sources', {})
 
-            # populate missing IAST
-            if not entry.get('iast', '').strip():
-                entry['iast'] = telugu_to_iast(term)
+    stats = dict.fromkeys(STAT_FIELDS, 0)
+    total = 0
+    exporter = ShardExporter(export_dir) if export_dir else None
+
+    # process each split file; only one is held in memory at a time
+    split_files = sorted([f for f in os.listdir(SPLIT_DIR) if f.endswith('.json')])
 
-            # populate missing devanagari
-            if not entry.get('devanagari', '').strip():
-                entry['devanagari'] = telugu_to_devanagari(term)
+    with atomic_open(MAIN_FILE) as out, ArrayWriter(out, {'sources': sources}, 'entries') as writer:
+        for filename in split_files:
+            filepath = os.path.join(SPLIT_DIR, filename)
+            print(f"Processing {filename}...")
 
-            all_entries.append(entry)
+            with open(filepath, 'r', encoding='utf-8') as f:
+                entries = json.load(f).get('entries', [])
 
-    # build final dictionary
-    final_dict = {
-        'sources': sources,
-        'entries': all_entries
-    }
+            # populate missing IAST and devanagari
+            fill_transliterations(entries)
 
-    # stats
-    total = len(all_entries)
-    with_iast = sum(1 for e in all_entries if e.get('iast', '').strip())
-    with_hindi = sum(1 for e in all_entries if e.get('hindi', '').strip())
-    with_english = sum(1 for e in all_entries if e.get('english', '').strip())
+            for entry in entries:
+                writer.write(entry)
+                if exporter:
+                    exporter.add(entry)
+                total += 1
+                for field in STAT_FIELDS:
+                    if entry.get(field, '').strip():
+                        stats[field] += 1
 
     print(f"\n=== Merge Complete ===")
     print(f"Total entries: {total}")
-    print(f"With IAST: {with_iast} ({100*with_iast/total:.1f}%)")
-    print(f"With Hindi: {with_hindi} ({100*with_hindi/total:.1f}%)")
-    print(f"With English: {with_english} ({100*with_english/total:.1f}%)")
-
-    # save
-    with open(MAIN_FILE, 'w', encoding='utf-8') as f:
-        json.dump(final_dict, f, ensure_ascii=False, indent=2)
+    for field in STAT_FIELDS:
+        label = 'IAST' if field == 'iast' else field.capitalize()
+        print(f"With {label}: {stats[field]} ({100*stats[field]/max(total, 1):.1f}%)")
 
     print(f"\nSaved to {MAIN_FILE}")
 
+    if exporter:
+        manifest, sizes, removed = exporter.finish(sources)
+        count = sum(len(groups) for groups in manifest['shards'].values())
+        print(f"\nExported {count} shards to {export_dir} ({removed} stale removed)")
+        for group, size in sizes.items():
+            print(f"  {group}: {size / 1024:.0f} KB")
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge split dictionary files back into dictionary.json.")
+    parser.add_argument("--export", nargs="?", const=EXPORT_DIR, metavar="DIR",
+                        help=f"Also write content-hashed shards and a manifest (default DIR: {EXPORT_DIR})")
+    args = parser.parse_args()
+    merge_dictionaries(args.export)
+
 if __name__ == "__main__":
-    merge_dictionaries()
+    main()
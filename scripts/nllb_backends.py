@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Inference backends for NLLB-200.
+
+  hf   PyTorch through transformers (default; uses CUDA when available)
+  ct2  CTranslate2 with int8 weights, for CPU-only boxes
+
+Both take the same generation settings and return plain decoded strings, so
+the translation scripts do not care which one they are talking to.
+generate_multi_scored() also returns each output's mean token log-probability,
+which decoding.py uses to decide what is worth a beam search. The ct2
+backend needs a one-time conversion of the Hugging Face checkpoint:
+
+Usage: python scripts/nllb_backends.py convert [--model NAME] [--output DIR] [--quantization int8]
+"""
+
+import os
+import re
+import argparse
+
+from instrumentation import metrics
+
+MODEL_NAME = "facebook/nllb-200-distilled-600M"
+DEFAULT_BACKEND = os.environ.get("AYAMATMA_BACKEND", "hf")
+BACKENDS = ("hf", "ct2")
+
+CT2_ROOT = os.environ.get(
+    "AYAMATMA_CT2_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "ayamatma", "ct2"),
+)
+
+
+def ct2_model_dir(model_name=MODEL_NAME, quantization="int8"):
+    """where the converted copy of model_name lives"""
+    safe = re.sub(r"[^A-Za-z0-9._-]+", "--", model_name)
+    return os.path.join(CT2_ROOT, f"{safe}-{quantization}")
+
+
+def backend_id(name, quantization="int8"):
+    """
+    what the translation memory keys a backend's outputs on: ct2 output
+    depends on the compute type, so int8 and float runs are cached apart
+    """
+    return f"{name}-{quantization}" if name == "ct2" else name
+
+
+class HFBackend:
+    """NLLB through transformers' AutoModelForSeq2SeqLM."""
+
+    name = "hf"
+
+    def __init__(self, model_name=MODEL_NAME, device=None, threads=0):
+        import torch
+        from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+
+        if threads:
+            torch.set_num_threads(threads)
+        self.torch = torch
+        self.model_name = model_name
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.id = self.name
+
+        print(f"Loading model {model_name} on {self.device}...")
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModelForSeq2SeqLM.from_pretrained(model_name).to(self.device)
+        self.model.eval()
+
+    def generate(self, texts, src_lang, tgt_lang, **generation_kwargs):
+        return self.generate_multi(texts, src_lang, [tgt_lang], **generation_kwargs)[tgt_lang]
+
+    def generate_multi(self, texts, src_lang, tgt_langs, **generation_kwargs):
+        """Decode texts into every language in tgt_langs, running the encoder once."""
+        return self._generate(texts, src_lang, tgt_langs, False, generation_kwargs)
+
+    def generate_multi_scored(self, texts, src_lang, tgt_langs, **generation_kwargs):
+        """generate_multi, with each output as (text, mean token log-probability)"""
+        return self._generate(texts, src_lang, tgt_langs, True, generation_kwargs)
+
+    def _generate(self, texts, src_lang, tgt_langs, scored, generation_kwargs):
+        from transformers.modeling_outputs import BaseModelOutput
+
+        self.tokenizer.src_lang = src_lang
+        max_length = generation_kwargs.get("max_length", 512)
+
+        with metrics.stage("tokenize"):
+            inputs = self.tokenizer(
+                texts,
+                return_tensors="pt",
+                padding=True,
+                truncation=True,
+                max_length=max_length
+            ).to(self.device)
+        metrics.record_batch(inputs["attention_mask"].sum(dim=1).tolist())
+
+        outputs = {}
+        with self.torch.no_grad():
+            with metrics.stage("encode"):
+                hidden = self.model.get_encoder()(**inputs).last_hidden_state
+
+            for tgt_lang in tgt_langs:
+                # generate() expands encoder_outputs in place for beam search,
+                # so every target gets its own wrapper around the shared states
+                with metrics.stage("generate"):
+                    generated = self.model.generate(
+                        encoder_outputs=BaseModelOutput(last_hidden_state=hidden),
+                        attention_mask=inputs["attention_mask"],
+                        forced_bos_token_id=self.tokenizer.convert_tokens_to_ids(tgt_lang),
+                        output_scores=scored,
+                        return_dict_in_generate=scored,
+                        **generation_kwargs
+                    )
+                sequences = generated.sequences if scored else generated
+                metrics.record_output(int((sequences != self.tokenizer.pad_token_id).sum()))
+                with metrics.stage("decode"):
+                    outputs[tgt_lang] = self.tokenizer.batch_decode(sequences, skip_special_tokens=True)
+                if scored:
+                    outputs[tgt_lang] = list(zip(outputs[tgt_lang], self._mean_logprobs(generated)))
+
+        return outputs
+
+    def _mean_logprobs(self, generated):
+        # beam search already reports sum(log p) / length; greedy needs it rebuilt from the step scores
+        if getattr(generated, "sequences_scores", None) is not None:
+            return generated.sequences_scores.tolist()
+        steps = self.model.compute_transition_scores(generated.sequences, generated.scores, normalize_logits=True)
+        tokens = generated.sequences[:, -steps.shape[1]:] != self.tokenizer.pad_token_id
+        steps = steps.masked_fill(~tokens, 0.0)
+        return (steps.sum(dim=1) / tokens.sum(dim=1).clamp(min=1)).tolist()
+
+
+class CT2Backend:
+    """NLLB converted to CTranslate2, quantized for CPU inference."""
+
+    name = "ct2"
+
+    def __init__(self, model_name=MODEL_NAME, model_dir=None, quantization="int8", threads=0):
+        import ctranslate2
+        from transformers import AutoTokenizer
+
+        self.model_name = model_name
+        self.device = "cpu"
+        self.id = backend_id(self.name, quantization)
+        model_dir = model_dir or ct2_model_dir(model_name, quantization)
+
+        if not os.path.isdir(model_dir):
+            raise RuntimeError(
+                f"No converted model at {model_dir}. "
+                f"Run: python scripts/nllb_backends.py convert --model {model_name}"
+            )
+
+        print(f"Loading CTranslate2 model from {model_dir} ({quantization})...")
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.translator = ctranslate2.Translator(
+            model_dir,
+            device="cpu",
+            compute_type=quantization,
+            intra_threads=threads or (os.cpu_count() or 1),
+        )
+
+    def generate(self, texts, src_lang, tgt_lang, **generation_kwargs):
+        return self._generate(texts, src_lang, tgt_lang, False, generation_kwargs)
+
+    def _generate(self, texts, src_lang, tgt_lang, scored, generation_kwargs):
+        self.tokenizer.src_lang = src_lang
+        max_length = generation_kwargs.get("max_length", 512)
+
+        with metrics.stage("tokenize"):
+            source = [
+                self.tokenizer.convert_ids_to_tokens(
+                    self.tokenizer.encode(text, truncation=True, max_length=max_length)
+                )
+                for text in texts
+            ]
+        metrics.record_batch(len(tokens) for tokens in source)
+
+        # CTranslate2 encodes and decodes in one call
+        with metrics.stage("generate"):
+            results = self.translator.translate_batch(
+                source,
+                target_prefix=[[tgt_lang]] * len(source),
+                beam_size=generation_kwargs.get("num_beams", 1),
+                max_decoding_length=max_length,
+                no_repeat_ngram_size=generation_kwargs.get("no_repeat_ngram_size", 0),
+                repetition_penalty=generation_kwargs.get("repetition_penalty", 1.0),
+                return_scores=scored,
+                normalize_scores=scored,  # per-token mean, as HFBackend reports
+            )
+
+        decoded = []
+        with metrics.stage("decode"):
+            for result in results:
+                # drop the forced target-language token, as generate() does via skip_special_tokens
+                tokens = result.hypotheses[0][1:]
+                metrics.record_output(len(tokens))
+                ids = self.tokenizer.convert_tokens_to_ids(tokens)
+                text = self.tokenizer.decode(ids, skip_special_tokens=True)
+                decoded.append((text, result.scores[0]) if scored else text)
+        return decoded
+
+    def generate_multi(self, texts, src_lang, tgt_langs, **generation_kwargs):
+        # CTranslate2 does not expose encoder states, so each target re-encodes
+        return {
+            tgt_lang: self.generate(texts, src_lang, tgt_lang, **generation_kwargs)
+            for tgt_lang in tgt_langs
+        }
+
+    def generate_multi_scored(self, texts, src_lang, tgt_langs, **generation_kwargs):
+        return {
+            tgt_lang: self._generate(texts, src_lang, tgt_lang, True, generation_kwargs)
+            for tgt_lang in tgt_langs
+        }
+
+
+def load_backend(name=DEFAULT_BACKEND, model_name=MODEL_NAME, **kwargs):
+    if name == "hf":
+        with metrics.stage("load_model"):
+            return HFBackend(model_name, **kwargs)
+    if name == "ct2":
+        with metrics.stage("load_model"):
+            return CT2Backend(model_name, **kwargs)
+    raise ValueError(f"Unknown backend {name!r}; expected one of {', '.join(BACKENDS)}")
+
+
+def convert(model_name=MODEL_NAME, output_dir=None, quantization="int8"):
+    """one-time conversion of a Hugging Face checkpoint to CTranslate2"""
+    from ctranslate2.converters import TransformersConverter
+
+    output_dir = output_dir or ct2_model_dir(model_name, quantization)
+    os.makedirs(os.path.dirname(output_dir), exist_ok=True)
+
+    print(f"Converting {model_name} -> {output_dir} ({quantization})...")
+    TransformersConverter(model_name).convert(output_dir, quantization=quantization, force=True)
+    print("Done.")
+    return output_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage NLLB inference backends.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    conv = sub.add_parser("convert", help="Convert a checkpoint for the ct2 backend")
+    conv.add_argument("--model", default=MODEL_NAME, help="Hugging Face model name")
+    conv.add_argument("--output", default=None, help="Output directory (default: ~/.cache/ayamatma/ct2/...)")
+    conv.add_argument("--quantization", default="int8", help="int8, int8_float32, int16, float32")
+
+    args = parser.parse_args()
+    if args.command == "convert":
+        convert(args.model, args.output, args.quantization)
+
+
+if __name__ == "__main__":
+    main()
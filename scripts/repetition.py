@@ -0,0 +1,141 @@
+"""
+Repetition analysis for machine-translated text.
+
+NLLB occasionally falls into a loop and emits the same word or phrase over
+and over. analyze_repetition() finds such loops in linear time, with no
+regex backtracking:
+
+- tandem repeats: a phrase of up to MAX_PERIOD words repeated back to back
+  (period p is found by comparing token i with token i+p in one pass, so the
+  cost is O(words x MAX_PERIOD)),
+- low diversity: the share of distinct word n-grams, counted with a rolling
+  hash, for loops that are not strictly back to back.
+
+Only the standard library is used, so scans never import torch.
+"""
+
+import re
+import string
+from collections import namedtuple
+
+MAX_PERIOD = 32       # longest looping phrase we look for, in words
+MIN_REPEATS = 4       # "x x x x" - the old regex flagged 4 or more
+NGRAM = 3
+MIN_WORDS_FOR_DIVERSITY = 20
+MIN_DISTINCT_RATIO = 0.2
+
+_HASH_BASE = 1000003
+_HASH_MOD = (1 << 61) - 1
+
+_TOKEN = re.compile(r'\S+')
+# punctuation that may cling to a word, including danda and typographic quotes
+_EDGE_PUNCT = string.punctuation + '\u0964\u0965\u2018\u2019\u201c\u201d\u2013\u2014\u2026'
+
+Repetition = namedtuple('Repetition', [
+    'repetitive',  # bool: should this text be re-translated
+    'score',       # 0..1: share of the text taken up by the loop
+    'phrase',      # the repeated unit, or "" if none
+    'repeats',     # how many times it occurs back to back
+    'span',        # (start, end) character offsets of the loop, or None
+])
+
+NO_REPETITION = Repetition(False, 0.0, '', 0, None)
+
+
+def _token_ids(text):
+    """interned word ids; punctuation at word edges is ignored"""
+    vocab = {}
+    ids = []
+    for word in text.split():
+        word = word.strip(_EDGE_PUNCT).lower() or word
+        ids.append(vocab.setdefault(word, len(vocab)))
+    return ids
+
+
+def _candidate_periods(ids, max_period):
+    """distances at which some word recurs; no other period can repeat"""
+    last = {}
+    periods = set()
+    for i, token in enumerate(ids):
+        j = last.get(token)
+        if j is not None and i - j <= max_period:
+            periods.add(i - j)
+        last[token] = i
+    return sorted(periods)
+
+
+def _longest_tandem(ids, max_period=MAX_PERIOD):
+    """(covered_tokens, period, start) of the longest back-to-back repeat"""
+    best = (0, 0, 0)
+    n = len(ids)
+    for period in _candidate_periods(ids, min(max_period, n // 2)):
+        run = 0
+        for i, same in enumerate(map(int.__eq__, ids, ids[period:])):
+            if same:
+                run += 1
+                continue
+            if run >= period:
+                covered = run + period
+                if covered > best[0]:
+                    best = (covered, period, i - run)
+            run = 0
+        if run >= period:
+            covered = run + period
+            if covered > best[0]:
+                best = (covered, period, n - period - run)
+    return best
+
+
+def distinct_ngram_ratio(ids, n=NGRAM):
+    """share of distinct word n-grams, via a polynomial rolling hash"""
+    if len(ids) < n:
+        return 1.0
+    top = pow(_HASH_BASE, n - 1, _HASH_MOD)
+    h = 0
+    for i in range(n):
+        h = (h * _HASH_BASE + ids[i] + 1) % _HASH_MOD
+    seen = {h}
+    total = 1
+    for i in range(n, len(ids)):
+        h = ((h - (ids[i - n] + 1) * top) * _HASH_BASE + ids[i] + 1) % _HASH_MOD
+        seen.add(h)
+        total += 1
+    return len(seen) / total
+
+
+def analyze_repetition(text, max_period=MAX_PERIOD, min_repeats=MIN_REPEATS):
+    if not text:
+        return NO_REPETITION
+
+    ids = _token_ids(text)
+    if len(ids) < 2:
+        return NO_REPETITION
+
+    covered, period, start = _longest_tandem(ids, max_period)
+    repeats = covered // period if period else 0
+
+    phrase = ''
+    span = None
+    score = 0.0
+    if repeats >= 2:
+        # same words as text.split(), so indices line up
+        spans = [m.span() for m in _TOKEN.finditer(text)]
+        unit = spans[start:start + period]
+        phrase = text[unit[0][0]:unit[-1][1]]
+        span = (spans[start][0], spans[start + covered - 1][1])
+        score = covered / len(ids)
+
+    looping = repeats >= min_repeats
+
+    # loops that wander (a b c a b d a b c ...) rather than repeat exactly
+    if len(ids) > MIN_WORDS_FOR_DIVERSITY:
+        ratio = distinct_ngram_ratio(ids)
+        if ratio < MIN_DISTINCT_RATIO:
+            looping = True
+            score = max(score, 1.0 - ratio)
+
+    return Repetition(looping, round(score, 4), phrase, repeats, span)
+
+
+def detect_repetition(text):
+    return analyze_repetition(text).repetitive
@@ -0,0 +1,232 @@
+"""
+Sentence-level chunking of long inputs for the NLLB translators.
+
+The tokenizer cuts every input at max_length (512) tokens, so the end of a
+long paragraph or Telugu definition used to be dropped without a word; long
+inputs are also the most expensive ones for attention and beam search.
+run_chunked() splits any text longer than CHUNK_TOKENS into runs of whole
+sentences that fit, translates those pieces in the same length-sorted
+batches as everything else, and joins each text's outputs back together.
+Texts that fit are passed through untouched.
+
+Sentence ends, for English, Telugu and Hindi:
+
+- . ! ? followed by whitespace, unless the next word starts lowercase Latin
+  or the dot ends a known abbreviation (e.g., Dr., St.) or an initial,
+- । and ॥, with or without whitespace, including a verse number closed by
+  another danda (॥ १२ ॥).
+
+A sentence that is still too long is split at , ; : and dashes, and as a
+last resort between words.
+"""
+
+import re
+
+from batching import MAX_BATCH_TOKENS, MAX_BATCH_ITEMS, token_lengths, run_batched
+from instrumentation import metrics
+
+# texts longer than this are split; pieces are packed up to it
+CHUNK_TOKENS = 200
+# tokens the tokenizer adds to every input (language code and </s>)
+SPECIAL_TOKENS = 2
+
+ABBREVIATIONS = frozenset("""
+mr mrs ms dr prof st sr jr vs etc e.g i.e cf viz no nos vol ch pp fig ed eds
+approx ca skt
+""".split())
+
+_CLOSERS = '\'"”’»)\\]'
+_SENTENCE_END = re.compile(
+    r'(?:[.!?]+[' + _CLOSERS + r']*(?=\s|$)'
+    r'|[।॥]+(?:\s*[0-9०-९౦-౯]+\s*[।॥]+)?[' + _CLOSERS + r']*)'
+    r'(\s*)'
+)
+_CLAUSE_END = re.compile(r'[,;:](\s+)|\s+[—–-]\s+|—')
+_WORD_BEFORE = re.compile(r'([\w.]+)\.$')
+
+
+def _is_sentence_end(text, match):
+    mark = match.group()
+    if mark[0] in '।॥':
+        return True
+    following = text[match.end():match.end() + 1]
+    if following and 'a' <= following <= 'z':
+        return False
+    if mark[0] == '.' and not mark.startswith('..'):
+        word = _WORD_BEFORE.search(text[:match.start() + 1])
+        if word:
+            before = word.group(1).lower()
+            if before in ABBREVIATIONS or (len(before) == 1 and before.isascii() and before.isalpha()):
+                return False
+    return True
+
+
+def split_sentences(text):
+    """[(sentence, whitespace after it)]; joined back in order they give text"""
+    sentences = []
+    start = 0
+    for match in _SENTENCE_END.finditer(text):
+        if not _is_sentence_end(text, match):
+            continue
+        sentences.append((text[start:match.start(1)], match.group(1)))
+        start = match.end()
+    if start < len(text):
+        sentences.append((text[start:], ''))
+    return sentences
+
+
+def _split_at(text, pattern):
+    parts = []
+    start = 0
+    for match in pattern.finditer(text):
+        end = match.end() - len(match.group(1) or '')
+        if end > start:
+            parts.append((text[start:end], text[end:match.end()]))
+            start = match.end()
+    if start < len(text):
+        parts.append((text[start:], ''))
+    return parts
+
+
+def _split_words(text, pieces):
+    words = text.split(' ')
+    size = -(-len(words) // pieces)
+    chunks = [' '.join(words[i:i + size]) for i in range(0, len(words), size)]
+    return [(chunk, ' ') for chunk in chunks[:-1]] + [(chunks[-1], '')]
+
+
+def _pack(parts, lengths, limit):
+    """greedily join consecutive (text, separator) parts while they fit in limit tokens"""
+    chunks = []
+    current, size = [], 0
+    for part, length in zip(parts, lengths):
+        if current and size + length > limit:
+            chunks.append((current, size))
+            current, size = [], 0
+        current.append(part)
+        size += length
+    if current:
+        chunks.append((current, size))
+    # a chunk keeps the separator of its last part, for the join
+    return [
+        (''.join(t + s for t, s in chunk[:-1]) + chunk[-1][0], chunk[-1][1], size)
+        for chunk, size in chunks
+    ]
+
+
+def chunk_text(text, tokenizer, limit=CHUNK_TOKENS):
+    """[(piece, separator, tokens)] of at most about limit tokens each"""
+    sentences = split_sentences(text)
+    lengths = [n - SPECIAL_TOKENS for n in token_lengths([s for s, _ in sentences], tokenizer, None)]
+
+    parts, part_lengths = [], []
+    for (sentence, sep), length in zip(sentences, lengths):
+        if length <= limit:
+            parts.append((sentence, sep))
+            part_lengths.append(length)
+            continue
+        clauses = _split_at(sentence, _CLAUSE_END)
+        clause_lengths = [n - SPECIAL_TOKENS for n in token_lengths([c for c, _ in clauses], tokenizer, None)]
+        clauses[-1] = (clauses[-1][0], sep)
+        for (clause, clause_sep), clause_length in zip(clauses, clause_lengths):
+            if clause_length <= limit:
+                parts.append((clause, clause_sep))
+                part_lengths.append(clause_length)
+                continue
+            pieces = -(-clause_length // limit)
+            words = _split_words(clause, pieces)
+            words[-1] = (words[-1][0], clause_sep)
+            parts.extend(words)
+            part_lengths.extend([clause_length // pieces] * len(words))
+    return _pack(parts, part_lengths, limit)
+
+
+def _join(outputs, separators):
+    """one text's translated pieces, with a space (or the source's line breaks) between them"""
+    if len(outputs) == 1:
+        return outputs[0]
+    if isinstance(outputs[0], dict):
+        return {key: _join([out[key] for out in outputs], separators) for key in outputs[0]}
+    joined = ''
+    for out, sep in zip(outputs, separators):
+        joined += out.strip() + ('\n' * sep.count('\n') if '\n' in sep else ' ')
+    return joined.rstrip()
+
+
+class ChunkPlan:
+    """the unique pieces to translate for a list of texts, and how to put each text back together"""
+
+    def __init__(self, texts, tokenizer, limit=CHUNK_TOKENS):
+        self.texts = list(texts)
+        self.pieces = []
+        self.lengths = []
+        self.layout = []  # per text: [(piece index, separator)]
+        index = {}
+
+        def add(piece, length):
+            if piece not in index:
+                index[piece] = len(self.pieces)
+                self.pieces.append(piece)
+                self.lengths.append(length)
+            return index[piece]
+
+        full_lengths = token_lengths(self.texts, tokenizer, None)
+        for text, length in zip(self.texts, full_lengths):
+            if length - SPECIAL_TOKENS <= limit:
+                self.layout.append([(add(text, length), '')])
+                continue
+            self.layout.append([
+                (add(piece, size + SPECIAL_TOKENS), sep)
+                for piece, sep, size in chunk_text(text, tokenizer, limit)
+            ])
+        self.chunked = sum(1 for layout in self.layout if len(layout) > 1)
+
+    def join(self, outputs):
+        """outputs[i] is the translation of pieces[i]; returns one output per text"""
+        return [_join([outputs[i] for i, _ in layout], [sep for _, sep in layout]) for layout in self.layout]
+
+    def tracker(self, on_batch):
+        """
+        An on_batch for the pieces that calls on_batch(texts, outputs) with
+        whole texts, each as soon as its last piece is translated.
+        """
+        index = {piece: i for i, piece in enumerate(self.pieces)}
+        users = {}
+        for t, layout in enumerate(self.layout):
+            for i in {i for i, _ in layout}:
+                users.setdefault(i, []).append(t)
+        pending = [len({i for i, _ in layout}) for layout in self.layout]
+        done = {}
+
+        def on_pieces(batch_pieces, outputs):
+            finished = []
+            for piece, out in zip(batch_pieces, outputs):
+                i = index[piece]
+                done[i] = out
+                for t in users[i]:
+                    pending[t] -= 1
+                    if pending[t] == 0:
+                        finished.append(t)
+            if finished:
+                on_batch(
+                    [self.texts[t] for t in finished],
+                    [_join([done[i] for i, _ in self.layout[t]], [sep for _, sep in self.layout[t]]) for t in finished],
+                )
+        return on_pieces
+
+
+def run_chunked(texts, tokenizer, translate_fn, max_tokens=MAX_BATCH_TOKENS, max_items=MAX_BATCH_ITEMS,
+                progress=None, on_batch=None, sizer=None, limit=CHUNK_TOKENS):
+    """
+    batching.run_batched() over the sentence chunks of texts; returns one
+    output per text and calls on_batch with whole texts only.
+    """
+    with metrics.stage("chunk"):
+        plan = ChunkPlan(texts, tokenizer, limit)
+    metrics.count("chunked_texts", plan.chunked)
+    metrics.count("chunk_pieces", len(plan.pieces))
+    results = run_batched(
+        plan.pieces, plan.lengths, translate_fn, max_tokens, max_items, progress=progress,
+        on_batch=plan.tracker(on_batch) if on_batch is not None else None, sizer=sizer,
+    )
+    return plan.join(results)
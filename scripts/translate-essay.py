@@ -2,19 +2,51 @@
 """
 Translate an English MDX essay to Hindi and Telugu.
 
-Usage: python scripts/translate-essay.py src/content/essays/my-essay.en.mdx
+Usage: python scripts/translate-essay.py src/content/essays/my-essay.en.mdx [more.en.mdx ...] [--no-cache] [--backend hf|ct2] [--no-server] [--force]
+       python scripts/translate-essay.py --corpus [--dry-run]
+
+Uses a running translation_server.py when there is one. Translations are
+recorded per segment hash in essays/_translations/<slug>.json, so a rerun only
+translates segments that are new or changed.
+
+--corpus walks the essays, gita, daily and listen collections and builds
+every output that is missing or older than its source by content hash
+(corpus.py), all in one model session.
 """
 
 import os
 import sys
 import re
-import torch
-from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+import json
+import hashlib
+import argparse
 from tqdm import tqdm
 
-MODEL_NAME = "facebook/nllb-200-distilled-600M"
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
-BATCH_SIZE = 8
+from translation_memory import TranslationMemory
+from batching import BatchSizer
+from segmenter import run_chunked
+from dedup import SegmentIndex
+from masking import MASK_VERSION, translate_masked
+import corpus
+import mdx
+from nllb_backends import BACKENDS, DEFAULT_BACKEND, MODEL_NAME, backend_id
+from translation_client import connect_or_load, usable_server
+from decoding import MIN_LOGPROB, greedy_first
+import instrumentation
+from instrumentation import metrics
+
+MAX_BATCH_TOKENS = 4096
+MAX_BATCH_ITEMS = 32
+
+GENERATION_KWARGS = {
+    "max_length": 512,
+    "num_beams": 4,
+    "early_stopping": True,
+}
+
+# <Term>, tags and IAST are masked before translation (masking.py); cached
+# output is keyed on that too
+CACHE_PARAMS = dict(GENERATION_KWARGS, masking=MASK_VERSION)
 
 LANG_CODES = {
     "en": "eng_Latn",
@@ -22,287 +54,352 @@ LANG_CODES = {
     "te": "tel_Telu",
 }
 
-# frontmatter fields to translate
-TRANSLATE_FIELDS = ['title', 'description', 'claim']
-
 class Translator:
-    def __init__(self):
-        print(f"Loading model on {DEVICE}...")
-        self.tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
-        self.model = AutoModelForSeq2SeqLM.from_pretrained(MODEL_NAME).to(DEVICE)
-        self.model.eval()
+    def __init__(self, memory=None, backend=None, use_server=True, adaptive=False, memory_budget=None, greedy_min_logprob=None):
+        self.memory = memory
+        self.backend_name = backend
+        self.use_server = use_server
+        self.backend = None
+        # adaptive: batch size follows memory use (batching.BatchSizer) rather than MAX_BATCH_TOKENS
+        self.adaptive = adaptive
+        self.memory_budget = memory_budget
+        self.sizer = None
+        # greedy_min_logprob: decode greedily first, beam search only below it (decoding.py)
+        self.greedy_min_logprob = greedy_min_logprob
+
+    def load(self):
+        # deferred so a run served entirely from the translation memory
+        # never pays for loading the weights
+        if self.backend is not None:
+            return
+        self.backend = connect_or_load(self.backend_name, MODEL_NAME, self.use_server)
+        if self.greedy_min_logprob is not None:
+            self.backend = greedy_first(self.backend, self.greedy_min_logprob)
+        if self.adaptive:
+            self.sizer = BatchSizer.for_backend(self.backend, MAX_BATCH_TOKENS, self.memory_budget)
         print("Model loaded.")
 
+    def backend_id(self):
+        """id of the backend that will serve misses, without loading it"""
+        if self.backend is not None:
+            return self.backend.id
+        # a server decodes with its own settings (greedy-first or not), so
+        # whenever it will serve the misses its backend is the key
+        health = usable_server(self.backend_name, MODEL_NAME, self.use_server)
+        if health:
+            return health.get("id", health["backend"])
+        name = backend_id(self.backend_name or DEFAULT_BACKEND)
+        return name if self.greedy_min_logprob is None else f"{name}+greedy"
+
     def translate(self, texts, tgt_lang):
+        return self.translate_multi(texts, [tgt_lang])[tgt_lang]
+
+    def translate_multi(self, texts, tgt_langs):
+        """Translate texts into every language in tgt_langs; returns {lang: translations}."""
         if not texts:
-            return []
+            return {lang: [] for lang in tgt_langs}
 
-        self.tokenizer.src_lang = LANG_CODES["en"]
-        tgt_code = LANG_CODES[tgt_lang]
-
-        results = []
-        for i in range(0, len(texts), BATCH_SIZE):
-            batch = texts[i:i+BATCH_SIZE]
-
-            inputs = self.tokenizer(
-                batch,
-                return_tensors="pt",
-                padding=True,
-                truncation=True,
-                max_length=512
-            ).to(DEVICE)
-
-            with torch.no_grad():
-                generated = self.model.generate(
-                    **inputs,
-                    forced_bos_token_id=self.tokenizer.convert_tokens_to_ids(tgt_code),
-                    max_length=512,
-                    num_beams=4,
-                    early_stopping=True
-                )
-
-            decoded = self.tokenizer.batch_decode(generated, skip_special_tokens=True)
-            results.extend(decoded)
-
-        return results
-
-
-def parse_mdx(content):
-    """Split MDX into frontmatter and body."""
-    if not content.startswith('---'):
-        return {}, content
-
-    # find closing ---
-    end = content.find('---', 3)
-    if end == -1:
-        return {}, content
-
-    frontmatter_raw = content[3:end].strip()
-    body = content[end+3:].strip()
-
-    # parse frontmatter (simple yaml-like)
-    frontmatter = {}
-    current_key = None
-    current_indent = 0
-
-    for line in frontmatter_raw.split('\n'):
-        if not line.strip():
-            continue
-
-        # check for nested (protocols:, paths:, etc.)
-        if line.endswith(':') and not ':' in line[:-1]:
-            current_key = line[:-1].strip()
-            frontmatter[current_key] = {}
-            continue
-
-        match = re.match(r'^(\s*)(\w+):\s*(.*)$', line)
-        if match:
-            indent, key, value = match.groups()
-            indent_level = len(indent)
-
-            # clean value
-            value = value.strip().strip('"').strip("'")
-
-            if indent_level > 0 and current_key and isinstance(frontmatter.get(current_key), dict):
-                frontmatter[current_key][key] = value
-            else:
-                frontmatter[key] = value
-                current_key = None
-
-    return frontmatter, body
-
-
-def extract_translatable_content(body):
-    """Extract text segments to translate, preserving structure."""
-    # skip: import statements, HTML tags, markdown syntax
-    lines = body.split('\n')
-    segments = []
-    indices = []
-
-    for i, line in enumerate(lines):
-        stripped = line.strip()
-
-        # skip empty, imports, pure HTML, headers (keep ## but translate text after)
-        if not stripped:
-            continue
-        if stripped.startswith('import '):
-            continue
-        if stripped.startswith('<') and stripped.endswith('>'):
-            continue
-        if stripped.startswith('```'):
-            continue
-
-        # for headers, extract text after ##
-        if stripped.startswith('#'):
-            # keep the hashes, translate the text
-            match = re.match(r'^(#+\s*)(.*)', stripped)
-            if match:
-                segments.append(match.group(2))
-                indices.append((i, 'header', match.group(1)))
-            continue
-
-        # for blockquotes, extract text after >
-        if stripped.startswith('>'):
-            text = stripped.lstrip('> ').strip()
-            if text:
-                segments.append(text)
-                indices.append((i, 'quote', '> '))
-            continue
-
-        # for pullquotes, extract inner text
-        if '<span class="pullquote">' in stripped:
-            match = re.search(r'<span class="pullquote">([^<]+)</span>', stripped)
-            if match:
-                segments.append(match.group(1))
-                indices.append((i, 'pullquote', None))
-            continue
-
-        # regular paragraph
-        if stripped and not stripped.startswith('<Term'):
-            segments.append(stripped)
-            indices.append((i, 'paragraph', None))
-
-    return segments, indices, lines
-
-
-def rebuild_body(lines, indices, translated):
-    """Rebuild body with translated content."""
-    new_lines = lines.copy()
-
-    for (i, seg_type, prefix), trans in zip(indices, translated):
-        if seg_type == 'header':
-            new_lines[i] = prefix + trans
-        elif seg_type == 'quote':
-            new_lines[i] = '> ' + trans
-        elif seg_type == 'pullquote':
-            new_lines[i] = f'<span class="pullquote">{trans}</span>'
+        tgt_codes = [LANG_CODES[lang] for lang in tgt_langs]
+        if self.memory is None:
+            translated = self._translate(texts, tgt_codes)
         else:
-            new_lines[i] = trans
-
-    return '\n'.join(new_lines)
-
-
-def create_translated_frontmatter(fm, lang, slug):
-    """Create frontmatter for translated version."""
-    lines = ['---']
-    lines.append(f'id: "{slug}"')
-    lines.append(f'lang: "{lang}"')
-
-    # title and description (will be replaced with translated versions)
-    lines.append(f'title: "{fm.get("title", "")}"')
-    lines.append(f'description: "{fm.get("description", "")}"')
-
-    # copy date, version, reading_time
-    if 'date' in fm:
-        lines.append(f'date: "{fm["date"]}"')
-    if 'version' in fm:
-        lines.append(f'version: "{fm["version"]}"')
-    if 'reading_time' in fm:
-        lines.append(f'reading_time: {fm["reading_time"]}')
-
-    # protocols if present
-    if 'protocols' in fm and isinstance(fm['protocols'], dict):
-        lines.append('protocols:')
-        for k, v in fm['protocols'].items():
-            if isinstance(v, list):
-                lines.append(f'  {k}: {v}')
-            else:
-                lines.append(f'  {k}: "{v}"')
-
-    # paths
-    lines.append('paths:')
-    lines.append(f'  en: "/essays/{slug}"')
-    lines.append(f'  hi: "/hi/essays/{slug}"')
-    lines.append(f'  te: "/te/essays/{slug}"')
-
-    # tags
-    if 'tags' in fm:
-        lines.append(f'tags: {fm["tags"]}')
-
-    # featured
-    if 'featured' in fm:
-        lines.append(f'featured: {fm["featured"]}')
-
-    lines.append('---')
-    return '\n'.join(lines)
-
-
-def translate_essay(input_path, translator):
-    """Translate an English MDX essay to Hindi and Telugu."""
-
-    print(f"\nReading {input_path}...")
-    with open(input_path, 'r', encoding='utf-8') as f:
-        content = f.read()
-
-    frontmatter, body = parse_mdx(content)
-    slug = frontmatter.get('id', os.path.basename(input_path).replace('.en.mdx', ''))
+            translated = self.memory.cached_multi(
+                texts, self._translate, LANG_CODES["en"], tgt_codes,
+                self.backend_id(), MODEL_NAME, CACHE_PARAMS,
+            )
 
-    # extract translatable segments
-    segments, indices, lines = extract_translatable_content(body)
+        return {lang: translated[LANG_CODES[lang]] for lang in tgt_langs}
 
-    # also translate frontmatter fields
-    fm_to_translate = []
-    for field in TRANSLATE_FIELDS:
-        if field in frontmatter:
-            fm_to_translate.append(frontmatter[field])
-        elif 'protocols' in frontmatter and field in frontmatter['protocols']:
-            fm_to_translate.append(frontmatter['protocols'][field])
+    def _translate(self, texts, tgt_codes):
+        # markup and Sanskrit go to the model as placeholders and are put back
+        # afterwards; a segment that loses one is re-translated piecewise
+        results = translate_masked(texts, lambda masked: self._generate(masked, tgt_codes), keys=tgt_codes)
+        return {code: [r[code] for r in results] for code in tgt_codes}
 
-    all_segments = fm_to_translate + segments
-
-    print(f"Found {len(segments)} content segments + {len(fm_to_translate)} frontmatter fields")
-
-    for lang in ['hi', 'te']:
-        print(f"\nTranslating to {lang}...")
-
-        translated = translator.translate(all_segments, lang)
-
-        # split back
-        fm_translated = translated[:len(fm_to_translate)]
-        content_translated = translated[len(fm_to_translate):]
-
-        # rebuild frontmatter with translations
-        new_fm = create_translated_frontmatter(frontmatter, lang, slug)
+    def _generate(self, texts, tgt_codes):
+        """[{code: translation}] for texts, straight from the model"""
+        if not texts:
+            return []
+        self.load()
+        src_code = LANG_CODES["en"]
+
+        if getattr(self.backend, "batches_server_side", False):
+            outputs = self.backend.generate_multi(texts, src_code, tgt_codes, **GENERATION_KWARGS)
+            return [{code: outputs[code][j] for code in tgt_codes} for j in range(len(texts))]
+
+        def generate(batch):
+            # one encoder pass per batch, decoded once per target language
+            outputs = self.backend.generate_multi(batch, src_code, tgt_codes, **GENERATION_KWARGS)
+            return [{code: outputs[code][j] for code in tgt_codes} for j in range(len(batch))]
+
+        # sort by length so short headers are not padded out to the longest paragraph;
+        # long paragraphs are translated as sentence chunks instead of being truncated
+        return run_chunked(texts, self.backend.tokenizer, generate, MAX_BATCH_TOKENS, MAX_BATCH_ITEMS, sizer=self.sizer)
+
+
+def segment_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def manifest_path(input_path):
+    """Sidecar manifest: essays/_translations/<slug>.json (Astro skips _-prefixed paths)."""
+    directory = os.path.join(os.path.dirname(input_path), '_translations')
+    return os.path.join(directory, os.path.basename(input_path).replace('.en.mdx', '.json'))
+
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {'model': MODEL_NAME, 'segments': {}}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(path, manifest):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def translate_segments(segments, langs, translator, manifest, force=False):
+    """
+    Translate segments through the manifest: only segments whose hash has no
+    stored output for a language are sent to the model. Returns {lang: [...]}
+    and prunes manifest entries for segments that no longer exist.
+    """
+    return translate_manifests([(segments, manifest)], langs, translator, force)[0]
+
+
+def translate_manifests(jobs, langs, translator, force=False, job_langs=None):
+    """
+    translate_segments() for several (segments, manifest) pairs at once. A
+    segment missing from more than one manifest, such as a header shared by
+    several essays, is translated once (dedup.py). job_langs narrows langs
+    per job. Returns one {lang: [...]} per job.
+    """
+    job_langs = job_langs or [langs] * len(jobs)
+    stored = [{} if force else manifest.get('segments', {}) for _, manifest in jobs]
+    hashes = [[segment_hash(seg) for seg in segments] for segments, _ in jobs]
+
+    # group the missing segments of every job by the languages they lack
+    groups = {}
+    for j, (segments, _) in enumerate(jobs):
+        seen = set()
+        for seg, h in zip(segments, hashes[j]):
+            missing = tuple(lang for lang in job_langs[j] if lang not in stored[j].get(h, {}))
+            if missing and h not in seen:
+                seen.add(h)
+                groups.setdefault(missing, SegmentIndex()).add(seg, (j, h))
+
+    unique = sum(len(set(h)) for h in hashes)
+    todo = sum(index.segments for index in groups.values())
+    metrics.count("segments_unchanged", unique - todo)
+    metrics.count("segments_translated", todo)
+    print(f"{unique - todo} of {unique} unique segments unchanged; translating {todo}")
+
+    for missing, index in groups.items():
+        if len(jobs) > 1:
+            index.report()
+        texts = index.unique()
+        translated = translator.translate_multi(texts, list(missing))
+        for lang in missing:
+            for (j, h), _, out in index.fan_out(texts, translated[lang]):
+                stored[j].setdefault(h, {})[lang] = out
+
+    results = []
+    for (_, manifest), job_stored, job_hashes, these_langs in zip(jobs, stored, hashes, job_langs):
+        manifest['model'] = MODEL_NAME
+        manifest['segments'] = {h: job_stored[h] for h in job_hashes}
+        results.append({lang: [job_stored[h][lang] for h in job_hashes] for lang in these_langs})
+    return results
+
+
+def localize_frontmatter(frontmatter, lang, collection, name):
+    """
+    the (already translated) frontmatter of a page with lang set and a path
+    for every language; every other line is kept as it is
+    """
+    lines = []
+    in_paths = False
+    for line in frontmatter.split('\n'):
+        if in_paths:
+            if line.startswith((' ', '\t')):
+                continue
+            in_paths = False
+        match = re.match(r'^(\w+):', line)
+        key = match.group(1) if match else None
+        if key == 'lang':
+            lines.append(f'lang: "{lang}"')
+        elif key == 'paths':
+            lines.append('paths:')
+            lines.append(f'  en: "/{collection}/{name}"')
+            lines.extend(f'  {l}: "/{l}/{collection}/{name}"' for l in corpus.LANGS)
+            in_paths = True
+        else:
+            lines.append(line)
+    return '\n'.join(lines)
 
-        # update translated fields in frontmatter
-        fm_lines = new_fm.split('\n')
-        fm_idx = 0
-        for i, line in enumerate(fm_lines):
-            for field in TRANSLATE_FIELDS:
-                if line.startswith(f'{field}:') or line.startswith(f'  {field}:'):
-                    if fm_idx < len(fm_translated):
-                        indent = '  ' if line.startswith('  ') else ''
-                        fm_lines[i] = f'{indent}{field}: "{fm_translated[fm_idx]}"'
-                        fm_idx += 1
-                    break
-        new_fm = '\n'.join(fm_lines)
 
-        # rebuild body
-        new_body = rebuild_body(lines, indices, content_translated)
+def prepare_essay(input_path, collection='essays'):
+    """tokenize an essay (or another collection's page) for translate_manifests() and write_essay()"""
+    print(f"\nReading {input_path}...")
+    with metrics.stage("read"), open(input_path, 'r', encoding='utf-8') as f:
+        content = f.read()
 
-        # combine
-        output = new_fm + '\n' + new_body
+    # only prose, headings, quotes and the collection's frontmatter fields
+    # reach the model; code, JSX and markup are copied through (mdx.py)
+    with metrics.stage("parse_mdx"):
+        tokens = mdx.tokenize(content, corpus.COLLECTIONS[collection])
+        translatable = mdx.segments(tokens)
+
+    metrics.count("segments", len(translatable))
+    scalars = sum(1 for i, _ in translatable if tokens[i].kind == 'scalar')
+    print(f"Found {len(translatable) - scalars} content segments + {scalars} frontmatter fields")
+
+    essay = {
+        'input_path': input_path,
+        'collection': collection,
+        'source_hash': corpus.content_hash(content),
+        'tokens': tokens,
+        'positions': [i for i, _ in translatable],
+        'segments': [text for _, text in translatable],
+        'sidecar': manifest_path(input_path),
+    }
+    essay['manifest'] = load_manifest(essay['sidecar'])
+    return essay
+
+
+def write_essay(essay, translations):
+    """write the .hi.mdx/.te.mdx files in translations and the manifest of a prepared essay"""
+    input_path = essay['input_path']
+    name = os.path.basename(input_path)[:-len('.en.mdx')]
+
+    for lang in translations:
+        # every token that was not translated comes out byte for byte
+        translated = dict(zip(essay['positions'], translations[lang]))
+        frontmatter, body = mdx.render_page(essay['tokens'], translated)
+        output = localize_frontmatter(frontmatter, lang, essay['collection'], name) + body
 
         # write file
-        output_path = input_path.replace('.en.mdx', f'.{lang}.mdx')
-        with open(output_path, 'w', encoding='utf-8') as f:
+        output_path = corpus.output_path(input_path, lang)
+        with metrics.stage("write"), open(output_path, 'w', encoding='utf-8') as f:
             f.write(output)
+        corpus.record_output(essay['manifest'], lang, essay['source_hash'], output)
 
         print(f"Saved: {output_path}")
 
+    save_manifest(essay['sidecar'], essay['manifest'])
+    print(f"Saved: {essay['sidecar']}")
+
+
+def translate_essays(input_paths, translator, force=False, collections=None, langs=None):
+    """
+    Translate English MDX essays to Hindi and Telugu, each shared segment once.
+    collections and langs, one per path, give a page's collection and the
+    outputs to write for it (default: its directory's, both languages).
+    """
+    collections = collections or [corpus.collection_of(path) for path in input_paths]
+    langs = langs or [list(corpus.LANGS)] * len(input_paths)
+    essays = [prepare_essay(path, collection) for path, collection in zip(input_paths, collections)]
+
+    # only new or edited segments reach the model; the rest come from the manifests
+    print(f"\nTranslating to {', '.join(corpus.LANGS)}...")
+    with metrics.stage("translate"):
+        translations = translate_manifests(
+            [(essay['segments'], essay['manifest']) for essay in essays], list(corpus.LANGS), translator, force, langs)
+
+    for essay, essay_translations in zip(essays, translations):
+        write_essay(essay, essay_translations)
+
+
+def build_corpus(translator, content_dir=corpus.CONTENT_DIR, force=False, dry_run=False):
+    """
+    Translate every collection's missing and stale outputs in one model
+    session (see corpus.py); with force, every output is rebuilt.
+    """
+    sources = corpus.find_sources(content_dir)
+    paths, collections, langs = [], [], []
+    counts = {}
+    for collection, source in sources:
+        sidecar = manifest_path(source)
+        manifest = load_manifest(sidecar)
+        source_hash = corpus.file_hash(source)
+        build = []
+        adopted = False
+        for lang in corpus.LANGS:
+            status = corpus.output_status(source_hash, manifest, source, lang)
+            counts[status] = counts.get(status, 0) + 1
+            if force or status in corpus.BUILD:
+                build.append(lang)
+            elif status == 'untracked' and not dry_run:
+                corpus.adopt_output(manifest, source, lang, source_hash)
+                adopted = True
+            if status != 'fresh' or dry_run:
+                print(f"  {status:9} {os.path.relpath(corpus.output_path(source, lang), content_dir)}")
+        if adopted:
+            save_manifest(sidecar, manifest)
+        if build:
+            paths.append(source)
+            collections.append(collection)
+            langs.append(build)
+
+    outputs = sum(len(build) for build in langs)
+    print(f"{len(sources)} sources: "
+          + ', '.join(f"{n} {status}" for status, n in sorted(counts.items()))
+          + f"; {outputs} outputs to build")
+    metrics.count("outputs_stale", outputs)
+    if counts.get('untracked') and not force and not dry_run:
+        print("Untracked outputs were recorded as built from their current source; they are rebuilt once it changes")
+    if counts.get('conflict') and not force:
+        print("Conflicts: outputs edited by hand whose source has changed since. They are left alone; "
+              "merge the source changes by hand or rebuild them with --force")
+    if dry_run or not paths:
+        return
+    translate_essays(paths, translator, force, collections, langs)
+
+
+def translate_essay(input_path, translator, force=False):
+    """Translate an English MDX essay to Hindi and Telugu."""
+    translate_essays([input_path], translator, force)
 
-def main():
-    if len(sys.argv) < 2:
-        print("Usage: python scripts/translate-essay.py <essay.en.mdx>")
-        sys.exit(1)
-
-    input_path = sys.argv[1]
-    if not os.path.exists(input_path):
-        print(f"File not found: {input_path}")
-        sys.exit(1)
 
-    translator = Translator()
-    translate_essay(input_path, translator)
+def main():
+    parser = argparse.ArgumentParser(description="Translate an English MDX essay to Hindi and Telugu.")
+    parser.add_argument("inputs", nargs='*', metavar="input", help="Path to the .en.mdx essay; with several, segments they share are translated once")
+    parser.add_argument("--corpus", nargs='?', const=corpus.CONTENT_DIR, default=None, metavar="CONTENT_DIR",
+                        help=f"Build every missing or stale output of the {', '.join(corpus.COLLECTIONS)} collections in one run")
+    parser.add_argument("--dry-run", action="store_true", help="With --corpus, only list what would be built")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the translation memory")
+    parser.add_argument("--backend", default=None, choices=BACKENDS, help=f"Inference backend (default: the server's, else {DEFAULT_BACKEND})")
+    parser.add_argument("--no-server", action="store_true", help="Always load the model locally, even if a translation server is running")
+    parser.add_argument("--force", action="store_true", help="Ignore the segment manifest and re-translate every segment")
+    parser.add_argument("--memory-budget", type=float, default=None, metavar="MB", help="Memory batches may use (default: 70%% of what is available at start)")
+    parser.add_argument("--fixed-batches", action="store_true", help=f"Keep batches under {MAX_BATCH_TOKENS} tokens instead of adapting to memory use")
+    parser.add_argument("--greedy-first", action="store_true", help="Decode greedily and use beam search only for unsure or looping output")
+    parser.add_argument("--min-logprob", type=float, default=MIN_LOGPROB, help=f"Mean token log-probability below which --greedy-first re-decodes (default {MIN_LOGPROB})")
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+    if not args.inputs and not args.corpus:
+        parser.error("give .en.mdx paths or --corpus")
+
+    for input_path in args.inputs:
+        if not os.path.exists(input_path):
+            print(f"File not found: {input_path}")
+            sys.exit(1)
+
+    memory = None if args.no_cache else TranslationMemory()
+    translator = Translator(memory, args.backend, use_server=not args.no_server,
+                            adaptive=not args.fixed_batches, memory_budget=args.memory_budget,
+                            greedy_min_logprob=args.min_logprob if args.greedy_first else None)
+    if args.corpus:
+        build_corpus(translator, args.corpus, args.force, args.dry_run)
+    if args.inputs:
+        translate_essays(args.inputs, translator, args.force)
+
+    if memory is not None:
+        print(memory.summary())
+        memory.close()
+    instrumentation.write_reports(args, memory)
     print("\nDone!")
 
 
@@ -1,42 +1,58 @@
 #!/usr/bin/env python3
 """
 Translate essay using Ollama (Gemma/Qwen).
-Usage: python scripts/translate-ollama.py src/content/essays/my-essay.en.mdx
+Usage: python scripts/translate-ollama.py src/content/essays/my-essay.en.mdx [--no-cache] [--concurrency N] [--pack [TOKENS]]
+
+Every paragraph of both languages is sent at once over a pooled keep-alive
+session, up to --concurrency requests in flight. Ollama does not report its
+OLLAMA_NUM_PARALLEL setting, so this is a client-side number: set it to match
+the server's by hand. Requests beyond the server's slots just queue inside
+Ollama.
+
+With --pack, several segments share one request (numbered [[n]] markers, up to
+a token budget) so the instruction preamble is evaluated once per pack rather
+than once per segment. Segments that come back missing or malformed are
+retried on their own.
+
+<Term> components, tags and IAST Sanskrit are masked as numbered placeholders
+([1], [2], ...) before a segment is sent (masking.py). A reply that loses or
+repeats one is retried on its own, up to MASK_RETRIES times; after that the
+English segment is kept.
 """
 
 import os
 import sys
 import re
+import time
+import random
+import argparse
 import requests
 import json
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from requests.adapters import HTTPAdapter
+
+from translation_memory import TranslationMemory
+from masking import MASK_VERSION, mask, unmask, has_prose
+import mdx
+import instrumentation
+from instrumentation import metrics
 
 OLLAMA_URL = "http://localhost:11434/api/generate"
 MODEL = "qwen3:latest"  # or gemma2:9b
-
-def query_ollama(prompt, model=MODEL):
-    """Query Ollama API."""
-    resp = requests.post(OLLAMA_URL, json={
-        "model": model,
-        "prompt": prompt,
-        "stream": False,
-        "options": {"temperature": 0.3}
-    }, timeout=300)
-
-    if resp.status_code != 200:
-        print(f"Ollama error: {resp.status_code}")
-        return None
-
-    result = resp.json()
-    return result.get("response", "")
-
-
-def translate_text(text, target_lang):
-    """Translate text to target language."""
-    lang_name = "Hindi" if target_lang == "hi" else "Telugu"
-
-    prompt = f"""/no_think
+OPTIONS = {"temperature": 0.3}
+
+# Client-side default only: OLLAMA_NUM_PARALLEL is read from this process's
+# environment (handy when client and server share one), never from the server
+CONCURRENCY = int(os.environ.get("OLLAMA_NUM_PARALLEL", 4))
+RETRIES = 4
+BACKOFF = 1.0  # seconds, doubled on each retry
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# extra requests for a segment whose reply lost a placeholder
+MASK_RETRIES = 2
+
+PROMPT_TEMPLATE = """/no_think
 Translate the following English text to {lang_name}.
-Keep all markdown formatting, HTML tags like <Term> and <span>, and Sanskrit terms in IAST unchanged.
+Keep all markdown formatting unchanged. Copy every placeholder such as [1] or [2] exactly once, unchanged, where it belongs in the sentence.
 Only translate the English prose. Do not add explanations.
 
 Text to translate:
@@ -44,148 +60,316 @@ Text to translate:
 
 {lang_name} translation:"""
 
-    result = query_ollama(prompt)
-    if result:
-        # clean up any thinking tags or extra text
-        result = re.sub(r'<think>.*?</think>', '', result, flags=re.DOTALL)
-        result = result.strip()
-    return result
+PACKED_TEMPLATE = """/no_think
+Translate each numbered English segment below to {lang_name}.
+Keep all markdown formatting unchanged. Copy every placeholder such as [1] or [2] exactly once, unchanged, where it belongs in the sentence.
+Only translate the English prose. Do not add explanations.
+Reply with every marker exactly as given ([[1]], [[2]], ...), each followed by its {lang_name} translation, and nothing else.
+
+{segments}
+
+{lang_name} translation:"""
 
+# frontmatter fields translated along with the body
+FRONTMATTER_FIELDS = ('title', 'description')
 
-def parse_mdx(content):
-    """Split MDX into frontmatter and body."""
-    if not content.startswith('---'):
-        return "", content
+# source tokens per packed request; the reply in Hindi/Telugu is several times
+# longer, so this stays well inside the model's context window
+PACK_TOKENS = 600
 
-    end = content.find('---', 3)
-    if end == -1:
-        return "", content
+# opened in main(); None means every segment goes to the model
+memory = None
 
-    frontmatter = content[:end+3]
-    body = content[end+3:].strip()
-    return frontmatter, body
+# shared keep-alive connection pool; resized by make_session()
+session = None
 
 
-def update_frontmatter(frontmatter, lang, translated_title, translated_desc):
-    """Update frontmatter for translated version."""
-    lines = frontmatter.split('\n')
-    new_lines = []
+def make_session(concurrency=CONCURRENCY):
+    s = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    return s
 
-    for line in lines:
-        if line.startswith('lang:'):
-            new_lines.append(f'lang: "{lang}"')
-        elif line.startswith('title:'):
-            new_lines.append(f'title: "{translated_title}"')
-        elif line.startswith('description:'):
-            new_lines.append(f'description: "{translated_desc}"')
+
+def query_ollama(prompt, model=MODEL):
+    """Query Ollama API, retrying transient failures with exponential backoff."""
+    global session
+    if session is None:
+        session = make_session()
+
+    for attempt in range(RETRIES + 1):
+        try:
+            with metrics.stage("request"):
+                resp = session.post(OLLAMA_URL, json={
+                    "model": model,
+                    "prompt": prompt,
+                    "stream": False,
+                    "options": OPTIONS
+                }, timeout=300)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = str(e)
         else:
-            new_lines.append(line)
+            if resp.status_code == 200:
+                result = resp.json()
+                # Ollama reports prompt and generated token counts with each reply
+                metrics.record_batch([result.get("prompt_eval_count", 0)], result.get("eval_count", 0))
+                return result.get("response", "")
+            error = f"HTTP {resp.status_code}"
+            if resp.status_code not in RETRY_STATUS:
+                print(f"Ollama error: {error}")
+                return None
+
+        if attempt < RETRIES:
+            metrics.count("retries")
+            time.sleep(BACKOFF * (2 ** attempt) + random.uniform(0, BACKOFF))
+
+    print(f"Ollama error after {RETRIES + 1} attempts: {error}")
+    return None
+
+
+def cache_params(packed=False):
+    # the template is part of the key so prompt edits invalidate old output
+    return {"options": OPTIONS, "prompt": PACKED_TEMPLATE if packed else PROMPT_TEMPLATE, "masking": MASK_VERSION}
+
+
+def estimate_tokens(text):
+    # ~4 characters per token for English prose
+    return len(text) // 4 + 1
+
+
+def pack_segments(indices, jobs, budget=PACK_TOKENS):
+    """group job indices of the same language into packs under a token budget"""
+    by_lang = {}
+    for i in indices:
+        by_lang.setdefault(jobs[i][1], []).append(i)
+
+    packs = []
+    for lang_indices in by_lang.values():
+        current, size = [], 0
+        for i in lang_indices:
+            n = estimate_tokens(jobs[i][0])
+            if current and size + n > budget:
+                packs.append(current)
+                current, size = [], 0
+            current.append(i)
+            size += n
+        if current:
+            packs.append(current)
+    return packs
+
 
-    return '\n'.join(new_lines)
+def translate_text(text, target_lang):
+    """Translate text to target language."""
+    return translate_all([(text, target_lang)])[0]
+
+
+def translate_all(jobs, concurrency=CONCURRENCY, pack_tokens=0):
+    """
+    Translate (text, target_lang) pairs concurrently; results come back in
+    job order. With pack_tokens, segments are packed into shared requests.
+    The translation memory is only touched from this thread.
+    """
+    results = [None] * len(jobs)
+    pending = []
+    packed = pack_tokens > 0
+    # one key for the whole run, for lookups and stores alike: in pack mode
+    # the segments retried on their own are stored under it too, so a rerun
+    # in the same mode finds every one of them
+    params = cache_params(packed)
+
+    # what is actually sent: markup and Sanskrit as placeholders
+    masked = [mask(text) for text, _ in jobs]
+    sent = [(m.text, lang) for m, (_, lang) in zip(masked, jobs)]
+    attempts = [0] * len(jobs)
+    metrics.count("masked_spans", sum(len(m.spans) for m in masked))
+
+    for i, (text, lang) in enumerate(jobs):
+        if not has_prose(masked[i]):
+            # only markup and Sanskrit: nothing to translate
+            results[i] = text
+            metrics.count("masked_skipped")
+            continue
+        if memory is not None:
+            cached = memory.lookup([text], "en", lang, "ollama", MODEL, params)[0]
+            if cached is not None:
+                results[i] = cached
+                continue
+        pending.append(i)
+
+    if not pending:
+        return results
+
+    done = 0
+    retried = 0
+    lost = 0
+    requests_sent = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {}
+
+        def submit_single(i):
+            futures[pool.submit(_translate_text, *sent[i])] = ('single', [i])
+
+        if packed:
+            for pack in pack_segments(pending, sent, pack_tokens):
+                if len(pack) == 1:
+                    submit_single(pack[0])
+                else:
+                    texts = [sent[i][0] for i in pack]
+                    futures[pool.submit(_translate_packed, texts, sent[pack[0]][1])] = ('pack', pack)
+        else:
+            for i in pending:
+                submit_single(i)
+
+        while futures:
+            finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in finished:
+                kind, indices = futures.pop(future)
+                requests_sent += 1
+                outputs = future.result() if kind == 'pack' else [future.result()]
+
+                for i, result in zip(indices, outputs):
+                    if result is None and kind == 'pack':
+                        # malformed or missing in the packed reply; retry just this one
+                        submit_single(i)
+                        retried += 1
+                        continue
+                    if result:
+                        restored = unmask(result, masked[i].spans)
+                        if restored is None:
+                            # a placeholder was lost or repeated: ask again for this segment only
+                            lost += 1
+                            attempts[i] += 1
+                            if attempts[i] <= MASK_RETRIES:
+                                metrics.count("placeholder_retries")
+                                submit_single(i)
+                                continue
+                            print(f"\n    Placeholders lost {attempts[i]} times; keeping the English segment")
+                        result = restored
+                    results[i] = result
+                    if result and memory is not None:
+                        text, lang = jobs[i]
+                        memory.store([text], [result], "en", lang, "ollama", MODEL, params)
+                    done += 1
+                print(f"    {done}/{len(pending)} segments translated...", end='\r')
+
+    print()
+    if packed:
+        print(f"    {len(pending)} segments in {requests_sent} requests ({retried} retried individually)")
+    if lost:
+        print(f"    {lost} replies lost a placeholder and were asked for again")
+    return results
+
+
+def parse_packed(response, count):
+    """split a [[n]]-marked reply into count segments; None where a segment is missing or ambiguous"""
+    parts = re.split(r'\[\[(\d+)\]\]', response)
+    found = {}
+    for number, body in zip(parts[1::2], parts[2::2]):
+        k = int(number)
+        if k in found:
+            # the same marker twice: we cannot tell which one is right
+            found[k] = None
+        else:
+            found[k] = body.strip() or None
+    return [found.get(k) for k in range(1, count + 1)]
 
 
-def translate_essay(input_path):
-    """Translate essay to Hindi and Telugu."""
-    print(f"Reading {input_path}...")
+def _translate_packed(texts, target_lang):
+    lang_name = "Hindi" if target_lang == "hi" else "Telugu"
 
-    with open(input_path, 'r', encoding='utf-8') as f:
-        content = f.read()
+    segments = '\n'.join(f"[[{k}]]\n{text}" for k, text in enumerate(texts, 1))
+    prompt = PACKED_TEMPLATE.format(lang_name=lang_name, segments=segments)
 
-    frontmatter, body = parse_mdx(content)
+    result = query_ollama(prompt)
+    if not result:
+        return [None] * len(texts)
+    result = re.sub(r'<think>.*?</think>', '', result, flags=re.DOTALL)
+    return parse_packed(result, len(texts))
 
-    # extract title and description for translation
-    title_match = re.search(r'title:\s*"([^"]+)"', frontmatter)
-    desc_match = re.search(r'description:\s*"([^"]+)"', frontmatter)
 
-    title = title_match.group(1) if title_match else ""
-    desc = desc_match.group(1) if desc_match else ""
+def _translate_text(text, target_lang):
+    lang_name = "Hindi" if target_lang == "hi" else "Telugu"
 
-    # split body into chunks (paragraphs)
-    # keep import statement and translate the rest
-    import_line = ""
-    if body.startswith("import"):
-        first_newline = body.find('\n\n')
-        import_line = body[:first_newline]
-        body = body[first_newline:].strip()
+    prompt = PROMPT_TEMPLATE.format(lang_name=lang_name, text=text)
 
-    for lang in ['hi', 'te']:
-        lang_name = "Hindi" if lang == "hi" else "Telugu"
-        print(f"\nTranslating to {lang_name}...")
+    result = query_ollama(prompt)
+    if result:
+        # clean up any thinking tags or extra text
+        result = re.sub(r'<think>.*?</think>', '', result, flags=re.DOTALL)
+        result = result.strip()
+    return result
 
-        # translate title and description
-        print("  Translating title...")
-        translated_title = translate_text(title, lang)
-        if translated_title:
-            translated_title = translated_title.replace('"', "'").strip()
-        else:
-            translated_title = title
 
-        print("  Translating description...")
-        translated_desc = translate_text(desc, lang)
-        if translated_desc:
-            translated_desc = translated_desc.replace('"', "'").strip()
-        else:
-            translated_desc = desc
+def set_lang(frontmatter, lang):
+    """frontmatter with its lang: line set to lang"""
+    return re.sub(r'^lang:.*$', f'lang: "{lang}"', frontmatter, count=1, flags=re.MULTILINE)
 
-        # translate body in chunks
-        print("  Translating body...")
-        paragraphs = re.split(r'\n\n+', body)
-        translated_paragraphs = []
 
-        for i, para in enumerate(paragraphs):
-            # skip empty paragraphs and headers-only
-            if not para.strip():
-                translated_paragraphs.append(para)
-                continue
+def translate_essay(input_path, concurrency=CONCURRENCY, pack_tokens=0):
+    """Translate essay to Hindi and Telugu."""
+    print(f"Reading {input_path}...")
 
-            # keep markdown headers but translate text after ##
-            if para.strip().startswith('#'):
-                # translate header text
-                match = re.match(r'^(#+\s*)(.*)', para.strip())
-                if match:
-                    hashes, header_text = match.groups()
-                    translated_header = translate_text(header_text, lang)
-                    if translated_header:
-                        translated_paragraphs.append(f"{hashes}{translated_header.strip()}")
-                    else:
-                        translated_paragraphs.append(para)
-                continue
+    with open(input_path, 'r', encoding='utf-8') as f:
+        content = f.read()
 
-            # translate paragraph
-            print(f"    Paragraph {i+1}/{len(paragraphs)}...", end='\r')
-            translated = translate_text(para, lang)
-            if translated:
-                translated_paragraphs.append(translated)
-            else:
-                translated_paragraphs.append(para)
+    # prose, headings, quotes and the title/description go to the model;
+    # imports, code and JSX are copied through byte for byte (mdx.py)
+    tokens = mdx.tokenize(content, FRONTMATTER_FIELDS)
+    translatable = mdx.segments(tokens)
 
-        print(f"    Done translating {len(paragraphs)} paragraphs.")
+    # collect every segment of both languages up front so they can all be in
+    # flight at once
+    langs = ['hi', 'te']
+    jobs = [(text, lang) for lang in langs for _, text in translatable]
 
-        # rebuild
-        new_frontmatter = update_frontmatter(frontmatter, lang, translated_title, translated_desc)
-        new_body = '\n\n'.join(translated_paragraphs)
+    print(f"Translating {len(jobs)} segments (Hindi + Telugu, {concurrency} at a time)...")
+    metrics.count("segments", len(jobs))
+    with metrics.stage("translate"):
+        results = translate_all(jobs, concurrency, pack_tokens)
 
-        output = new_frontmatter + '\n' + import_line + '\n\n' + new_body
+    for k, lang in enumerate(langs):
+        lang_results = results[k * len(translatable):(k + 1) * len(translatable)]
+        # a segment that failed keeps its English text
+        translated = {i: result.strip() for (i, _), result in zip(translatable, lang_results) if result}
+        frontmatter, body = mdx.render_page(tokens, translated)
+        output = set_lang(frontmatter, lang) + body
 
         # write file
         output_path = input_path.replace('.en.mdx', f'.{lang}.mdx')
-        with open(output_path, 'w', encoding='utf-8') as f:
+        with metrics.stage("write"), open(output_path, 'w', encoding='utf-8') as f:
             f.write(output)
 
         print(f"Saved: {output_path}")
 
 
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: python scripts/translate-ollama.py <essay.en.mdx>")
-        sys.exit(1)
-
-    input_path = sys.argv[1]
+    global memory, session
+
+    parser = argparse.ArgumentParser(description="Translate an English MDX essay to Hindi and Telugu with Ollama.")
+    parser.add_argument("input", help="Path to the .en.mdx essay")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the translation memory")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help=f"Requests in flight (default {CONCURRENCY}, from OLLAMA_NUM_PARALLEL in this environment if set); set it to the server's parallel slots")
+    parser.add_argument("--pack", nargs='?', type=int, const=PACK_TOKENS, default=0, metavar="TOKENS",
+                        help=f"Pack several segments per request, up to TOKENS source tokens (default {PACK_TOKENS})")
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+
+    input_path = args.input
     if not os.path.exists(input_path):
         print(f"File not found: {input_path}")
         sys.exit(1)
 
-    translate_essay(input_path)
+    if not args.no_cache:
+        memory = TranslationMemory()
+    session = make_session(args.concurrency)
+
+    translate_essay(input_path, args.concurrency, args.pack)
+
+    if memory is not None:
+        print(memory.summary())
+        memory.close()
+    instrumentation.write_reports(args, memory)
     print("\nDone!")
 
 
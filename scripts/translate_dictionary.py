@@ -1,101 +1,354 @@
 import os
+import sys
 import json
-import torch
-from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+import queue
+import time
 from tqdm import tqdm
 import argparse
+import multiprocessing
 
-# Check for GPU
-device = "cuda" if torch.cuda.is_available() else "cpu"
-print(f"Using device: {device}")
+from translation_memory import TranslationMemory
+from nllb_backends import BACKENDS, DEFAULT_BACKEND, MODEL_NAME, load_backend
+from translation_client import connect_or_load
+from decoding import MIN_LOGPROB, greedy_first
+from batching import MAX_BATCH_TOKENS, BatchSizer
+from segmenter import run_chunked
+from dedup import SegmentIndex
+from journal import BatchJournal, atomic_write_json, journal_path, source_key
+import instrumentation
+from instrumentation import metrics
 
-model_name = "facebook/nllb-200-distilled-600M"
+model_name = MODEL_NAME
 
-def load_model():
-    print(f"Loading model {model_name}...")
-    tokenizer = AutoTokenizer.from_pretrained(model_name)
-    model = AutoModelForSeq2SeqLM.from_pretrained(model_name).to(device)
-    return tokenizer, model
+# How often run_workers checks for workers that died without reporting
+REPORT_POLL_SECONDS = 30
 
-def translate_batch(texts, tokenizer, model, src_lang="tel_Telu", tgt_lang="eng_Latn", batch_size=16):
-    # NLLB uses specific language codes. 
-    # Ensure source language is set correctly for tokenizer
-    tokenizer.src_lang = src_lang
-    
-    translated_texts = []
+generation_kwargs = {
+    "max_length": 512,
+    "no_repeat_ngram_size": 3,
+    "repetition_penalty": 1.5,
+    "num_beams": 4,
+    "early_stopping": True,
+}
+
+def load_model(backend=None, use_server=True):
+    # Returns an nllb_backends backend, or a client for a running translation
+    # server; backend=None means "whatever the server runs, else the default"
+    return connect_or_load(backend, model_name, use_server)
+
+# Dictionary field -> NLLB language code
+TARGET_FIELDS = {
+    "english": "eng_Latn",
+    "hindi": "hin_Deva",
+}
+
+def translate_multi(texts, backend, src_lang="tel_Telu", tgt_langs=("eng_Latn", "hin_Deva"), batch_size=64, max_tokens=MAX_BATCH_TOKENS, memory=None, progress=True, on_batch=None, sizer=None):
+    # Returns {tgt_lang: translations}; each batch is encoded once and decoded per target.
+    # on_batch(texts, [{tgt_lang: translation}, ...]) fires as each model batch finishes.
+    # With a batching.BatchSizer, max_tokens is only where its adaptive budget starts.
+    tgt_langs = list(tgt_langs)
+
+    # Serve what we can from the translation memory and only run the model on the rest
+    if memory is not None:
+        return memory.cached_multi(
+            texts,
+            lambda missing, tgts: translate_multi(missing, backend, src_lang, tgts, batch_size, max_tokens, progress=progress, on_batch=on_batch, sizer=sizer),
+            src_lang, tgt_langs, backend.id, model_name, generation_kwargs,
+        )
+
+    # A translation server batches (and sorts) on its side
+    if getattr(backend, "batches_server_side", False):
+        outputs = backend.generate_multi(texts, src_lang, tgt_langs, **generation_kwargs)
+        if on_batch is not None:
+            on_batch(texts, [{tgt: outputs[tgt][j] for tgt in tgt_langs} for j in range(len(texts))])
+        return outputs
+
+    def generate(batch):
+        outputs = backend.generate_multi(batch, src_lang, tgt_langs, **generation_kwargs)
+        return [{tgt: outputs[tgt][j] for tgt in tgt_langs} for j in range(len(batch))]
     
-    # Process in batches
-    for i in tqdm(range(0, len(texts), batch_size), desc="Translating batches"):
-        batch = texts[i:i+batch_size]
-        
-        # Tokenize
-        inputs = tokenizer(batch, return_tensors="pt", padding=True, truncation=True, max_length=512).to(device)
-        
-        # Generate translation
-        with torch.no_grad():
-            generated_tokens = model.generate(
-                **inputs,
-                forced_bos_token_id=tokenizer.convert_tokens_to_ids(tgt_lang),
-                max_length=512,
-                no_repeat_ngram_size=3,
-                repetition_penalty=1.5,
-                num_beams=4,
-                early_stopping=True
-            )
-            
-        # Decode
-        decoded = tokenizer.batch_decode(generated_tokens, skip_special_tokens=True)
-        translated_texts.extend(decoded)
-        
-    return translated_texts
+    # Split files mix 3-word headwords with 500-token definitions, so batch by
+    # tokenized length under a token budget rather than in file order; the
+    # longest definitions go in as sentence chunks rather than being truncated
+    results = run_chunked(
+        texts, backend.tokenizer, generate, max_tokens, batch_size,
+        progress=(lambda batches: tqdm(batches, desc="Translating batches")) if progress else None,
+        on_batch=on_batch, sizer=sizer,
+    )
+    return {tgt: [r[tgt] for r in results] for tgt in tgt_langs}
+
+def translate_batch(texts, backend, src_lang="tel_Telu", tgt_lang="eng_Latn", batch_size=64, max_tokens=MAX_BATCH_TOKENS, memory=None):
+    return translate_multi(texts, backend, src_lang, [tgt_lang], batch_size, max_tokens, memory)[tgt_lang]
 
-def process_file(file_path, tokenizer, model):
+def _load_split_file(file_path, targets, resume):
+    # Returns (data, restored) with journaled translations of an interrupted
+    # run replayed into data, or (None, 0) if the file cannot be read
     print(f"Processing {file_path}...")
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
+        with metrics.stage("load_json"), open(file_path, 'r', encoding='utf-8') as f:
             data = json.load(f)
     except Exception as e:
         print(f"Error reading {file_path}: {e}")
-        return
+        return None, 0
     
-    entries = data.get('entries', [])
-    modified = False
+    journal = BatchJournal(journal_path(file_path, "translate"))
+    restored = 0
     
-    entries_to_translate = []
-    indices = []
+    # Replay batches that finished before an interrupted run
+    if resume and journal.exists():
+        replayed = journal.replay()
+        for entry in data.get('entries', []):
+            key = source_key(entry.get('telugu', ''))
+            for field in targets:
+                value = replayed.get((key, field))
+                if value is not None and not entry.get(field, '').strip():
+                    entry[field] = value
+                    restored += 1
+        if restored:
+            print(f"Replayed {restored} journaled translations for {file_path}")
+    elif journal.exists():
+        print(f"Discarding journal from an interrupted run of {file_path} (use --resume to keep it)")
+        journal.remove()
+    return data, restored
+
+def process_files(file_paths, backend, targets=tuple(TARGET_FIELDS), batch_size=64, max_tokens=MAX_BATCH_TOKENS, memory=None, progress=True, resume=False, sizer=None):
+    # Returns the number of entries that were translated. Identical Telugu
+    # texts across all of file_paths are translated once (dedup.py).
+    loaded = {}
+    modified = set()
     
-    for i, entry in enumerate(entries):
-        telugu_text = entry.get('telugu', '').strip()
-        english_text = entry.get('english', '').strip()
-        
-        # Only translate if telugu exists and english is empty
-        if telugu_text and not english_text:
-            entries_to_translate.append(telugu_text)
-            indices.append(i)
-    
-    if entries_to_translate:
-        print(f"Found {len(entries_to_translate)} entries to translate in {file_path}")
-        translations = translate_batch(entries_to_translate, tokenizer, model)
+    # Group entries by the set of target fields they are missing, so each
+    # Telugu text is encoded once for all of its missing targets
+    groups = {}
+    
+    for file_path in file_paths:
+        data, restored = _load_split_file(file_path, targets, resume)
+        if data is None:
+            continue
+        loaded[file_path] = data
+        metrics.count("files")
+        if restored:
+            modified.add(file_path)
         
-        for idx, translation in zip(indices, translations):
-            entries[idx]['english'] = translation
+        found = 0
+        for i, entry in enumerate(data.get('entries', [])):
+            telugu_text = entry.get('telugu', '').strip()
+            if not telugu_text:
+                continue
             
-        modified = True
+            # Only translate into fields that are still empty
+            missing = tuple(field for field in targets if not entry.get(field, '').strip())
+            if missing:
+                groups.setdefault(missing, SegmentIndex()).add(telugu_text, (file_path, i))
+                found += 1
+        if found:
+            print(f"Found {found} entries to translate in {file_path}")
+        elif not restored:
+            print(f"No new translations needed for {file_path}")
+    
+    journals = {file_path: BatchJournal(journal_path(file_path, "translate")) for file_path in loaded}
+    translated = 0
+    
+    for fields, index in groups.items():
+        tgt_langs = [TARGET_FIELDS[field] for field in fields]
+        texts = index.unique()
+        print(f"Translating {len(texts)} unique texts into {', '.join(fields)}")
+        index.report("entries")
         
-        if modified:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-            print(f"Saved updates to {file_path}")
-    else:
-        print(f"No new translations needed for {file_path}")
+        def record(batch_texts, outputs, fields=fields, tgt_langs=tgt_langs, index=index):
+            # Write-ahead: the batch is durable in the journal of every split
+            # file that holds one of its texts before we move on
+            records = {}
+            for (file_path, _), original, out in index.fan_out(batch_texts, outputs):
+                records.setdefault(file_path, []).extend(
+                    {"key": source_key(original), "field": field, "value": out[tgt_lang]}
+                    for field, tgt_lang in zip(fields, tgt_langs)
+                )
+            for file_path, file_records in records.items():
+                journals[file_path].append(file_records)
+        
+        translations = translate_multi(texts, backend, tgt_langs=tgt_langs, batch_size=batch_size, max_tokens=max_tokens, memory=memory, progress=progress, on_batch=record, sizer=sizer)
+        
+        for field, tgt_lang in zip(fields, tgt_langs):
+            for (file_path, i), _, translation in index.fan_out(texts, translations[tgt_lang]):
+                loaded[file_path]['entries'][i][field] = translation
+                modified.add(file_path)
+        translated += index.segments
+    
+    # One rewrite per file, however many target languages were filled in
+    for file_path in file_paths:
+        if file_path not in modified:
+            continue
+        with metrics.stage("write_json"):
+            atomic_write_json(file_path, loaded[file_path])
+        journals[file_path].remove()
+        print(f"Saved updates to {file_path}")
+    metrics.count("entries_translated", translated)
+    return translated
+
+def process_file(file_path, backend, targets=tuple(TARGET_FIELDS), batch_size=64, max_tokens=MAX_BATCH_TOKENS, memory=None, progress=True, resume=False, sizer=None):
+    # Returns the number of entries that were translated
+    return process_files([file_path], backend, targets, batch_size, max_tokens, memory, progress, resume, sizer)
 
-def main():
-    parser = argparse.ArgumentParser(description="Translate dictionary entries.")
+def estimate_file_tokens(file_path, targets):
+    # Rough count of source tokens still to decode in a split file, used only
+    # to balance files across workers (~4 characters per NLLB token for Telugu)
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except Exception:
+        return 0
+    
+    total = 0
+    for entry in data.get('entries', []):
+        telugu_text = entry.get('telugu', '').strip()
+        if telugu_text:
+            missing = sum(1 for field in targets if not entry.get(field, '').strip())
+            total += missing * (len(telugu_text) // 4 + 1)
+    return total
+
+def balance_files(file_loads, workers):
+    # Longest-first greedy assignment: each file goes to the least loaded worker
+    shards = [[] for _ in range(workers)]
+    totals = [0] * workers
+    for file_path, load in sorted(file_loads, key=lambda x: x[1], reverse=True):
+        i = totals.index(min(totals))
+        shards[i].append((file_path, load))
+        totals[i] += load
+    return shards
+
+def _worker(worker_id, shard, backend_name, targets, batch_size, max_tokens, use_memory, threads, resume, reports, adaptive, memory_budget, workers, greedy_min_logprob):
+    # Runs in a spawned child, which loads its own model with its share of
+    # the cores. Neither torch's OpenMP pool nor ctranslate2's native thread
+    # pools survive a fork of a process that has already used them.
+    metrics.reset()
+    memory = None
+    try:
+        backend = load_backend(backend_name, model_name, threads=threads)
+        
+        if greedy_min_logprob is not None:
+            backend = greedy_first(backend, greedy_min_logprob)
+        # each worker gets an equal share of the memory budget
+        sizer = BatchSizer.for_backend(backend, max_tokens, memory_budget, workers) if adaptive else None
+        memory = TranslationMemory() if use_memory else None
+        for file_path, load in shard:
+            start = time.perf_counter()
+            translated = process_file(file_path, backend, targets, batch_size, max_tokens, memory, progress=False, resume=resume, sizer=sizer)
+            reports.put((worker_id, os.path.basename(file_path), translated, load, time.perf_counter() - start))
+    finally:
+        # The last message carries this worker's metrics back to the parent.
+        # It is sent even when a file fails, so the parent never waits on a
+        # worker that has already given up; the exception still sets the
+        # exit code.
+        if memory is not None:
+            metrics.count("memory_hits", memory.hits)
+            metrics.count("memory_misses", memory.misses)
+            memory.close()
+        reports.put((worker_id, None, 0, 0, metrics.snapshot()))
+
+def run_workers(file_paths, backend_name, targets, workers, batch_size, max_tokens, use_memory, threads=None, resume=False, adaptive=True, memory_budget=None, greedy_min_logprob=None):
+    threads = threads or max(1, (os.cpu_count() or 1) // workers)
+    file_loads = [(path, estimate_file_tokens(path, targets)) for path in file_paths]
+    # Files with a pending journal still need a resume pass even if the
+    # estimate says there is nothing left to translate
+    file_loads = [
+        (path, load) for path, load in file_loads
+        if load > 0 or (resume and BatchJournal(journal_path(path, "translate")).exists())
+    ]
+    if not file_loads:
+        print("No new translations needed.")
+        return
+    
+    shards = [shard for shard in balance_files(file_loads, workers) if shard]
+    total_load = sum(load for _, load in file_loads)
+    print(f"Translating {len(file_loads)} files (~{total_load} tokens) on {len(shards)} workers x {threads} threads")
+    for i, shard in enumerate(shards):
+        print(f"  worker {i}: {len(shard)} files, ~{sum(load for _, load in shard)} tokens")
+    
+    ctx = multiprocessing.get_context("spawn")
+    reports = ctx.Queue()
+    procs = [
+        ctx.Process(target=_worker, args=(i, shard, backend_name, targets, batch_size, max_tokens, use_memory, threads, resume, reports, adaptive, memory_budget, len(shards), greedy_min_logprob))
+        for i, shard in enumerate(shards)
+    ]
+    
+    start = time.perf_counter()
+    for proc in procs:
+        proc.start()
+    
+    done_files = 0
+    done_entries = 0
+    done_tokens = 0
+    per_worker = [[0, 0.0] for _ in shards]
+    running = set(range(len(procs)))
+    dead = set()
+    while running:
+        try:
+            worker_id, filename, translated, load, seconds = reports.get(timeout=REPORT_POLL_SECONDS)
+        except queue.Empty:
+            # A worker killed outright (e.g. by the OOM killer) never sends its
+            # last message. Give up on it only if it was already dead at the
+            # previous poll, so a report still in the pipe is not lost.
+            for i in dead & running:
+                print(f"worker {i} died (exit code {procs[i].exitcode}) without reporting")
+                running.discard(i)
+            dead = {i for i in running if not procs[i].is_alive()}
+            continue
+        if filename is None:
+            metrics.merge(seconds)  # the worker's snapshot in place of a duration
+            running.discard(worker_id)
+            continue
+        done_files += 1
+        done_entries += translated
+        done_tokens += load
+        per_worker[worker_id][0] += load
+        per_worker[worker_id][1] += seconds
+        elapsed = time.perf_counter() - start
+        print(f"[{done_files}/{len(file_loads)}] worker {worker_id} finished {filename}: "
+              f"{translated} entries in {seconds:.1f}s | total {done_entries} entries, "
+              f"{done_tokens / elapsed:.0f} tok/s")
+    
+    for proc in procs:
+        proc.join()
+    
+    elapsed = time.perf_counter() - start
+    print(f"\n=== Workers Complete ===")
+    print(f"Files: {done_files}, entries: {done_entries}, ~{done_tokens} source tokens in {elapsed:.1f}s "
+          f"({done_tokens / elapsed:.0f} tok/s overall)")
+    for i, (tokens, seconds) in enumerate(per_worker):
+        rate = tokens / seconds if seconds else 0.0
+        print(f"  worker {i}: ~{tokens} tokens in {seconds:.1f}s ({rate:.0f} tok/s)")
+    failed = [i for i, proc in enumerate(procs) if proc.exitcode != 0]
+    if failed:
+        print(f"Workers exited with errors: {failed}")
+    return failed
+
+def main(default_targets=tuple(TARGET_FIELDS), description="Translate dictionary entries."):
+    parser = argparse.ArgumentParser(description=description)
     parser.add_argument("--dir", default=None, help="Directory containing split json files. Defaults to ../src/data/dictionary_split relative to script")
     parser.add_argument("--file", help="Specific file to translate")
-    parser.add_argument("--batch-size", type=int, default=16, help="Batch size for translation")
+    parser.add_argument("--targets", default=",".join(default_targets), help="Comma-separated fields to fill in: english,hindi")
+    parser.add_argument("--batch-size", type=int, default=64, help="Maximum entries per batch")
+    parser.add_argument("--max-tokens", type=int, default=MAX_BATCH_TOKENS, help="Padded source tokens per batch; where the adaptive budget starts")
+    parser.add_argument("--memory-budget", type=float, default=None, metavar="MB", help="Memory batches may use (default: 70%% of what is available at start)")
+    parser.add_argument("--fixed-batches", action="store_true", help="Keep the --max-tokens budget instead of adapting it to memory use")
+    parser.add_argument("--greedy-first", action="store_true", help="Decode greedily and use beam search only for unsure or looping output")
+    parser.add_argument("--min-logprob", type=float, default=MIN_LOGPROB, help=f"Mean token log-probability below which --greedy-first re-decodes (default {MIN_LOGPROB})")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the translation memory")
+    parser.add_argument("--backend", default=None, choices=BACKENDS, help=f"Inference backend, ct2 = int8 CPU (default: the server's, else {DEFAULT_BACKEND})")
+    parser.add_argument("--no-server", action="store_true", help="Always load the model locally, even if a translation server is running")
+    parser.add_argument("--resume", action="store_true", help="Replay the journal of an interrupted run instead of discarding it")
+    parser.add_argument("--workers", type=int, default=1, help="Translate split files in N processes, balanced by estimated tokens")
+    parser.add_argument("--threads-per-worker", type=int, default=None, help="Torch/CTranslate2 threads per worker (default: cores / workers)")
+    instrumentation.add_arguments(parser)
     args = parser.parse_args()
     
+    targets = tuple(t.strip() for t in args.targets.split(',') if t.strip())
+    greedy_min_logprob = args.min_logprob if args.greedy_first else None
+    unknown = [t for t in targets if t not in TARGET_FIELDS]
+    if unknown:
+        parser.error(f"unknown target field(s): {', '.join(unknown)}")
+    
     # Determine directory
     if args.dir is None:
         script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -103,10 +356,27 @@ def main():
     else:
         target_dir = args.dir
 
-    tokenizer, model = load_model()
+    if args.workers > 1 and not args.file:
+        if not os.path.exists(target_dir):
+            print(f"Directory {target_dir} does not exist.")
+            return
+        files = sorted(os.path.join(target_dir, f) for f in os.listdir(target_dir) if f.endswith('.json'))
+        failed = run_workers(files, args.backend or DEFAULT_BACKEND, targets, args.workers,
+                             args.batch_size, args.max_tokens, not args.no_cache, args.threads_per_worker, args.resume,
+                             not args.fixed_batches, args.memory_budget, greedy_min_logprob)
+        instrumentation.write_reports(args)
+        if failed:
+            sys.exit(1)
+        return
+    
+    backend = load_model(args.backend, use_server=not args.no_server)
+    if greedy_min_logprob is not None:
+        backend = greedy_first(backend, greedy_min_logprob)
+    memory = None if args.no_cache else TranslationMemory()
+    sizer = None if args.fixed_batches else BatchSizer.for_backend(backend, args.max_tokens, args.memory_budget)
     
     if args.file:
-        process_file(args.file, tokenizer, model)
+        process_file(args.file, backend, targets, args.batch_size, args.max_tokens, memory, resume=args.resume, sizer=sizer)
     else:
         # Process directory
         if not os.path.exists(target_dir):
@@ -117,9 +387,15 @@ def main():
         files.sort()
         
         print(f"Found {len(files)} JSON files in {target_dir}")
-        for filename in files:
-            file_path = os.path.join(target_dir, filename)
-            process_file(file_path, tokenizer, model)
+        # the whole directory is one run, so a headword repeated across
+        # split files is translated once
+        file_paths = [os.path.join(target_dir, filename) for filename in files]
+        process_files(file_paths, backend, targets, args.batch_size, args.max_tokens, memory, resume=args.resume, sizer=sizer)
+
+    if memory is not None:
+        print(memory.summary())
+        memory.close()
+    instrumentation.write_reports(args, memory)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,98 @@
+"""
+Client for translation_server.py.
+
+RemoteBackend has the same generate()/generate_multi() surface as the
+backends in nllb_backends.py, but sends the work to a running server, which
+does its own length-sorted batching. connect_or_load() is what the scripts
+call: it uses the server when one is answering and loads the model locally
+otherwise.
+"""
+
+import os
+import json
+import urllib.error
+import urllib.request
+
+from nllb_backends import MODEL_NAME, load_backend
+from instrumentation import metrics
+
+SERVER_URL = os.environ.get("AYAMATMA_TRANSLATE_SERVER", "http://127.0.0.1:8765")
+
+
+def _request(url, payload=None, timeout=5):
+    data = None
+    headers = {}
+    if payload is not None:
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        headers["Content-Type"] = "application/json; charset=utf-8"
+    req = urllib.request.Request(url, data=data, headers=headers)
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        return json.loads(resp.read().decode("utf-8"))
+
+
+def server_health(url=SERVER_URL):
+    """the server's /health payload, or None if nothing is listening"""
+    try:
+        return _request(f"{url}/health", timeout=1)
+    except (urllib.error.URLError, OSError, ValueError):
+        return None
+
+
+class RemoteBackend:
+    # the server batches across clients, so callers should send everything at once
+    batches_server_side = True
+    tokenizer = None
+
+    def __init__(self, url, health):
+        self.url = url
+        self.name = health["backend"]
+        self.id = health.get("id", self.name)
+        self.model_name = health["model"]
+        self.device = "remote"
+
+    def generate(self, texts, src_lang, tgt_lang, **generation_kwargs):
+        return self.generate_multi(texts, src_lang, [tgt_lang], **generation_kwargs)[tgt_lang]
+
+    def generate_multi(self, texts, src_lang, tgt_langs, **generation_kwargs):
+        # tokenization and generation happen in the server process
+        with metrics.stage("server_request"):
+            response = _request(
+                f"{self.url}/translate",
+                {
+                    "texts": list(texts),
+                    "src_lang": src_lang,
+                    "tgt_langs": list(tgt_langs),
+                    "generation": generation_kwargs,
+                },
+                timeout=None,
+            )
+        return response["translations"]
+
+    def stats(self):
+        return _request(f"{self.url}/stats")
+
+
+def usable_server(backend=None, model_name=MODEL_NAME, use_server=True, url=SERVER_URL):
+    """the /health payload of a running server that connect_or_load() would use, else None"""
+    if not use_server:
+        return None
+    health = server_health(url)
+    if health and health.get("model") == model_name and backend in (None, health.get("backend")):
+        return health
+    return None
+
+
+def connect_or_load(backend=None, model_name=MODEL_NAME, use_server=True, url=SERVER_URL):
+    """
+    Return a RemoteBackend if a server with the same model is running,
+    otherwise load backend locally. backend=None accepts whatever the server
+    runs, falling back to the default local backend.
+    """
+    health = usable_server(backend, model_name, use_server, url)
+    if health:
+        print(f"Using translation server at {url} ({health['backend']}, {health['model']})")
+        return RemoteBackend(url, health)
+
+    if backend is None:
+        return load_backend(model_name=model_name)
+    return load_backend(backend, model_name)
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+On-disk translation memory shared by the translation scripts.
+
+Every translated segment is stored in a SQLite file keyed by a hash of the
+source text, the source/target language, the backend, the model name and the
+generation parameters. Changing any of those misses the cache rather than
+returning a translation produced under different settings.
+
+Usage: python scripts/translation_memory.py [stats|clear] [--path FILE]
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import sqlite3
+import argparse
+
+DEFAULT_PATH = os.environ.get(
+    'AYAMATMA_TM_PATH',
+    os.path.join(os.path.expanduser('~'), '.cache', 'ayamatma', 'translation_memory.sqlite'),
+)
+DEFAULT_MAX_ENTRIES = int(os.environ.get('AYAMATMA_TM_MAX_ENTRIES', 250000))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS segments (
+    key TEXT PRIMARY KEY,
+    src_lang TEXT NOT NULL,
+    tgt_lang TEXT NOT NULL,
+    backend TEXT NOT NULL,
+    model TEXT NOT NULL,
+    translation TEXT NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS segments_last_used ON segments (last_used);
+"""
+
+
+def make_key(text, src_lang, tgt_lang, backend, model, params):
+    """hash everything that can change the output of a translation"""
+    payload = json.dumps(
+        [text, src_lang, tgt_lang, backend, model, params or {}],
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class TranslationMemory:
+    def __init__(self, path=DEFAULT_PATH, max_entries=DEFAULT_MAX_ENTRIES, check_same_thread=True):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self.conn = sqlite3.connect(path, check_same_thread=check_same_thread)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def lookup(self, texts, src_lang, tgt_lang, backend, model, params):
+        """Return a list aligned with texts: the cached translation or None."""
+        keys = [make_key(t, src_lang, tgt_lang, backend, model, params) for t in texts]
+        found = {}
+
+        # sqlite caps the number of bound variables, so query in chunks
+        unique_keys = list(dict.fromkeys(keys))
+        for i in range(0, len(unique_keys), 500):
+            chunk = unique_keys[i:i+500]
+            placeholders = ','.join('?' * len(chunk))
+            rows = self.conn.execute(
+                f'SELECT key, translation FROM segments WHERE key IN ({placeholders})',
+                chunk,
+            )
+            found.update(rows.fetchall())
+
+        if found:
+            now = time.time()
+            self.conn.executemany(
+                'UPDATE segments SET last_used = ? WHERE key = ?',
+                [(now, k) for k in found],
+            )
+            self.conn.commit()
+
+        results = [found.get(k) for k in keys]
+        hits = sum(1 for r in results if r is not None)
+        self.hits += hits
+        self.misses += len(results) - hits
+        return results
+
+    def store(self, texts, translations, src_lang, tgt_lang, backend, model, params):
+        """Record translations for texts and evict the least recently used overflow."""
+        now = time.time()
+        rows = [
+            (make_key(t, src_lang, tgt_lang, backend, model, params),
+             src_lang, tgt_lang, backend, model, tr, now, now)
+            for t, tr in zip(texts, translations)
+            if tr is not None
+        ]
+        if not rows:
+            return
+        self.conn.executemany(
+            'INSERT OR REPLACE INTO segments '
+            '(key, src_lang, tgt_lang, backend, model, translation, created, last_used) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            rows,
+        )
+        self.conn.commit()
+        self.evict()
+
+    def cached(self, texts, translate_fn, src_lang, tgt_lang, backend, model, params):
+        """
+        Translate texts through the memory.
+
+        translate_fn receives only the unique texts that missed the cache and
+        must return their translations in the same order.
+        """
+        results = self.lookup(texts, src_lang, tgt_lang, backend, model, params)
+
+        missing = list(dict.fromkeys(t for t, r in zip(texts, results) if r is None))
+        if missing:
+            translated = translate_fn(missing)
+            self.store(missing, translated, src_lang, tgt_lang, backend, model, params)
+            by_text = dict(zip(missing, translated))
+            results = [by_text[t] if r is None else r for t, r in zip(texts, results)]
+
+        return results
+
+    def cached_multi(self, texts, translate_fn, src_lang, tgt_langs, backend, model, params):
+        """
+        Multi-target variant of cached().
+
+        translate_fn(texts, tgt_langs) must return {tgt_lang: translations}.
+        Texts are grouped by the set of targets they are missing, so a text
+        cached for one language is only decoded into the others.
+        """
+        results = {
+            tgt: self.lookup(texts, src_lang, tgt, backend, model, params)
+            for tgt in tgt_langs
+        }
+
+        groups = {}
+        for i, text in enumerate(texts):
+            missing = tuple(tgt for tgt in tgt_langs if results[tgt][i] is None)
+            if missing:
+                groups.setdefault(missing, {}).setdefault(text, []).append(i)
+
+        for missing, positions in groups.items():
+            unique = list(positions)
+            translated = translate_fn(unique, list(missing))
+            for tgt in missing:
+                self.store(unique, translated[tgt], src_lang, tgt, backend, model, params)
+                for text, tr in zip(unique, translated[tgt]):
+                    for i in positions[text]:
+                        results[tgt][i] = tr
+
+        return results
+
+    def evict(self):
+        """Drop the least recently used entries beyond max_entries."""
+        if not self.max_entries:
+            return
+        (count,) = self.conn.execute('SELECT COUNT(*) FROM segments').fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self.conn.execute(
+                'DELETE FROM segments WHERE key IN '
+                '(SELECT key FROM segments ORDER BY last_used ASC LIMIT ?)',
+                (overflow,),
+            )
+            self.conn.commit()
+
+    def clear(self):
+        self.conn.execute('DELETE FROM segments')
+        self.conn.commit()
+        self.conn.execute('VACUUM')
+
+    def stats(self):
+        (count,) = self.conn.execute('SELECT COUNT(*) FROM segments').fetchone()
+        lookups = self.hits + self.misses
+        return {
+            'path': self.path,
+            'entries': count,
+            'max_entries': self.max_entries,
+            'bytes': os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    def summary(self):
+        s = self.stats()
+        return (f"Translation memory: {s['hits']} hits, {s['misses']} misses "
+                f"({100*s['hit_rate']:.1f}% hit rate), {s['entries']} entries stored")
+
+    def close(self):
+        self.conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or clear the translation memory.")
+    parser.add_argument("command", nargs='?', default='stats', choices=['stats', 'clear'])
+    parser.add_argument("--path", default=DEFAULT_PATH, help="SQLite file holding the memory")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.path):
+        print(f"No translation memory at {args.path}")
+        sys.exit(0)
+
+    memory = TranslationMemory(args.path)
+    if args.command == 'clear':
+        memory.clear()
+        print(f"Cleared {args.path}")
+    else:
+        print(json.dumps(memory.stats(), indent=2))
+    memory.close()
+
+
+if __name__ == "__main__":
+    main()
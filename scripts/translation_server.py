@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Long-running translation server that keeps NLLB resident.
+
+Loading torch, transformers and the NLLB weights takes several seconds, which
+dominates small runs. This server pays that once and answers requests over
+localhost HTTP. Requests that arrive close together are coalesced into shared
+length-sorted batches, so several clients translating at once share the model.
+
+Endpoints:
+  GET  /health      liveness plus backend and model name
+  GET  /stats       request, batch and translation memory counters
+  POST /translate   {"texts": [...], "src_lang": "eng_Latn",
+                     "tgt_langs": ["hin_Deva"], "generation": {...}}
+                    -> {"translations": {"hin_Deva": [...]}}
+
+The translation scripts use the server automatically when it is running
+(see translation_client.py).
+
+Usage: python scripts/translation_server.py [--port 8765] [--backend hf|ct2] [--no-cache]
+"""
+
+import json
+import time
+import queue
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from translation_memory import TranslationMemory
+from batching import MAX_BATCH_TOKENS, MAX_BATCH_ITEMS, BatchSizer
+from segmenter import run_chunked
+from nllb_backends import BACKENDS, DEFAULT_BACKEND, MODEL_NAME, load_backend
+from decoding import MIN_LOGPROB, GreedyFirst
+from instrumentation import metrics
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# how long the worker waits for more requests before starting a batch
+COALESCE_WINDOW = 0.02
+
+
+class Job:
+    def __init__(self, texts, src_lang, tgt_langs, generation):
+        self.texts = texts
+        self.src_lang = src_lang
+        self.tgt_langs = tgt_langs
+        self.generation = generation
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+    def group_key(self):
+        return (self.src_lang, tuple(self.tgt_langs), json.dumps(self.generation, sort_keys=True))
+
+
+class BatchingWorker(threading.Thread):
+    """Single thread that owns the model and runs coalesced jobs."""
+
+    def __init__(self, backend, memory=None, max_tokens=MAX_BATCH_TOKENS, max_items=MAX_BATCH_ITEMS,
+                 adaptive=True, memory_budget=None):
+        super().__init__(daemon=True)
+        self.backend = backend
+        self.memory = memory
+        self.max_tokens = max_tokens
+        self.max_items = max_items
+        self.adaptive = adaptive
+        self.memory_budget = memory_budget
+        # one adaptive budget per generation settings; beams and max_length change the cost per token
+        self.sizers = {}
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.counters = {
+            "requests": 0,
+            "texts": 0,
+            "model_texts": 0,
+            "batches": 0,
+            "coalesced_rounds": 0,
+            "busy_seconds": 0.0,
+            "errors": 0,
+        }
+
+    def submit(self, texts, src_lang, tgt_langs, generation):
+        job = Job(texts, src_lang, tgt_langs, generation)
+        self.queue.put(job)
+        job.done.wait()
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def run(self):
+        while True:
+            jobs = [self.queue.get()]
+            deadline = time.monotonic() + COALESCE_WINDOW
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    jobs.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            groups = {}
+            for job in jobs:
+                groups.setdefault(job.group_key(), []).append(job)
+
+            start = time.perf_counter()
+            for group in groups.values():
+                self._run_group(group)
+            with self.lock:
+                self.counters["busy_seconds"] += time.perf_counter() - start
+                self.counters["coalesced_rounds"] += 1
+
+    def _run_group(self, jobs):
+        first = jobs[0]
+        texts = [text for job in jobs for text in job.texts]
+
+        try:
+            if self.memory is not None:
+                translated = self.memory.cached_multi(
+                    texts,
+                    lambda missing, tgts: self._translate(missing, first.src_lang, tgts, first.generation),
+                    first.src_lang, first.tgt_langs, self.backend.id, self.backend.model_name, first.generation,
+                )
+            else:
+                translated = self._translate(texts, first.src_lang, first.tgt_langs, first.generation)
+        except Exception as e:
+            with self.lock:
+                self.counters["errors"] += len(jobs)
+            for job in jobs:
+                job.error = e
+                job.done.set()
+            return
+
+        offset = 0
+        for job in jobs:
+            n = len(job.texts)
+            job.result = {tgt: translated[tgt][offset:offset+n] for tgt in job.tgt_langs}
+            offset += n
+            job.done.set()
+
+        with self.lock:
+            self.counters["requests"] += len(jobs)
+            self.counters["texts"] += len(texts)
+
+    def _translate(self, texts, src_lang, tgt_langs, generation):
+        def generate(batch):
+            outputs = self.backend.generate_multi(batch, src_lang, tgt_langs, **generation)
+            with self.lock:
+                self.counters["batches"] += 1
+            return [{tgt: outputs[tgt][j] for tgt in tgt_langs} for j in range(len(batch))]
+
+        sizer = None
+        if self.adaptive:
+            key = json.dumps(generation, sort_keys=True)
+            if key not in self.sizers:
+                self.sizers[key] = BatchSizer.for_backend(self.backend, self.max_tokens, self.memory_budget)
+            sizer = self.sizers[key]
+
+        results = run_chunked(texts, self.backend.tokenizer, generate, self.max_tokens, self.max_items, sizer=sizer)
+        with self.lock:
+            self.counters["model_texts"] += len(texts)
+        return {tgt: [r[tgt] for r in results] for tgt in tgt_langs}
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        stats["uptime_seconds"] = time.time() - self.started
+        stats["queue_depth"] = self.queue.qsize()
+        sizers = list(self.sizers.items())
+        stats["batch_tokens"] = {key: sizer.max_tokens for key, sizer in sizers}
+        stats["out_of_memory_retries"] = sum(sizer.out_of_memory for _, sizer in sizers)
+        stats["chunked_texts"] = metrics.counters.get("chunked_texts", 0)
+        if isinstance(self.backend, GreedyFirst):
+            stats["greedy_outputs"] = metrics.counters.get("greedy_outputs", 0)
+            stats["escalated_outputs"] = metrics.counters.get("escalated_outputs", 0)
+        stats["backend"] = self.backend.name
+        stats["model"] = self.backend.model_name
+        if self.memory is not None:
+            # the sqlite connection belongs to the worker thread; only report counters
+            stats["memory"] = {"hits": self.memory.hits, "misses": self.memory.misses}
+        return stats
+
+
+class Handler(BaseHTTPRequestHandler):
+    worker = None
+
+    def _send(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send(200, {
+                "status": "ok",
+                "backend": self.worker.backend.name,
+                "id": self.worker.backend.id,
+                "model": self.worker.backend.model_name,
+            })
+        elif self.path == "/stats":
+            self._send(200, self.worker.stats())
+        else:
+            self._send(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/translate":
+            self._send(404, {"error": f"unknown path {self.path}"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length).decode("utf-8"))
+            texts = list(request["texts"])
+            src_lang = request["src_lang"]
+            tgt_langs = list(request["tgt_langs"])
+            generation = dict(request.get("generation", {}))
+        except (ValueError, KeyError, TypeError) as e:
+            self._send(400, {"error": f"bad request: {e}"})
+            return
+
+        if not texts:
+            self._send(200, {"translations": {tgt: [] for tgt in tgt_langs}})
+            return
+
+        try:
+            translations = self.worker.submit(texts, src_lang, tgt_langs, generation)
+        except Exception as e:
+            self._send(500, {"error": str(e)})
+            return
+        self._send(200, {"translations": translations})
+
+    def log_message(self, format, *args):
+        # keep the console for our own progress lines
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve NLLB translations over localhost HTTP.")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="Interface to bind (keep it local)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port to listen on")
+    parser.add_argument("--backend", default=DEFAULT_BACKEND, choices=BACKENDS, help="Inference backend")
+    parser.add_argument("--model", default=MODEL_NAME, help="Hugging Face model name")
+    parser.add_argument("--max-tokens", type=int, default=MAX_BATCH_TOKENS, help="Padded source tokens per batch; where the adaptive budget starts")
+    parser.add_argument("--memory-budget", type=float, default=None, metavar="MB", help="Memory batches may use (default: 70%% of what is available at start)")
+    parser.add_argument("--fixed-batches", action="store_true", help="Keep the --max-tokens budget instead of adapting it to memory use")
+    parser.add_argument("--batch-size", type=int, default=MAX_BATCH_ITEMS, help="Maximum texts per batch")
+    parser.add_argument("--greedy-first", action="store_true", help="Decode greedily and use beam search only for unsure or looping output")
+    parser.add_argument("--min-logprob", type=float, default=MIN_LOGPROB, help=f"Mean token log-probability below which --greedy-first re-decodes (default {MIN_LOGPROB})")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the translation memory")
+    args = parser.parse_args()
+
+    backend = load_backend(args.backend, args.model)
+    if args.greedy_first:
+        # clients see the backend as "<name>+greedy", so its output is cached apart
+        backend = GreedyFirst(backend, args.min_logprob)
+    # opened here but only ever used from the worker thread
+    memory = None if args.no_cache else TranslationMemory(check_same_thread=False)
+
+    worker = BatchingWorker(backend, memory, args.max_tokens, args.batch_size,
+                            not args.fixed_batches, args.memory_budget)
+    worker.start()
+
+    Handler.worker = worker
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    print(f"Translation server on http://{args.host}:{args.port} ({backend.name}, {backend.model_name})")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down.")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Table-driven Telugu -> IAST / Devanagari transliteration.
+
+Produces the same output as indic_transliteration's
+transliterate(text, sanscript.TELUGU, sanscript.IAST | sanscript.DEVANAGARI),
+without walking the text one token at a time in Python. A conversion is three
+C-level passes over the string:
+
+1. rewrite the few sequences that are not a plain character mapping
+   (ౝ -> న్, and ఓం -> ॐ for Devanagari),
+2. for IAST, add the inherent 'a' after every consonant that is not followed
+   by a vowel sign or virama,
+3. str.translate with a per-character table.
+
+Characters outside the tables (Latin, punctuation, digits of other scripts)
+pass through unchanged, as they do in indic_transliteration.
+
+Results are memoized, and transliterate_batch() converts many strings in one
+pass, so whole essays and verse collections are cheap to convert at build time.
+"""
+
+import re
+import sys
+import argparse
+
+# scheme names, same values as indic_transliteration.sanscript
+TELUGU = 'telugu'
+DEVANAGARI = 'devanagari'
+IAST = 'iast'
+
+CACHE_SIZE = 65536
+
+# (telugu, devanagari, iast)
+VOWELS = [
+    ('అ', 'अ', 'a'), ('ఆ', 'आ', 'ā'), ('ఇ', 'इ', 'i'), ('ఈ', 'ई', 'ī'),
+    ('ఉ', 'उ', 'u'), ('ఊ', 'ऊ', 'ū'), ('ఋ', 'ऋ', 'ṛ'), ('ౠ', 'ॠ', 'ṝ'),
+    ('ఌ', 'ऌ', 'ḷ'), ('ౡ', 'ॡ', 'ḹ'), ('ఎ', 'ऎ', 'è'), ('ఏ', 'ए', 'e'),
+    ('ఐ', 'ऐ', 'ai'), ('ఒ', 'ऒ', 'ò'), ('ఓ', 'ओ', 'o'), ('ఔ', 'औ', 'au'),
+]
+
+VOWEL_SIGNS = [
+    ('ా', 'ा', 'ā'), ('ి', 'ि', 'i'), ('ీ', 'ी', 'ī'), ('ు', 'ु', 'u'),
+    ('ూ', 'ू', 'ū'), ('ృ', 'ृ', 'ṛ'), ('ౄ', 'ॄ', 'ṝ'), ('ౢ', 'ॢ', 'ḷ'),
+    ('ౣ', 'ॣ', 'ḹ'), ('ె', 'ॆ', 'è'), ('ే', 'े', 'e'), ('ై', 'ै', 'ai'),
+    ('ొ', 'ॊ', 'ò'), ('ో', 'ो', 'o'), ('ౌ', 'ौ', 'au'),
+]
+
+VIRAMA = ('్', '्', '')
+
+CONSONANTS = [
+    ('క', 'क', 'k'), ('ఖ', 'ख', 'kh'), ('గ', 'ग', 'g'), ('ఘ', 'घ', 'gh'), ('ఙ', 'ङ', 'ṅ'),
+    ('చ', 'च', 'c'), ('ఛ', 'छ', 'ch'), ('జ', 'ज', 'j'), ('ఝ', 'झ', 'jh'), ('ఞ', 'ञ', 'ñ'),
+    ('ట', 'ट', 'ṭ'), ('ఠ', 'ठ', 'ṭh'), ('డ', 'ड', 'ḍ'), ('ఢ', 'ढ', 'ḍh'), ('ణ', 'ण', 'ṇ'),
+    ('త', 'त', 't'), ('థ', 'थ', 'th'), ('ద', 'द', 'd'), ('ధ', 'ध', 'dh'), ('న', 'न', 'n'),
+    ('ప', 'प', 'p'), ('ఫ', 'फ', 'ph'), ('బ', 'ब', 'b'), ('భ', 'भ', 'bh'), ('మ', 'म', 'm'),
+    ('య', 'य', 'y'), ('ర', 'र', 'r'), ('ల', 'ल', 'l'), ('వ', 'व', 'v'),
+    ('శ', 'श', 'ś'), ('ష', 'ष', 'ṣ'), ('స', 'स', 's'), ('హ', 'ह', 'h'),
+    ('ళ', 'ळ', 'ḻ'), ('ఱ', 'ऱ', 'ṟ'), ('ఴ', 'ऴ', 'l̤'),
+]
+
+OTHER = [
+    ('ం', 'ं', 'ṃ'), ('ః', 'ः', 'ḥ'), ('ఁ', 'ँ', '~'), ('ఽ', 'ऽ', "'"),
+    ('।', '।', '|'), ('॥', '॥', '||'),
+] + [(chr(0x0C66 + d), chr(0x0966 + d), str(d)) for d in range(10)]
+
+ROWS = VOWELS + VOWEL_SIGNS + [VIRAMA] + CONSONANTS + OTHER
+COLUMN = {DEVANAGARI: 1, IAST: 2}
+
+# sequences handled before the per-character table
+REWRITES = {
+    DEVANAGARI: [('ౝ', 'న్'), ('ఓం', 'ॐ')],
+    IAST: [('ౝ', 'న్')],
+}
+
+# a consonant with no vowel sign or virama after it carries an inherent 'a';
+# inserting అ (which maps to 'a') lets the table do the rest
+_INHERENT_A = re.compile('([%s])(?![%s])' % (
+    ''.join(row[0] for row in CONSONANTS),
+    ''.join(row[0] for row in VOWEL_SIGNS) + VIRAMA[0],
+))
+
+# joins batch items; it is not in any table, so it passes through and ends a syllable
+_SEPARATOR = '\x00'
+
+
+def _table(target):
+    column = COLUMN[target]
+    return str.maketrans({row[0]: row[column] for row in ROWS})
+
+
+_TABLES = {target: _table(target) for target in COLUMN}
+
+
+def _check(source, target):
+    if source != TELUGU or target not in COLUMN:
+        raise ValueError(f"unsupported transliteration {source} -> {target}")
+
+
+def _convert(text, target):
+    for old, new in REWRITES[target]:
+        text = text.replace(old, new)
+    if target == IAST:
+        text = _INHERENT_A.sub(r'\1అ', text)
+    return text.translate(_TABLES[target])
+
+
+# target -> {text: converted}; dropped wholesale when it outgrows CACHE_SIZE
+_memo = {target: {} for target in COLUMN}
+
+
+def _remember(memo, texts, converted):
+    if len(memo) + len(texts) > CACHE_SIZE:
+        memo.clear()
+    memo.update(zip(texts, converted))
+
+
+def transliterate(text, source=TELUGU, target=IAST):
+    """convert one string; repeated strings come from a memo cache"""
+    _check(source, target)
+    if not text:
+        return text
+    memo = _memo[target]
+    out = memo.get(text)
+    if out is None:
+        out = _convert(text, target)
+        _remember(memo, [text], [out])
+    return out
+
+
+def transliterate_batch(texts, source=TELUGU, target=IAST):
+    """convert many strings, running the tables once over all cache misses"""
+    _check(source, target)
+    texts = list(texts)
+    memo = _memo[target]
+    results = {}
+    missing = []
+    for text in dict.fromkeys(texts):
+        if not text:
+            results[text] = text
+        elif text in memo:
+            results[text] = memo[text]
+        else:
+            missing.append(text)
+
+    if missing:
+        if any(_SEPARATOR in t for t in missing):
+            converted = [_convert(t, target) for t in missing]
+        else:
+            converted = _convert(_SEPARATOR.join(missing), target).split(_SEPARATOR)
+        results.update(zip(missing, converted))
+        _remember(memo, missing, converted)
+    return [results[t] for t in texts]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Transliterate Telugu text read from stdin or files.")
+    parser.add_argument("files", nargs="*", help="Files to convert (default: stdin)")
+    parser.add_argument("--to", choices=sorted(COLUMN), default=IAST, help="Target script")
+    args = parser.parse_args()
+
+    if not args.files:
+        sys.stdout.write(transliterate(sys.stdin.read(), TELUGU, args.to))
+        return
+    for path in args.files:
+        with open(path, 'r', encoding='utf-8') as f:
+            sys.stdout.write(transliterate(f.read(), TELUGU, args.to))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+// Client for the sharded dictionary index built by scripts/build_search_index.py.
+// normalize/tokenize must stay in step with the Python side.
+
+export const INDEX_URL = '/dictionary-index';
+
+export type EntryStub = [id: string, term: string, devanagari: string, iast: string];
+
+export type SearchHit = {
+  id: string;
+  term: string;
+  devanagari: string;
+  iast: string;
+  score: number;
+};
+
+type IndexMeta = {
+  version: number;
+  entries: number;
+  minToken: number;
+  maxToken: number;
+  stopwords: string[];
+  fieldWeights: Record<string, number>;
+  docsPerFile: number;
+  shards: string[];
+};
+
+// postings: [doc, score, doc, score, ...]; doc's stub is entry doc % docsPerFile of docs file doc / docsPerFile
+type Shard = {
+  tokens: Record<string, number[]>;
+};
+
+const WORD = /[\p{L}\p{N}][\p{L}\p{N}_\u0300-\u036f\u0900-\u097f\u0c00-\u0c7f\u200c\u200d]*/gu;
+const TELUGU_TO_DEVANAGARI = 0x0c00 - 0x0900;
+
+// lowercase, drop Latin diacritics and zero-width joiners, map Telugu onto Devanagari
+export const normalize = (text: string) => {
+  let out = '';
+  for (const c of text.toLowerCase().normalize('NFD')) {
+    const cp = c.codePointAt(0)!;
+    if ((cp >= 0x0300 && cp <= 0x036f) || cp === 0x200c || cp === 0x200d) continue;
+    out += cp >= 0x0c00 && cp <= 0x0c7f ? String.fromCodePoint(cp - TELUGU_TO_DEVANAGARI) : c;
+  }
+  return out.normalize('NFC');
+};
+
+export const tokenize = (text: string, meta: IndexMeta) => {
+  const stopwords = new Set(meta.stopwords);
+  const tokens: string[] = [];
+  for (const match of text.matchAll(WORD)) {
+    const token = [...normalize(match[0])].slice(0, meta.maxToken).join('');
+    if ([...token].length >= meta.minToken && !stopwords.has(token)) tokens.push(token);
+  }
+  return tokens;
+};
+
+// indices of the shards that can hold a token starting with word
+const shardsFor = (word: string, bounds: string[]) => {
+  let lo = 0;
+  let hi = bounds.length;
+  while (lo < hi) {
+    const mid = (lo + hi) >> 1;
+    if (word < bounds[mid]) hi = mid;
+    else lo = mid + 1;
+  }
+  let i = Math.max(lo - 1, 0);
+  const found = [i];
+  while (i + 1 < bounds.length && bounds[i + 1].startsWith(word)) found.push(++i);
+  return found;
+};
+
+const shardUrl = (i: number) => `${INDEX_URL}/${String(i).padStart(4, '0')}.json`;
+
+let metaPromise: Promise<IndexMeta> | undefined;
+const shardCache = new Map<number, Promise<Shard>>();
+const docsCache = new Map<number, Promise<EntryStub[]>>();
+
+const loadMeta = () =>
+  (metaPromise ??= fetch(`${INDEX_URL}/meta.json`).then((r) => r.json() as Promise<IndexMeta>));
+
+const loadDocs = (i: number) => {
+  let docs = docsCache.get(i);
+  if (!docs) {
+    docs = fetch(`${INDEX_URL}/docs/${String(i).padStart(4, '0')}.json`).then(
+      (r) => r.json() as Promise<EntryStub[]>
+    );
+    docsCache.set(i, docs);
+  }
+  return docs;
+};
+
+const loadShard = (i: number) => {
+  let shard = shardCache.get(i);
+  if (!shard) {
+    shard = fetch(shardUrl(i)).then((r) => r.json() as Promise<Shard>);
+    shardCache.set(i, shard);
+  }
+  return shard;
+};
+
+// every query word must match a token exactly or as a prefix; exact matches count double.
+// Unlike a substring filter, "dhyasa" does not find adhyāsa (see build_search_index.py).
+export const searchDictionary = async (query: string, limit = 50): Promise<SearchHit[]> => {
+  const meta = await loadMeta();
+  const words = tokenize(query, meta);
+  if (!words.length) return [];
+
+  let scores: Map<number, number> | undefined;
+
+  for (const word of words) {
+    const shards = await Promise.all(shardsFor(word, meta.shards).map(loadShard));
+    const wordScores = new Map<number, number>();
+    for (const shard of shards) {
+      for (const [token, flat] of Object.entries(shard.tokens)) {
+        if (!token.startsWith(word)) continue;
+        const boost = token === word ? 2 : 1;
+        for (let k = 0; k < flat.length; k += 2) {
+          const doc = flat[k];
+          wordScores.set(doc, (wordScores.get(doc) || 0) + flat[k + 1] * boost);
+        }
+      }
+    }
+    if (!scores) {
+      scores = wordScores;
+    } else {
+      const prev: Map<number, number> = scores;
+      scores = new Map(
+        [...wordScores].filter(([doc]) => prev.has(doc)).map(([doc, s]) => [doc, prev.get(doc)! + s])
+      );
+    }
+  }
+
+  const ranked = [...(scores || [])].sort((a, b) => b[1] - a[1] || a[0] - b[0]).slice(0, limit);
+  // only the stub files the top hits fall in
+  const per = meta.docsPerFile;
+  const files = [...new Set(ranked.map(([doc]) => Math.floor(doc / per)))];
+  const loaded = new Map(await Promise.all(files.map(async (i) => [i, await loadDocs(i)] as const)));
+  return ranked.map(([doc, score]) => {
+    const [id, term, devanagari, iast] = loaded.get(Math.floor(doc / per))![doc % per];
+    return { id, term, devanagari, iast, score };
+  });
+};
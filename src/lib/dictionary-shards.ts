@@ -0,0 +1,102 @@
+// Loader for the content-hashed dictionary shards written by scripts/dictionary_shards.py.
+// Shard files never change once written, so they can be cached forever; only
+// manifest.json needs revalidating.
+
+export const SHARDS_URL = '/dictionary-data';
+
+export type DefinitionField = 'english' | 'hindi' | 'telugu';
+export type ShardGroup = 'head' | DefinitionField;
+
+export type DictionaryEntry = {
+  id: string;
+  term: string;
+  devanagari: string;
+  iast: string;
+  source: string;
+  seeAlso?: string[];
+} & Partial<Record<DefinitionField, string>>;
+
+type Manifest = {
+  version: number;
+  entries: number;
+  groups: ShardGroup[];
+  sources: Record<string, { name: string; description?: string; sourceUrl?: string }>;
+  shards: Record<string, Partial<Record<ShardGroup, string>>>;
+};
+
+const DEFINITION_FIELDS: DefinitionField[] = ['english', 'hindi', 'telugu'];
+const OTHER_INITIAL = '_';
+
+// first letters of the IAST, a-z only with diacritics dropped (same as folded_prefix)
+export const foldedPrefix = (iast: string, length = 2) => {
+  let letters = '';
+  for (const c of (iast || '').toLowerCase().normalize('NFD')) {
+    if (c >= 'a' && c <= 'z') {
+      letters += c;
+      if (letters.length === length) break;
+    } else if (/\p{M}/u.test(c)) {
+      continue;
+    } else if (letters || /[\p{L}\p{N}]/u.test(c)) {
+      break;
+    }
+  }
+  return letters || OTHER_INITIAL;
+};
+
+let manifestPromise: Promise<Manifest> | undefined;
+const shardCache = new Map<string, Promise<any>>();
+
+export const loadManifest = () =>
+  (manifestPromise ??= fetch(`${SHARDS_URL}/manifest.json`, { cache: 'no-cache' }).then(
+    (r) => r.json() as Promise<Manifest>
+  ));
+
+const loadShard = (name: string) => {
+  let shard = shardCache.get(name);
+  if (!shard) {
+    shard = fetch(`${SHARDS_URL}/${name}`).then((r) => r.json());
+    shardCache.set(name, shard);
+  }
+  return shard;
+};
+
+// the manifest initial an entry with this IAST is filed under
+export const initialFor = (iast: string, manifest: Manifest) => {
+  const prefix = foldedPrefix(iast);
+  return prefix in manifest.shards ? prefix : prefix.slice(0, 1);
+};
+
+// all entries under one initial, with only the requested definition groups filled in
+export const loadInitial = async (
+  initial: string,
+  groups: DefinitionField[] = []
+): Promise<DictionaryEntry[]> => {
+  const manifest = await loadManifest();
+  const files = manifest.shards[initial];
+  if (!files?.head) return [];
+
+  const [heads, ...definitions] = await Promise.all([
+    loadShard(files.head),
+    ...groups.map((group) => (files[group] ? loadShard(files[group]!) : Promise.resolve({}))),
+  ]);
+
+  return (heads as DictionaryEntry[]).map((head) => {
+    const entry = { ...head };
+    groups.forEach((group, i) => {
+      const text = (definitions[i] as Record<string, string>)[head.id];
+      if (text) entry[group] = text;
+    });
+    return entry;
+  });
+};
+
+// one entry by id; iast (e.g. from a search hit) says which shard to read
+export const loadEntry = async (
+  id: string,
+  iast: string,
+  groups: DefinitionField[] = DEFINITION_FIELDS
+) => {
+  const manifest = await loadManifest();
+  const entries = await loadInitial(initialFor(iast, manifest), groups);
+  return entries.find((entry) => entry.id === id);
+};